@@ -0,0 +1,6 @@
+"""
+Optional machinery for running quine_ast_liv evolution at scale.
+
+The quine itself stays a single self-reproducing file; these modules are imported lazily by
+its command line modes and operate on the quine module passed in as `host`.
+"""
@@ -0,0 +1,253 @@
+"""
+Mutation of the compiled evolved_function instead of its AST.
+
+Changing a numeric constant or swapping + - * / needs neither a new tree nor a compile: the
+LOAD_CONST argument is pointed at another entry of co_consts, or the BINARY_OP argument is
+rewritten, with code.replace(). An edit is only made at an instruction whose source position
+(co_positions) identifies exactly one constant or BinOp of the tree the code was compiled
+from, so every edit can be replayed on that tree later: a child made this way is a
+DeferredTree, and its module is only built when something needs the tree or its source,
+such as writing a generation to disk. Structural edits stay on the AST path.
+"""
+import ast
+import dis
+import random
+import weakref
+from collections import Counter, namedtuple
+
+from .tuning import DELTAS
+
+# The operators mutate_ast swaps between, by their BINARY_OP argument.
+_NB_OPS = [name for name, _ in getattr(dis, '_nb_ops', ())]
+SWAPPABLE_OPS = {_NB_OPS.index(name): op for name, op in (('NB_ADD', ast.Add), ('NB_SUBTRACT', ast.Sub),
+                                                          ('NB_MULTIPLY', ast.Mult), ('NB_TRUE_DIVIDE', ast.Div))
+                 if name in _NB_OPS}
+OP_ARGS = {op: arg for arg, op in SWAPPABLE_OPS.items()}
+CONST_OPS = ('LOAD_CONST', 'RETURN_CONST')
+# Instruction arguments above this need an EXTENDED_ARG prefix, which an edit never adds.
+MAX_ARG = 255
+
+# path: co_consts indices leading from the module code to the code object holding the instruction
+Site = namedtuple('Site', ['path', 'offset', 'kind', 'position'])
+Edit = namedtuple('Edit', ['kind', 'value'])
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _slot_value(node):
+    """The number a constant slot loads: a numeric Constant, or -Constant, which the compiler folds."""
+    if isinstance(node, ast.Constant) and _is_number(node.value):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+            and _is_number(node.operand.value):
+        return -node.operand.value
+    return None
+
+
+def _position(node):
+    return (getattr(node, 'lineno', None), getattr(node, 'end_lineno', None),
+            getattr(node, 'col_offset', None), getattr(node, 'end_col_offset', None))
+
+
+def _same(a, b):
+    return type(a) is type(b) and a == b and repr(a) == repr(b)
+
+
+def tree_sites(function_node):
+    """
+    Return ({position: [(holder, field, index)]}, {position: [BinOp]}) for the constant slots and
+    swappable BinOps of a definition; index is None for a node held directly by a field.
+    """
+    constants = {}
+    binops = {}
+    stack = [function_node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.BinOp) and type(node.op) in OP_ARGS:
+            binops.setdefault(_position(node), []).append(node)
+        for field, value in ast.iter_fields(node):
+            items = enumerate(value) if isinstance(value, list) else [(None, value)]
+            for index, child in items:
+                if not isinstance(child, ast.AST):
+                    continue
+                if _slot_value(child) is not None:
+                    constants.setdefault(_position(child), []).append((node, field, index))
+                else:
+                    stack.append(child)
+    return constants, binops
+
+
+def _holder_get(holder, field, index):
+    value = getattr(holder, field)
+    return value if index is None else value[index]
+
+
+def _holder_set(holder, field, index, node):
+    if index is None:
+        setattr(holder, field, node)
+    else:
+        getattr(holder, field)[index] = node
+
+
+def _code_objects(code, path=()):
+    yield path, code
+    for i, const in enumerate(code.co_consts):
+        if hasattr(const, 'co_code'):
+            yield from _code_objects(const, path + (i,))
+
+
+def find_sites(module_code, function_node):
+    """
+    Return the editable sites of a compiled definition: LOAD_CONST of a number and BINARY_OP of
+    a swappable operator whose position matches one constant or BinOp of function_node, the
+    tree module_code was compiled from, and no other instruction of the same kind.
+    """
+    constants, binops = tree_sites(function_node)
+    candidates = []
+    for path, code in _code_objects(module_code):
+        for instruction in dis.get_instructions(code):
+            positions = instruction.positions
+            if positions is None or instruction.arg is None or instruction.arg > MAX_ARG:
+                continue
+            position = tuple(positions)
+            if instruction.opname in CONST_OPS and _is_number(instruction.argval):
+                slots = constants.get(position, ())
+                if len(slots) == 1 and _same(_slot_value(_holder_get(*slots[0])), instruction.argval):
+                    candidates.append(Site(path, instruction.offset, 'const', position))
+            elif instruction.opname == 'BINARY_OP' and instruction.arg in SWAPPABLE_OPS:
+                nodes = binops.get(position, ())
+                if len(nodes) == 1 and OP_ARGS.get(type(nodes[0].op)) == instruction.arg:
+                    candidates.append(Site(path, instruction.offset, 'op', position))
+    # two instructions of a kind at one position cannot be told apart in the tree
+    seen = Counter((site.kind, site.position) for site in candidates)
+    return tuple(site for site in candidates if seen[site.kind, site.position] == 1)
+
+
+def _nested(code, path):
+    for i in path:
+        code = code.co_consts[i]
+    return code
+
+
+def edit_code(code, site, value):
+    """
+    Return a copy of module code with one site changed: a 'const' site loads value, an 'op'
+    site applies the operator class value. Raises ValueError if the edit cannot be made or
+    does not read back as intended.
+    """
+    if site.path:
+        consts = list(code.co_consts)
+        consts[site.path[0]] = edit_code(consts[site.path[0]], site._replace(path=site.path[1:]), value)
+        return code.replace(co_consts=tuple(consts))
+    co_code = bytearray(code.co_code)
+    consts = code.co_consts
+    if site.kind == 'const':
+        arg = next((i for i, const in enumerate(consts) if _same(const, value)), None)
+        if arg is None:
+            arg = len(consts)
+            consts += (value,)
+        if arg > MAX_ARG:
+            raise ValueError(f'no room for another constant in {code.co_name}')
+    else:
+        arg = OP_ARGS[value]
+    co_code[site.offset + 1] = arg
+    edited = code.replace(co_code=bytes(co_code), co_consts=consts)
+    instruction = next(i for i in dis.get_instructions(edited) if i.offset == site.offset)
+    expected = instruction.argval if site.kind == 'const' else SWAPPABLE_OPS.get(instruction.arg)
+    if len(edited.co_code) != len(code.co_code) or not _same(expected, value):
+        raise ValueError(f'editing {code.co_name} at offset {site.offset} did not take')
+    return edited
+
+
+def apply_edits(function_node, edits):
+    """Replay {position: Edit} on a definition compiled at the same positions, in place."""
+    constants, binops = tree_sites(function_node)
+    for position, edit in edits.items():
+        if edit.kind == 'op':
+            binops[position][0].op = edit.value()
+            continue
+        holder, field, index = constants[position][0]
+        old = _holder_get(holder, field, index)
+        value = edit.value
+        if _is_number(value) and repr(value).startswith('-'):
+            # a bare negative Constant would unparse as -2 ** 3 and change meaning
+            new = ast.UnaryOp(op=ast.USub(), operand=ast.copy_location(ast.Constant(value=-value), old))
+        else:
+            new = ast.Constant(value=value)
+        _holder_set(holder, field, index, ast.copy_location(new, old))
+    return function_node
+
+
+class CodeMutator:
+    """
+    Makes cheap edits to compiled definitions and remembers the editable sites of every code
+    object it has seen or produced; edits keep the layout of the code, so a child inherits the
+    sites of its parent without looking at a tree again.
+    """
+
+    def __init__(self):
+        self._sites = weakref.WeakKeyDictionary()
+
+    def mutate(self, module_code, function_node, count=1):
+        """
+        Return (code, {position: Edit}) with count sites of module_code changed the way
+        mutate_ast would change them, or None if it has no editable site.
+
+        :param function_node: The definition module_code was compiled from, or a function
+            returning it; only consulted for code this mutator has not seen before.
+        """
+        sites = self._sites.get(module_code)
+        if sites is None:
+            sites = find_sites(module_code, function_node() if callable(function_node) else function_node)
+            self._sites[module_code] = sites
+        if not sites:
+            return None
+        code = module_code
+        edits = {}
+        for site in random.sample(sites, min(count, len(sites))):
+            target = _nested(code, site.path)
+            arg = target.co_code[site.offset + 1]
+            if site.kind == 'const':
+                value = target.co_consts[arg] + random.choice(DELTAS)
+            else:
+                value = random.choice([op for op in OP_ARGS if op is not SWAPPABLE_OPS[arg]])
+            code = edit_code(code, site, value)
+            edits[site.position] = Edit(site.kind, value)
+        self._sites[code] = sites
+        return code, edits
+
+
+class DeferredTree:
+    """
+    A generation known by its compiled definition only. Calling it builds its module: a copy of
+    its nearest built ancestor, base, with every edit made since replayed on it.
+    """
+    __slots__ = ('host', 'history', 'base', 'edits', 'node_name', 'node_type')
+
+    def __init__(self, host, history, base, edits, node_name, node_type):
+        self.host = host
+        self.history = history
+        self.base = base
+        self.edits = edits
+        self.node_name = node_name
+        self.node_type = node_type
+
+    def base_tree(self):
+        return self.history.load(self.base)
+
+    def __call__(self):
+        tree = self.host.clone_module(self.base_tree(), self.node_name, self.node_type)
+        apply_edits(self.host.find_function_node(tree, self.node_name, self.node_type), self.edits)
+        return tree
+
+
+_mutator = None
+
+
+def get_code_mutator():
+    global _mutator
+    if _mutator is None:
+        _mutator = CodeMutator()
+    return _mutator
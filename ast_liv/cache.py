@@ -0,0 +1,93 @@
+"""
+Structural hashing of evolved_function subtrees and a bounded cache of their Verdicts.
+
+Two mutants that unparse to the same code hash the same regardless of line and column
+attributes, so a repeated tree is never compiled or run twice.
+"""
+import ast
+import hashlib
+import shelve
+from collections import OrderedDict
+
+
+def structural_hash(node):
+    """
+    Return a hex digest of the node's structure, ignoring lineno/col_offset/end_* attributes.
+    """
+    dump = ast.dump(node, annotate_fields=False, include_attributes=False)
+    return hashlib.blake2b(dump.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class VerdictCache:
+    """
+    LRU map from structural hash to Verdict, optionally backed by a shelve file on disk.
+
+    The in-memory part holds at most maxsize entries; with a path every entry is also written
+    to disk, and a memory miss falls back to the shelf before counting as a miss. Evaluation
+    is assumed deterministic: a tree that ran cleanly once is taken to run cleanly again.
+
+    :param maxsize: Maximum number of entries kept in memory.
+    :param path: Optional shelve filename for persisting entries across runs.
+    """
+
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.shelf = shelve.open(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, node):
+        return structural_hash(node)
+
+    def get(self, key):
+        """Return the cached Verdict for key, or None, and count the lookup."""
+        verdict = self.entries.get(key)
+        if verdict is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+        if self.shelf is not None:
+            verdict = self.shelf.get(key)
+            if verdict is not None:
+                self._remember(key, verdict)
+                self.hits += 1
+                self.disk_hits += 1
+                return verdict
+        self.misses += 1
+        return None
+
+    def put(self, key, verdict):
+        self._remember(key, verdict)
+        if self.shelf is not None:
+            self.shelf[key] = verdict
+
+    def _remember(self, key, verdict):
+        self.entries[key] = verdict
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def export(self):
+        """Return the in-memory entries as (key, verdict) pairs, least recently used first."""
+        return list(self.entries.items())
+
+    def restore(self, entries):
+        """Put (key, verdict) pairs from export() back into memory, without counting lookups."""
+        for key, verdict in entries:
+            self._remember(key, verdict)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return (f'cache: {self.hits} hits ({self.disk_hits} from disk), {self.misses} misses, '
+                f'hit rate {self.hit_rate:.1%}, {len(self.entries)} entries in memory')
+
+    def close(self):
+        if self.shelf is not None:
+            self.shelf.close()
+            self.shelf = None
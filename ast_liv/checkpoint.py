@@ -0,0 +1,153 @@
+"""
+Checkpoints of a running evolution, so that a crashed or drained run continues exactly where it
+stopped instead of from its last quine_ast_liv_N.py file.
+
+A checkpoint holds everything the drivers cannot rebuild: the state of `random`, the module the
+run started from, the evolved_function tree of every generation in the lineage, the step and
+mutant counters, the recorded coverage and the in-memory verdict cache. Trees are pickled
+rather than unparsed, because unparsing does not round-trip every tree a mutation can make
+(a negative Constant comes back as a UnaryOp), and a resumed run must draw exactly what the
+interrupted one would have. It is one file:
+
+    header   magic b'ALCK', format version and payload length ('<4sHQ')
+    payload  zlib-compressed pickle of a Checkpoint
+
+It is written to a temporary file and renamed over the previous checkpoint, so a run killed
+mid-write leaves the last complete one in place. Resuming parses the host module only; each
+generation of the lineage is unpickled when it is first needed.
+A checkpoint is unpickled when loaded, so only resume from checkpoints you wrote yourself.
+
+    python quine_ast_liv_0.py --generations 100000 --seed 7 --checkpoint run.ckpt
+    python quine_ast_liv_0.py --generations 100000 --checkpoint run.ckpt --resume
+"""
+import os
+import pickle
+import random
+import struct
+import zlib
+from collections import namedtuple
+
+from .evaluation import with_definition
+
+MAGIC = b'ALCK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHQ')
+
+Checkpoint = namedtuple('Checkpoint', ['seed', 'rng', 'host', 'start_index', 'lineage', 'definitions',
+                                       'records', 'executed', 'counters', 'cache'])
+Checkpoint.__doc__ = """
+:param seed: The seed the run was started with, or None.
+:param rng: random.getstate() at the time of the checkpoint.
+:param host: Source of the module the run started from, generation start_index.
+:param lineage: Generation indices making up the lineage, start_index first.
+:param definitions: {index: pack()ed definition} for every generation of the lineage but the first.
+:param records: GenerationStore record numbers parallel to lineage, or None without a store.
+:param executed: {index: statement numbers that ran} recorded in coverage mode, else empty.
+:param counters: Driver counters such as step and mutants, by name.
+:param cache: VerdictCache.export() of the run's cache, or None without one.
+"""
+
+
+def pack(function_node):
+    """Return the bytes a checkpoint keeps for one definition."""
+    return pickle.dumps(function_node, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack(data):
+    """Return the definition packed by pack()."""
+    return pickle.loads(data)
+
+
+def save_checkpoint(path, checkpoint):
+    """Write a Checkpoint to path, replacing any previous one only once it is complete."""
+    payload = zlib.compress(pickle.dumps(tuple(checkpoint), protocol=pickle.HIGHEST_PROTOCOL), 1)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return len(payload) + HEADER.size
+
+
+def load_checkpoint(path):
+    """Read the Checkpoint saved at path."""
+    with open(path, 'rb') as f:
+        magic, version, length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a checkpoint')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported checkpoint version {version} in {path}')
+        payload = f.read(length)
+    if len(payload) < length:
+        raise ValueError(f'{path} is truncated')
+    return Checkpoint(*pickle.loads(zlib.decompress(payload)))
+
+
+class Checkpointer:
+    """
+    Writes a checkpoint of a driver every `interval` steps, and at the end of the run.
+
+    :param path: File the checkpoint is written to.
+    :param interval: Steps between checkpoints.
+    :param seed: The seed of the run, recorded in every checkpoint.
+    """
+
+    def __init__(self, path, interval=100, seed=None):
+        self.path = path
+        self.interval = interval
+        self.seed = seed
+        self.saved = 0
+
+    pack = staticmethod(pack)
+
+    def due(self, step):
+        return self.interval > 0 and step % self.interval == 0
+
+    def save(self, host_source, start_index, lineage, definitions, records=None, executed=None, counters=None,
+             cache=None):
+        """
+        Write a checkpoint of a driver's state; definitions must cover lineage[1:].
+
+        :param cache: The run's VerdictCache, or None.
+        :return: Size of the checkpoint in bytes.
+        """
+        checkpoint = Checkpoint(self.seed, random.getstate(), host_source, start_index, list(lineage),
+                                {index: definitions[index] for index in lineage[1:]},
+                                None if records is None else list(records),
+                                {index: lines for index, lines in (executed or {}).items() if index in lineage},
+                                dict(counters or {}), None if cache is None else cache.export())
+        size = save_checkpoint(self.path, checkpoint)
+        self.saved += 1
+        return size
+
+
+def resume(checkpoint, cache=None):
+    """
+    Put the state of `random` and the cache back as they were when checkpoint was written.
+    The driver restores the lineage itself, with definition_loader().
+    """
+    random.setstate(checkpoint.rng)
+    if cache is not None and checkpoint.cache is not None:
+        cache.restore(checkpoint.cache)
+
+
+def definition_loader(checkpoint, host_tree, node_name, node_type, fallback=None):
+    """
+    Return a GenerationCache loader that builds generations of the checkpoint's lineage by
+    splicing their definition into host_tree, sharing every other node with it, and passes
+    other indices to fallback.
+    """
+
+    def load(index):
+        if index == checkpoint.start_index:
+            return host_tree
+        definition = checkpoint.definitions.get(index)
+        if definition is None:
+            if fallback is None:
+                raise KeyError(f'Generation {index} is not in the checkpoint')
+            return fallback(index)
+        return with_definition(host_tree, unpack(definition), node_name, node_type)
+
+    return load
@@ -0,0 +1,324 @@
+"""
+A compact, flat encoding of AST trees, for holding many evolved_function definitions and for
+shipping them between processes.
+
+A CompactTree keeps a tree as a few array.array buffers instead of one Python object per node:
+
+    codes      the tree in prefix order, one int per token: a node is its type code followed
+               by its fields in _fields order; a list field is LIST, its length and its items;
+               a scalar (name, constant, kind) is an index into the pool; None is NONE
+    positions  lineno, col_offset, end_lineno, end_col_offset of every node, in prefix order
+               (UNSET for nodes or attributes that have none)
+    starts     offset in codes of every node, in prefix order
+    ends       offset in codes just past every node's subtree
+    pool       the distinct scalars of the tree, in first-use order
+
+Node n is codes[starts[n]:ends[n]], so a subtree is a slice.
+Conversion to and from `ast` is lossless, positions included, and walks the tree with an
+explicit stack, so deep trees do not raise RecursionError. to_bytes() is a single buffer that
+from_bytes() reads back, copying it or, with copy=False, viewing it in place.
+
+Type codes index NODE_TYPES, which is built from the running interpreter's `ast` module, so
+encodings are only exchanged between processes of the same Python version.
+
+CompactLineage keeps the definitions of a lineage as to_bytes() buffers for the drivers'
+--compact mode. Trees are stored this way, not mutated: the drivers' mutations draw new
+subtrees from the quine's ast generators, so they decode a parent and mutate that.
+"""
+import ast
+import marshal
+import struct
+from array import array
+
+from .evaluation import with_definition
+
+
+def _node_classes(cls=ast.AST):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _node_classes(sub)
+
+
+NODE_TYPES = tuple(sorted(set(_node_classes()), key=lambda cls: cls.__name__))
+NODE_CODES = {cls: code for code, cls in enumerate(NODE_TYPES)}
+
+NONE = -1
+LIST = -2
+# a field the node does not have set at all
+MISSING = -3
+# pool index i is stored as POOL - i
+POOL = -4
+# a position attribute that is None, and one that is not set (always, for nodes without positions)
+UNSET = -1
+NO_ATTRIBUTE = -2
+ATTRIBUTES = ('lineno', 'col_offset', 'end_lineno', 'end_col_offset')
+
+MAGIC = b'ALCT'
+FORMAT_VERSION = 1
+# magic, version, tokens, nodes, pool bytes, typecodes of codes, positions, starts and ends
+HEADER = struct.Struct('<4sHIII4s2x')
+TYPECODES = ('b', 'h', 'i')
+
+_MISSING = object()
+# code, fields in reverse and whether it has positions, by node class
+_ENCODING = {cls: (code, cls._fields[::-1], bool(cls._attributes)) for code, cls in enumerate(NODE_TYPES)}
+_NO_POSITIONS = (NO_ATTRIBUTE,) * 4
+_MISSINGS = (_MISSING,) * max(len(cls._fields) for cls in NODE_TYPES)
+
+
+class _Close(int):
+    """Marks, on the encoder's stack, the end of the subtree of the node numbered with its value."""
+
+
+class CompactTree:
+    """
+    One AST tree in flat form; build it with CompactTree.from_ast() or CompactTree.from_bytes().
+
+    :param codes: Token array (array('i') or an int memoryview).
+    :param positions: Four ints per node.
+    :param starts: Offset of every node in codes.
+    :param ends: Offset just past every node's subtree.
+    :param pool: List of the scalars the tokens refer to.
+    """
+
+    __slots__ = ('codes', 'positions', 'starts', 'ends', 'pool')
+
+    def __init__(self, codes, positions, starts, ends, pool):
+        self.codes = codes
+        self.positions = positions
+        self.starts = starts
+        self.ends = ends
+        self.pool = pool
+
+    def __len__(self):
+        """Number of nodes."""
+        return len(self.starts)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays, not counting the pool."""
+        return sum(len(buffer) * buffer.itemsize for buffer in (self.codes, self.positions, self.starts, self.ends))
+
+    @classmethod
+    def from_ast(cls, node):
+        """Encode the tree rooted at node."""
+        codes = array('i')
+        positions = array('i')
+        starts = array('i')
+        ends = array('i')
+        pool = []
+        pooled = {}
+        stack = [node]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            value = pop()
+            value_class = value.__class__
+            encoding = _ENCODING.get(value_class)
+            if encoding is not None:
+                code, fields, located = encoding
+                number = len(starts)
+                starts.append(len(codes))
+                ends.append(0)
+                codes.append(code)
+                # ast nodes keep their fields and positions in their __dict__
+                attributes = value.__dict__
+                if located:
+                    position = tuple(map(attributes.get, ATTRIBUTES, _MISSINGS))
+                    if None in position or _MISSING in position:
+                        position = [UNSET if p is None else NO_ATTRIBUTE if p is _MISSING else p for p in position]
+                    positions.extend(position)
+                else:
+                    positions.extend(_NO_POSITIONS)
+                push(_Close(number))
+                stack.extend(map(attributes.get, fields, _MISSINGS))
+            elif value_class is _Close:
+                ends[value] = len(codes)
+            elif value_class is list:
+                codes.append(LIST)
+                codes.append(len(value))
+                stack.extend(reversed(value))
+            elif value is None:
+                codes.append(NONE)
+            elif value is _MISSING:
+                codes.append(MISSING)
+            else:
+                # 0.0 == -0.0 and 1 == True, but they must stay distinct constants
+                key = (value_class, repr(value) if value_class is float or value_class is complex else value)
+                index = pooled.get(key)
+                if index is None:
+                    index = pooled[key] = len(pool)
+                    pool.append(value)
+                codes.append(POOL - index)
+        return cls(codes, positions, starts, ends, pool)
+
+    def to_ast(self, number=0):
+        """Decode node number (the root by default) and everything below it into new ast nodes."""
+        codes = self.codes
+        positions = self.positions
+        pool = self.pool
+        offset = self.starts[number]
+        node_number = number
+        result = []
+        # [node, fields, next field] or [list, length] frames of containers being filled
+        frames = [[result, 1]]
+        while frames:
+            token = codes[offset]
+            offset += 1
+            if token >= 0:
+                cls = NODE_TYPES[token]
+                value = cls()
+                p = node_number * 4
+                node_number += 1
+                if cls._attributes:
+                    lineno, col_offset, end_lineno, end_col_offset = positions[p:p + 4]
+                    if min(lineno, col_offset, end_lineno, end_col_offset) >= 0:
+                        value.lineno = lineno
+                        value.col_offset = col_offset
+                        value.end_lineno = end_lineno
+                        value.end_col_offset = end_col_offset
+                    else:
+                        for name, position in zip(ATTRIBUTES, (lineno, col_offset, end_lineno, end_col_offset)):
+                            if position != NO_ATTRIBUTE:
+                                setattr(value, name, None if position == UNSET else position)
+                if cls._fields:
+                    frames.append([value, cls._fields, 0])
+                    continue
+            elif token == LIST:
+                length = codes[offset]
+                offset += 1
+                value = []
+                if length:
+                    frames.append([value, length])
+                    continue
+            elif token == NONE:
+                value = None
+            elif token == MISSING:
+                value = _MISSING
+            else:
+                value = pool[POOL - token]
+            # hand the finished value to its container, and every container it completes to its own
+            while frames:
+                frame = frames[-1]
+                if len(frame) == 3:
+                    if value is not _MISSING:
+                        setattr(frame[0], frame[1][frame[2]], value)
+                    frame[2] += 1
+                    if frame[2] < len(frame[1]):
+                        break
+                else:
+                    frame[0].append(value)
+                    if len(frame[0]) < frame[1]:
+                        break
+                frames.pop()
+                value = frame[0]
+        return result[0]
+
+    def to_bytes(self, narrow=True):
+        """
+        Return the tree as one buffer for from_bytes(). With narrow, each array is written with
+        the narrowest of the typecodes b, h and i its values fit, which makes the buffer about a
+        third smaller but has to convert every value; without, the arrays are written as they
+        are. Arrays are padded to a multiple of four bytes.
+        """
+        parts = []
+        typecodes = ''
+        for buffer in (self.codes, self.positions, self.starts, self.ends):
+            typecode = _narrowest(buffer) if narrow else 'i'
+            if not (isinstance(buffer, array) and buffer.typecode == typecode):
+                buffer = array(typecode, buffer)
+            data = buffer.tobytes()
+            parts.append(data + bytes(-len(data) % 4))
+            typecodes += typecode
+        pool = marshal.dumps(tuple(self.pool))
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, len(self.codes), len(self.starts), len(pool), typecodes.encode())
+        return b''.join([header] + parts + [pool])
+
+    @classmethod
+    def from_bytes(cls, data, copy=True):
+        """
+        Read a tree written by to_bytes(), from bytes or any buffer such as a mmap. With
+        copy=False the arrays are memoryviews of data itself, which must then stay alive and
+        unchanged; decoding and the queries work on them as well.
+        """
+        view = memoryview(data).cast('B')
+        magic, version, tokens, nodes, pool_size, typecodes = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Not a compact tree')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported compact tree version {version}')
+        offset = HEADER.size
+        buffers = []
+        for length, typecode in zip((tokens, nodes * 4, nodes, nodes), typecodes.decode()):
+            size = length * array(typecode).itemsize
+            part = view[offset:offset + size].cast(typecode)
+            buffers.append(array('i', part) if copy else part)
+            offset += size + -size % 4
+        pool = list(marshal.loads(view[offset:offset + pool_size]))
+        return cls(*buffers, pool)
+
+    def node_type(self, number):
+        return NODE_TYPES[self.codes[self.starts[number]]]
+
+    def nodes_of(self, node_class):
+        """Return the numbers of the nodes that are instances of node_class, in prefix order."""
+        codes = {code for code, cls in enumerate(NODE_TYPES) if issubclass(cls, node_class)}
+        tokens = self.codes
+        return [number for number, start in enumerate(self.starts) if tokens[start] in codes]
+
+
+def _narrowest(buffer):
+    low, high = (min(buffer), max(buffer)) if len(buffer) else (0, 0)
+    for typecode in TYPECODES:
+        bits = array(typecode).itemsize * 8 - 1
+        if -2 ** bits <= low and high < 2 ** bits:
+            return typecode
+    return 'i'
+
+
+class CompactLineage:
+    """
+    The node_name definitions of a lineage kept as narrowed CompactTree.to_bytes() buffers, and a
+    GenerationCache loader over them: a generation that is not in memory is rebuilt by decoding
+    its buffer in place and splicing the definition into host_tree, sharing every other node
+    with it. Generation start_index is host_tree itself; indices never added go to fallback.
+    """
+
+    def __init__(self, host_tree, start_index, node_name, node_type, fallback=None):
+        self.host_tree = host_tree
+        self.start_index = start_index
+        self.node_name = node_name
+        self.node_type = node_type
+        self.fallback = fallback
+        self.trees = {}
+
+    def __len__(self):
+        return len(self.trees)
+
+    def __contains__(self, index):
+        return index in self.trees
+
+    @property
+    def nbytes(self):
+        """Bytes held by the buffers, pools included."""
+        return sum(len(data) for data in self.trees.values())
+
+    def add(self, index, function_node):
+        self.trees[index] = CompactTree.from_ast(function_node).to_bytes()
+
+    def discard(self, index):
+        self.trees.pop(index, None)
+
+    def __call__(self, index):
+        if index == self.start_index:
+            return self.host_tree
+        data = self.trees.get(index)
+        if data is None:
+            if self.fallback is None:
+                raise KeyError(f'Generation {index} is not in the compact lineage')
+            return self.fallback(index)
+        function_node = CompactTree.from_bytes(data, copy=False).to_ast()
+        return with_definition(self.host_tree, function_node, self.node_name, self.node_type)
+
+    def summary(self):
+        return f'compact lineage: {len(self.trees)} definitions in {self.nbytes} bytes'
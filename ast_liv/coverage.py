@@ -0,0 +1,142 @@
+"""
+Statement coverage of evolved_function, for steering mutations toward code that actually runs.
+
+Before a candidate is compiled, number_statements() gives every statement of its definition a
+line number of its own, and every other node the number of the statement it belongs to, so an
+executed line is an executed statement and `node.lineno in executed` tells whether any node
+ran. record_lines() then calls the compiled function and collects the lines it executed: with
+sys.monitoring LINE events limited to its code objects on Python 3.12+, each location disabled
+after its first hit, and with a sys.settrace tracer that ignores every other frame before that.
+
+Mutants inherit the numbers of the nodes they were copied from, and generated subtrees those
+of the node they replace or are attached to, so the parent's coverage applies to the child
+until the child has been run and numbered itself.
+"""
+import ast
+import sys
+import types
+
+# Tool id used with sys.monitoring; COVERAGE_ID is reserved for coverage tools.
+TOOL_ID = 1
+
+
+def number_statements(function_node):
+    """
+    Renumber the lines of a definition in place: the definition itself is line 1 and every
+    statement below it gets the next number in source order.
+
+    :return: The number of statements, the definition included.
+    """
+    count = 0
+    stack = [(function_node, None)]
+    while stack:
+        node, line = stack.pop()
+        if isinstance(node, ast.stmt):
+            count += 1
+            line = count
+        if 'lineno' in node._attributes:
+            node.lineno = node.end_lineno = line
+            # a node that spanned several lines may now end before it starts
+            if getattr(node, 'end_col_offset', None) is not None and node.end_col_offset < node.col_offset:
+                node.end_col_offset = node.col_offset
+        # reversed, so that statements are numbered in the order they appear
+        stack.extend((child, line) for child in reversed(list(ast.iter_child_nodes(node))))
+    return count
+
+
+def code_objects(code):
+    """Return code and every code object nested in it, such as inner functions and lambdas."""
+    found = set()
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        found.add(code)
+        stack.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    return found
+
+
+def _record_monitoring(function, codes, lines):
+    monitoring = sys.monitoring
+    try:
+        monitoring.use_tool_id(TOOL_ID, 'ast_liv')
+    except ValueError:  # another tool, e.g. a coverage run of the tests, holds the id
+        return False
+
+    def on_line(code, line):
+        if code in codes:
+            lines.add(line)
+        return monitoring.DISABLE
+
+    monitoring.register_callback(TOOL_ID, monitoring.events.LINE, on_line)
+    for code in codes:
+        monitoring.set_local_events(TOOL_ID, code, monitoring.events.LINE)
+    try:
+        function()
+    finally:
+        for code in codes:
+            monitoring.set_local_events(TOOL_ID, code, 0)
+        monitoring.register_callback(TOOL_ID, monitoring.events.LINE, None)
+        monitoring.free_tool_id(TOOL_ID)
+        monitoring.restart_events()
+    return True
+
+
+def _record_settrace(function, codes, lines):
+
+    def on_line(frame, event, arg):
+        if event == 'line':
+            lines.add(frame.f_lineno)
+        return on_line
+
+    def on_call(frame, event, arg):
+        return on_line if frame.f_code in codes else None
+
+    previous = sys.gettrace()
+    sys.settrace(on_call)
+    try:
+        function()
+    finally:
+        sys.settrace(previous)
+
+
+def record_lines(function):
+    """
+    Call function and return the set of its lines, and of functions nested in it, that ran.
+    The first line of the definition always counts as executed. Exceptions propagate, after
+    tracing has been switched off again.
+    """
+    codes = code_objects(function.__code__)
+    lines = {function.__code__.co_firstlineno}
+    if not (hasattr(sys, 'monitoring') and _record_monitoring(function, codes, lines)):
+        _record_settrace(function, codes, lines)
+    return lines
+
+
+def site_weight(node, executed, dead_weight):
+    """
+    Relative chance of mutating node: 1 for nodes of statements that ran, or when nothing is
+    known, and dead_weight for the rest.
+    """
+    if executed is None:
+        return 1.0
+    line = getattr(node, 'lineno', None)
+    return 1.0 if line is None or line in executed else dead_weight
+
+
+class CoverageStats:
+    """Statements executed by every generation of a run, for the per-generation report."""
+
+    def __init__(self):
+        self.generations = 0
+        self.statements = 0
+        self.executed = 0
+
+    def add(self, statements, executed):
+        self.generations += 1
+        self.statements += statements
+        self.executed += executed
+        return f'coverage: {executed}/{statements} statements executed'
+
+    def summary(self):
+        ratio = self.executed / self.statements if self.statements else 0.0
+        return f'coverage: {ratio:.1%} of statements executed over {self.generations} generations'
@@ -0,0 +1,69 @@
+"""
+Random decisions for the AST generators, drawn in blocks ahead of use.
+
+random.randint() and random.choice() go through several Python-level calls of `random` for
+every node and child count. BlockDraws fills a block of uniform floats at once and hands them
+out through a C-level iterator; its randint(), choice() and choices() turn one float into an
+index with int(u * n), which is what random.choices() itself does, so trees come out with the
+same distribution (up to the 2**-53 granularity of a float). Blocks are filled by a NumPy
+Generator when NumPy is installed, and from `random` otherwise, in which case random() itself
+stays a direct call; either way every draw derives from the state of `random`, so seeded
+runs stay reproducible.
+
+Install it in the quine with set_draws(BlockDraws(block)), or the --predraw BLOCK flag.
+"""
+import itertools
+import random
+
+try:
+    import numpy
+except ImportError:  # blocks are then filled one float at a time from `random`
+    numpy = None
+
+
+class BlockDraws:
+    """
+    Uniform floats drawn `block` at a time, and the draws the generators make from them.
+
+    :param block: Floats per block.
+    :param source: The random.Random that blocks are derived from; by default the `random`
+        module itself, so random.seed() and random.setstate() govern what is drawn.
+    """
+
+    def __init__(self, block=4096, source=None):
+        self.block = block
+        self.source = source if source is not None else random
+        self.blocks = 0
+        self.reset()
+
+    def reset(self):
+        """Drop the rest of the current block; the next draw starts a new one from source."""
+        # the draws are closures over the float iterator, so a call costs one frame and no lookups
+        next_float = itertools.chain.from_iterable(iter(self._fill, None)).__next__
+
+        def randint(a, b):
+            return a + int(next_float() * (b - a + 1))
+
+        def choice(seq):
+            return seq[int(next_float() * len(seq))]
+
+        def choices(population, k=1):
+            n = len(population)
+            return [population[int(next_float() * n)] for _ in range(k)]
+
+        def uniform(a, b):
+            return a + (b - a) * next_float()
+
+        # a float from a block filled one at a time costs more than a direct call
+        self.random = next_float if numpy is not None else self.source.random
+        self.randint = randint
+        self.choice = choice
+        self.choices = choices
+        self.uniform = uniform
+
+    def _fill(self):
+        self.blocks += 1
+        if numpy is not None:
+            generator = numpy.random.Generator(numpy.random.PCG64(self.source.getrandbits(64)))
+            return generator.random(self.block).tolist()
+        return list(itertools.starmap(self.source.random, itertools.repeat((), self.block)))
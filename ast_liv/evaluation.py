@@ -0,0 +1,79 @@
+"""
+Compiling and running one candidate evolved_function, and the Verdict describing the outcome.
+"""
+import ast
+import contextlib
+import io
+import sys
+import time
+from collections import namedtuple
+
+OK = 'ok'
+SYNTAX = 'syntax'
+EXCEPTION = 'exception'
+TIMEOUT = 'timeout'
+MEMORY = 'memory'
+CRASH = 'crash'
+
+# Characters of captured output kept per candidate.
+MAX_OUTPUT = 4096
+
+Verdict = namedtuple('Verdict', ['status', 'error', 'output', 'elapsed', 'coverage'], defaults=[None])
+Verdict.__doc__ = """
+:param status: One of the status constants in this module.
+:param error: Exception type name (or a short reason) for failed candidates, otherwise None.
+:param output: Captured stdout and stderr, truncated to MAX_OUTPUT characters.
+:param elapsed: Wall-clock seconds spent compiling and running the candidate.
+:param coverage: Frozenset of the statement numbers that ran (see ast_liv.coverage), or None
+    when coverage was not recorded.
+"""
+
+
+class CPUTimeExceeded(BaseException):
+    """Raised inside a sandbox worker when the candidate uses up its CPU allowance."""
+
+
+def evaluate_function_source(job):
+    """
+    Compile one candidate definition and call it inside a copy of the host module's globals.
+
+    The host is looked up by module name, so pool and sandbox workers see the same module the
+    parent evolved the candidate from under both fork and spawn.
+
+    :param job: A (host_name, node_name, source) tuple; source holds only the function definition,
+        as text or as an ast.Module.
+    :return: A Verdict.
+    """
+    host_name, node_name, source = job
+    start = time.perf_counter()
+    try:
+        code_object = compile(source, f'<{node_name}>', 'exec')
+    except (SyntaxError, ValueError, TypeError, MemoryError, RecursionError) as e:
+        return Verdict(SYNTAX, type(e).__name__, '', time.perf_counter() - start)
+    namespace = dict(vars(sys.modules[host_name]))
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            exec(code_object, namespace)
+            namespace[node_name]()
+    except MemoryError as e:
+        status, error = MEMORY, type(e).__name__
+    except CPUTimeExceeded as e:
+        status, error = TIMEOUT, 'cpu'
+    except (Exception, SystemExit) as e:
+        status, error = EXCEPTION, type(e).__name__
+    else:
+        status, error = OK, None
+    return Verdict(status, error, output.getvalue()[:MAX_OUTPUT], time.perf_counter() - start)
+
+
+def with_definition(module, function_node, node_name, node_type):
+    """Return a copy of module whose node_name definition is function_node."""
+    body = list(module.body)
+    for i, node in enumerate(body):
+        if isinstance(node, node_type) and node.name == node_name:
+            body[i] = function_node
+            break
+    else:
+        body.append(function_node)
+    return ast.Module(body=body, type_ignores=list(module.type_ignores))
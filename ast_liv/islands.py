@@ -0,0 +1,334 @@
+"""
+Island model: several lineages evolving independently, in separate processes or on separate
+hosts, that send each other their best evolved_function every `interval` generations.
+
+Each island runs run_generations() for interval generations at a time. At every migration
+point it sends the best `migrants` generations of that epoch, chosen by the selection policy,
+to the islands its topology points at, then evaluates whatever has arrived. Migrants that run
+cleanly compete with the island's own head under the same policy (migrants first, so 'first'
+always takes one in), and the winner is where the next epoch starts.
+
+Migrants are plain definition source and travel over a transport:
+
+    QueueTransport  multiprocessing queues, for islands that are processes on one machine
+    TCPTransport    length-prefixed JSON over TCP, for islands on several hosts; localhost
+                    addresses stand in for hosts when testing
+
+A migrant is code that the receiving island runs, so only connect islands you trust, on a
+network you trust. One island of a multi-host run:
+
+    python quine_ast_liv_0.py --generations 1000 --island 1 --island-addresses h0:7400,h1:7400,h2:7400
+"""
+import ast
+import json
+import multiprocessing
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from .evaluation import OK, with_definition
+from .population import SELECTION_POLICIES, Candidate
+
+Migrant = namedtuple('Migrant', ['island', 'generation', 'source'])
+
+HEADER = struct.Struct('>I')
+# Largest message a TCPTransport accepts; a definition is a few KiB.
+MAX_MESSAGE = 16 * 2 ** 20
+
+
+def ring(island, islands):
+    """Send to the next island, wrapping around."""
+    return [(island + 1) % islands] if islands > 1 else []
+
+
+def fully_connected(island, islands):
+    """Send to every other island."""
+    return [other for other in range(islands) if other != island]
+
+
+def random_neighbour(island, islands):
+    """Send to one other island, drawn anew at every migration."""
+    others = fully_connected(island, islands)
+    return [random.choice(others)] if others else []
+
+
+TOPOLOGIES = {
+    'ring': ring,
+    'all': fully_connected,
+    'random': random_neighbour,
+}
+
+
+class QueueTransport:
+    """
+    Migration between processes on one machine: one multiprocessing queue per island, its inbox.
+
+    :param island: This island's number.
+    :param queues: The inbox of every island, indexed by island number.
+    """
+
+    def __init__(self, island, queues):
+        self.island = island
+        self.queues = queues
+
+    def send(self, destination, migrant):
+        self.queues[destination].put(tuple(migrant))
+
+    def receive(self):
+        """Return every migrant that has arrived so far, without waiting for more."""
+        arrived = []
+        while True:
+            try:
+                arrived.append(Migrant(*self.queues[self.island].get_nowait()))
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        # do not hold up exit on migrants an island that already finished will never read
+        for inbox in self.queues:
+            inbox.cancel_join_thread()
+
+
+class TCPTransport:
+    """
+    Migration between hosts: every island listens on its own address and connects to the others
+    when it has something to send. A migrant for an island that cannot be reached is dropped.
+
+    :param island: This island's number.
+    :param addresses: (host, port) of every island, indexed by island number; this island
+        listens on its own entry.
+    :param timeout: Seconds to wait when connecting or sending.
+    """
+
+    def __init__(self, island, addresses, timeout=5.0):
+        self.island = island
+        self.addresses = addresses
+        self.timeout = timeout
+        self.inbox = queue.Queue()
+        self.connections = {}
+        self.server = socket.create_server(tuple(addresses[island]))
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection, connection.makefile('rb') as stream:
+            while True:
+                header = stream.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                (length,) = HEADER.unpack(header)
+                if length > MAX_MESSAGE:
+                    return
+                body = stream.read(length)
+                if len(body) < length:
+                    return
+                try:
+                    message = json.loads(body)
+                    self.inbox.put(Migrant(int(message['island']), int(message['generation']), str(message['source'])))
+                except (ValueError, KeyError, TypeError):
+                    return
+
+    def send(self, destination, migrant):
+        body = json.dumps(migrant._asdict()).encode('utf-8')
+        try:
+            connection = self.connections.get(destination)
+            if connection is None:
+                connection = socket.create_connection(tuple(self.addresses[destination]), self.timeout)
+                self.connections[destination] = connection
+            connection.sendall(HEADER.pack(len(body)) + body)
+        except OSError as e:
+            print(f'Island {self.island}: could not send to island {destination}: {e}')
+            connection = self.connections.pop(destination, None)
+            if connection is not None:
+                connection.close()
+
+    def receive(self):
+        """Return every migrant that has arrived so far, without waiting for more."""
+        arrived = []
+        while True:
+            try:
+                arrived.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        self.server.close()
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+def parse_addresses(text):
+    """Parse 'host:port,host:port,...' into a list of (host, port)."""
+    addresses = []
+    for item in text.split(','):
+        host, _, port = item.strip().rpartition(':')
+        addresses.append((host or 'localhost', int(port)))
+    return addresses
+
+
+def _candidate(host, tree, node_name, node_type, source=None, verdict=None):
+    node = host.find_function_node(tree, node_name, node_type)
+    return Candidate(tree, source, host.tree_size(node), verdict)
+
+
+def _pick(policy, candidates, count):
+    picked = []
+    candidates = list(candidates)
+    while candidates and len(picked) < count:
+        chosen = policy(candidates)
+        candidates.remove(chosen)
+        picked.append(chosen)
+    return picked
+
+
+def run_island(host, island, islands, transport, generations=None, interval=10, migrants=1, topology='ring',
+               selection='first', sandbox=None, cache=None, store=None, seed=None,
+               node_name='evolved_function', node_type=ast.FunctionDef):
+    """
+    Evolve one island in this process, migrating every interval generations.
+
+    :param host: The quine module providing run_generations, check_candidate and friends.
+    :param island: This island's number, from 0 to islands - 1.
+    :param transport: A QueueTransport, a TCPTransport or anything with send(), receive() and close().
+    :param interval: Generations between migrations.
+    :param migrants: Number of generations sent to every neighbour at each migration.
+    :param topology: Name of an entry of TOPOLOGIES.
+    :param selection: Name of the ast_liv.population selection policy used both to pick the
+        migrants to send and to decide whether an arrived one replaces the island's head.
+    :param seed: Optional seed; island i then draws from its own stream derived from it.
+    :return: (generation, source) of the island's final head.
+    """
+    policy = SELECTION_POLICIES[selection]
+    route = TOPOLOGIES[topology]
+    host.seed_random(None if seed is None else f'{seed}:{island}')
+    source = host.base_code
+    index = 0
+    done = 0
+    adopted = 0
+    start_time = time.perf_counter()
+    try:
+        while generations is None or done < generations:
+            steps = interval if generations is None else min(interval, generations - done)
+            history = host.run_generations(steps, source_code=source, start_index=index, sandbox=sandbox,
+                                           cache=cache, store=store, node_name=node_name, node_type=node_type)
+            done += steps
+            index = history.lineage[-1]
+            head = _candidate(host, history.load(index), node_name, node_type)
+            epoch = {generation: _candidate(host, history.load(generation), node_name, node_type)
+                     for generation in history.lineage[1:]} or {index: head}
+            generation_of = {id(candidate): generation for generation, candidate in epoch.items()}
+            for chosen in _pick(policy, epoch.values(), migrants):
+                definition = ast.unparse(host.find_function_node(chosen.tree, node_name, node_type))
+                migrant = Migrant(island, generation_of[id(chosen)], definition)
+                for destination in route(island, islands):
+                    transport.send(destination, migrant)
+            survivors = []
+            for migrant in transport.receive():
+                try:
+                    function_node = ast.parse(migrant.source).body[0]
+                except (SyntaxError, ValueError, IndexError):
+                    continue
+                tree = with_definition(head.tree, function_node, node_name, node_type)
+                verdict = host.check_candidate(tree, node_name, node_type, source=migrant.source, sandbox=sandbox)
+                if verdict.status == OK:
+                    survivors.append((migrant, _candidate(host, tree, node_name, node_type, migrant.source, verdict)))
+            chosen = policy([candidate for _, candidate in survivors] + [head])
+            if chosen is not head:
+                migrant = next(migrant for migrant, candidate in survivors if candidate is chosen)
+                adopted += 1
+                print(f'Island {island}: generation {index} adopts a migrant from island {migrant.island} '
+                      f'(its generation {migrant.generation})')
+            source = ast.unparse(chosen.tree)
+    finally:
+        transport.close()
+    elapsed = time.perf_counter() - start_time
+    print(f'Island {island}: {done} generations in {elapsed:.3f}s, {adopted} migrants adopted')
+    return index, source
+
+
+def _island_main(host_name, island, islands, transport_args, options, results):
+    import sys
+    host = sys.modules[host_name]
+    if transport_args[0] == 'queue':
+        transport = QueueTransport(island, transport_args[1])
+    else:
+        transport = TCPTransport(island, transport_args[1])
+    sandbox = cache = store = None
+    if options.get('sandbox') is not None:
+        from .sandbox import Sandbox
+        sandbox = Sandbox(**options['sandbox'])
+    if options.get('cache_size'):
+        from .cache import VerdictCache
+        cache = VerdictCache(options['cache_size'])
+    if options.get('store'):
+        import os
+        from .store import GenerationStore
+        store = GenerationStore(os.path.join(options['store'], f'island{island}'), host_source=host.base_code)
+    try:
+        generation, source = run_island(host, island, islands, transport, sandbox=sandbox, cache=cache, store=store,
+                                        **options['run'])
+        results.put((island, generation, source))
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+
+
+def run_islands(host, islands=4, generations=None, interval=10, migrants=1, topology='ring', selection='first',
+                transport='queue', port=7400, sandbox=None, cache_size=None, store=None, seed=None,
+                node_name='evolved_function', node_type=ast.FunctionDef):
+    """
+    Run islands islands as processes on this machine and wait for all of them.
+
+    :param transport: 'queue' for multiprocessing queues, or 'tcp' to go through TCPTransport on
+        localhost ports port, port + 1, ..., exactly as islands on separate hosts would.
+    :param sandbox: Keyword arguments for the ast_liv.sandbox.Sandbox each island creates, or None.
+    :param cache_size: Entries of the VerdictCache each island keeps, or None for no cache.
+    :param store: Directory under which island i records its lineage in a store named island{i}.
+    :return: {island: (generation, source)} of every island's final head.
+    """
+    if transport == 'queue':
+        transport_args = ('queue', [multiprocessing.Queue() for _ in range(islands)])
+    else:
+        transport_args = ('tcp', [('localhost', port + i) for i in range(islands)])
+    options = {
+        'sandbox': sandbox,
+        'cache_size': cache_size,
+        'store': store,
+        'run': dict(generations=generations, interval=interval, migrants=migrants, topology=topology,
+                    selection=selection, seed=seed, node_name=node_name, node_type=node_type),
+    }
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_island_main,
+                                         args=(host.__name__, island, islands, transport_args, options, results))
+                 for island in range(islands)]
+    for process in processes:
+        process.start()
+    heads = {}
+    while len(heads) < islands and any(process.is_alive() for process in processes) or not results.empty():
+        try:
+            island, generation, source = results.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        heads[island] = (generation, source)
+    for process in processes:
+        process.join()
+    for island in range(islands):
+        if island not in heads:
+            print(f'Island {island} exited without a result (exit code {processes[island].exitcode})')
+    return heads
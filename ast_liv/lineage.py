@@ -0,0 +1,314 @@
+"""
+A queryable record of a run: every mutant tried, whether it was kept, and who its parent was.
+
+The drivers write one row per mutant into an SQLite database, with the operator that made it
+(the mutType of mutate_function_tree, or one of the other ways a child is made), its node count,
+structural hash, verdict and timings, and the node types its definition contains. Kept mutants
+are the generations of the lineage; every row points at the kept row it was mutated from, so
+parent/child edges and ancestries are plain queries:
+
+    runs        id, started, seed, start_index, mode
+    mutants     id, run, parent, generation, attempt, operator, nodes, hash, verdict, error,
+                eval_time, mutate_time, kept
+    node_types  mutant, type, count
+
+mutants is indexed on hash, (run, generation), verdict and parent, and node_types on type.
+Rows are buffered and inserted `batch` generations at a time in one transaction, so the
+mutation loop does not wait on SQLite. Their ids are handed out before they are inserted, from
+blocks of ID_BLOCK ids each process reserves in the one-row table id_blocks, so any number of
+runs can write to one database at once. The database can be opened with any SQLite client;
+common questions are also answered by
+
+    python -m ast_liv.lineage DB [--first While | --ancestry ID | --hash HEX]
+"""
+import argparse
+import ast
+import sqlite3
+import time
+from collections import Counter
+
+from .cache import structural_hash
+
+# How a mutant was made: the two mutTypes of mutate_function_tree, then the drivers' other ways
+ATTACH = 0
+REPLACE = 1
+CODE_EDIT = 2
+TUNE = 3
+# the parent kept again because its mutant did not compile
+COPY = 4
+OPERATOR_NAMES = {ATTACH: 'attach', REPLACE: 'replace', CODE_EDIT: 'code edit', TUNE: 'tune', COPY: 'copy'}
+
+# Mutant ids reserved at a time; ids a process does not use are left as gaps.
+ID_BLOCK = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, started REAL, seed INTEGER, start_index INTEGER, mode TEXT);
+CREATE TABLE IF NOT EXISTS mutants (
+    id INTEGER PRIMARY KEY, run INTEGER NOT NULL, parent INTEGER, generation INTEGER NOT NULL,
+    attempt INTEGER, operator INTEGER, nodes INTEGER, hash BLOB, verdict TEXT NOT NULL, error TEXT,
+    eval_time REAL, mutate_time REAL, kept INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS node_types (mutant INTEGER NOT NULL, type TEXT NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS id_blocks (next INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS mutants_hash ON mutants (hash);
+CREATE INDEX IF NOT EXISTS mutants_generation ON mutants (run, generation);
+CREATE INDEX IF NOT EXISTS mutants_verdict ON mutants (verdict);
+CREATE INDEX IF NOT EXISTS mutants_parent ON mutants (parent);
+CREATE INDEX IF NOT EXISTS node_types_type ON node_types (type, mutant);
+"""
+
+MUTANT_COLUMNS = ('id', 'run', 'parent', 'generation', 'attempt', 'operator', 'nodes', 'hash', 'verdict', 'error',
+                  'eval_time', 'mutate_time', 'kept')
+
+
+class LineageDB:
+    """
+    The SQLite lineage database of one or more runs.
+
+    :param path: Database file; created if missing, appended to otherwise.
+    :param batch: Number of generations whose rows are buffered before they are inserted.
+    :param seed: The seed of the runs recorded, or None.
+    """
+
+    def __init__(self, path, batch=32, seed=None):
+        self.path = path
+        self.batch = batch
+        self.seed = seed
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.run = None
+        # the id of the newest row added, and the rest of the reserved block
+        self.last_id = 0
+        self._next_id = self._block_end = 0
+        self._pending_mutants = []
+        self._pending_types = []
+        self._generations = 0
+        # {id(node): (node, nodes, digest, types)} of recent kept definitions, whose copies and
+        # unchanged children are recorded again without walking and hashing them again
+        self._kept = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_run(self, start_index=0, mode='generations'):
+        """Begin recording a new run and return its id."""
+        cursor = self.connection.execute('INSERT INTO runs (started, seed, start_index, mode) VALUES (?, ?, ?, ?)',
+                                         (time.time(), self.seed, start_index, mode))
+        self.connection.commit()
+        self.run = cursor.lastrowid
+        return self.run
+
+    def resume_run(self, run, last_id, lineage):
+        """
+        Continue recording run from a checkpoint taken when last_id was its newest row, dropping
+        the rows of run written after it, which the resumed run writes again. Rows of other runs
+        are left alone.
+
+        :param lineage: Generation numbers of the checkpoint's lineage.
+        :return: The row ids of those generations, in the same order.
+        """
+        self.flush()
+        with self.connection:
+            self.connection.execute('DELETE FROM node_types WHERE mutant IN '
+                                    '(SELECT id FROM mutants WHERE run = ? AND id > ?)', (run, last_id))
+            self.connection.execute('DELETE FROM mutants WHERE run = ? AND id > ?', (run, last_id))
+        self.run = run
+        self.last_id = last_id
+        ids = []
+        for generation in lineage:
+            # a generation number is reused after a revert; the lineage holds its latest kept row
+            row = self.connection.execute(
+                'SELECT MAX(id) FROM mutants WHERE run = ? AND generation = ? AND kept = 1',
+                (run, generation)).fetchone()
+            if row[0] is None:
+                raise ValueError(f'Generation {generation} of run {run} is not in {self.path}')
+            ids.append(row[0])
+        return ids
+
+    def add(self, generation, parent=None, operator=None, function_node=None, verdict=None, status=None, key=None,
+            attempt=None, mutate_time=None, kept=False):
+        """
+        Buffer the row of one mutant.
+
+        :param generation: The generation number the mutant was made for.
+        :param parent: Row id of the kept mutant it was made from, or None for the root.
+        :param operator: How it was made: a mutType value or one of the constants of this module.
+        :param function_node: Its definition, or None when it could not be built.
+        :param verdict: Its Verdict, or None when it never ran; status then names the failure.
+        :param key: Its structural hash as a hex string, when the caller already has it.
+        :param mutate_time: Seconds spent making it.
+        :return: The row id of the mutant.
+        """
+        if self._next_id == self._block_end:
+            self._reserve()
+        self.last_id = self._next_id
+        self._next_id += 1
+        nodes = digest = None
+        if function_node is not None:
+            known = self._kept.get(id(function_node))
+            if known is not None and known[0] is function_node:
+                _, nodes, digest, types = known
+            else:
+                types = Counter(type(node).__name__ for node in ast.walk(function_node))
+                nodes = sum(types.values())
+                digest = bytes.fromhex(key if key is not None else structural_hash(function_node))
+                if kept:
+                    if len(self._kept) >= 16:
+                        self._kept.clear()
+                    self._kept[id(function_node)] = (function_node, nodes, digest, types)
+            self._pending_types.extend((self.last_id, name, count) for name, count in types.items())
+        if verdict is not None:
+            status, error, eval_time = verdict.status, verdict.error, verdict.elapsed
+        else:
+            error = eval_time = None
+        self._pending_mutants.append((self.last_id, self.run, parent, generation, attempt, operator, nodes, digest,
+                                      status, error, eval_time, mutate_time, int(kept)))
+        return self.last_id
+
+    def _reserve(self):
+        """Take the next ID_BLOCK ids of the database for this process."""
+        connection = self.connection
+        # IMMEDIATE takes the write lock up front, so no other process reads the same block
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT next FROM id_blocks').fetchone()
+            if row is None:
+                # a database written before ids were reserved
+                start = connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM mutants').fetchone()[0]
+                connection.execute('INSERT INTO id_blocks VALUES (?)', (start + ID_BLOCK,))
+            else:
+                start = row[0]
+                connection.execute('UPDATE id_blocks SET next = ?', (start + ID_BLOCK,))
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+        self._next_id, self._block_end = start, start + ID_BLOCK
+
+    def end_generation(self):
+        """Mark the end of a generation; every `batch` generations the buffered rows are inserted."""
+        self._generations += 1
+        if self._generations % self.batch == 0:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered rows in one transaction."""
+        if not self._pending_mutants:
+            return
+        with self.connection:
+            self.connection.executemany(f'INSERT INTO mutants VALUES ({", ".join("?" * len(MUTANT_COLUMNS))})',
+                                        self._pending_mutants)
+            self.connection.executemany('INSERT INTO node_types VALUES (?, ?, ?)', self._pending_types)
+        self._pending_mutants = []
+        self._pending_types = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def _rows(self, query, parameters=()):
+        self.flush()
+        cursor = self.connection.execute(query, parameters)
+        return [dict(zip(MUTANT_COLUMNS, row)) for row in cursor]
+
+    def get(self, mutant):
+        rows = self._rows(f'SELECT {", ".join(MUTANT_COLUMNS)} FROM mutants WHERE id = ?', (mutant,))
+        if not rows:
+            raise KeyError(f'Mutant {mutant} is not in {self.path}')
+        return rows[0]
+
+    def ancestry(self, mutant):
+        """Return the rows from the root of the lineage down to mutant."""
+        columns = ', '.join(f'm.{column}' for column in MUTANT_COLUMNS)
+        return self._rows(f"""
+            WITH RECURSIVE chain(id, depth) AS (
+                SELECT id, 0 FROM mutants WHERE id = ?
+                UNION ALL
+                SELECT m.parent, chain.depth + 1 FROM mutants m JOIN chain ON m.id = chain.id
+                WHERE m.parent IS NOT NULL)
+            SELECT {columns} FROM chain JOIN mutants m ON m.id = chain.id ORDER BY chain.depth DESC""", (mutant,))
+
+    def children(self, mutant):
+        """Return the rows of every mutant made from mutant."""
+        return self._rows(f'SELECT {", ".join(MUTANT_COLUMNS)} FROM mutants WHERE parent = ? ORDER BY id', (mutant,))
+
+    def first_with(self, node_type, kept=True, run=None):
+        """
+        Return the first mutant whose definition contains a node_type node (an ast class name
+        such as 'While'), only among kept generations unless kept is false, or None.
+        """
+        conditions = ['t.type = ?']
+        parameters = [node_type]
+        if kept:
+            conditions.append('m.kept = 1')
+        if run is not None:
+            conditions.append('m.run = ?')
+            parameters.append(run)
+        columns = ', '.join(f'm.{column}' for column in MUTANT_COLUMNS)
+        rows = self._rows(f'SELECT {columns} FROM node_types t JOIN mutants m ON m.id = t.mutant '
+                          f'WHERE {" AND ".join(conditions)} ORDER BY m.id LIMIT 1', parameters)
+        return rows[0] if rows else None
+
+    def with_hash(self, digest):
+        """Return every mutant with the given structural hash (hex)."""
+        return self._rows(f'SELECT {", ".join(MUTANT_COLUMNS)} FROM mutants WHERE hash = ? ORDER BY id',
+                          (bytes.fromhex(digest),))
+
+    def summary(self, run=None):
+        """Return report lines: mutants per verdict and, per operator, how many ran cleanly."""
+        self.flush()
+        where, parameters = ('WHERE run = ?', (run,)) if run is not None else ('', ())
+        lines = []
+        for status, count in self.connection.execute(
+                f'SELECT verdict, COUNT(*) FROM mutants {where} GROUP BY verdict ORDER BY COUNT(*) DESC', parameters):
+            lines.append(f'{status}: {count} mutants')
+        for operator, total, ok, kept in self.connection.execute(
+                f"SELECT operator, COUNT(*), SUM(verdict = 'ok'), SUM(kept) FROM mutants {where} "
+                f"GROUP BY operator ORDER BY operator", parameters):
+            name = OPERATOR_NAMES.get(operator, 'root' if operator is None else str(operator))
+            lines.append(f'operator {name}: {ok}/{total} ran cleanly, {kept} kept')
+        return lines
+
+
+def describe(row):
+    operator = OPERATOR_NAMES.get(row['operator'], 'root' if row['operator'] is None else str(row['operator']))
+    digest = row['hash'].hex() if row['hash'] is not None else '-'
+    return (f'mutant {row["id"]}: run {row["run"]} generation {row["generation"]} {operator} {row["verdict"]}'
+            f'{" kept" if row["kept"] else ""} nodes {row["nodes"]} hash {digest}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query a lineage database written with --lineage.')
+    parser.add_argument('database', help='database file written with --lineage')
+    parser.add_argument('--run', type=int, default=None, help='only look at this run')
+    parser.add_argument('--first', metavar='NODE_TYPE',
+                        help='the first kept generation containing an ast node of this type, e.g. While')
+    parser.add_argument('--ancestry', type=int, metavar='ID', help='the generations leading to mutant ID')
+    parser.add_argument('--children', type=int, metavar='ID', help='the mutants made from mutant ID')
+    parser.add_argument('--hash', metavar='HEX', help='every mutant with this structural hash')
+    args = parser.parse_args(argv)
+    with LineageDB(args.database) as db:
+        if args.first is not None:
+            row = db.first_with(args.first, run=args.run)
+            print(describe(row) if row is not None else f'No kept generation contains {args.first}')
+        elif args.ancestry is not None:
+            for row in db.ancestry(args.ancestry):
+                print(describe(row))
+        elif args.children is not None:
+            for row in db.children(args.children):
+                print(describe(row))
+        elif args.hash is not None:
+            for row in db.with_hash(args.hash):
+                print(describe(row))
+        else:
+            for line in db.summary(args.run):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Population mode: produce several mutants of evolved_function per generation and compile and
+run them on a multiprocessing worker pool, then keep one of the survivors.
+"""
+import ast
+import contextlib
+import multiprocessing
+import random
+import time
+from collections import namedtuple
+
+from .evaluation import OK, SYNTAX, evaluate_function_source, with_definition
+
+Candidate = namedtuple('Candidate', ['tree', 'source', 'node_count', 'verdict'])
+
+
+def select_first(candidates):
+    """Keep the first surviving mutant, which is what the serial loop would have kept."""
+    return candidates[0]
+
+
+def select_random(candidates):
+    """Keep a uniformly random survivor."""
+    return random.choice(candidates)
+
+
+def select_smallest(candidates):
+    """Keep the survivor with the fewest nodes (parsimony pressure)."""
+    return min(candidates, key=lambda c: c.node_count)
+
+
+def select_largest(candidates):
+    """Keep the survivor with the most nodes."""
+    return max(candidates, key=lambda c: c.node_count)
+
+
+SELECTION_POLICIES = {
+    'first': select_first,
+    'random': select_random,
+    'smallest': select_smallest,
+    'largest': select_largest,
+}
+
+
+def produce_candidates(host, parent, population_size, node_name, node_type, node_index=None):
+    """
+    Mutate population_size independent copies of the parent in this process.
+
+    :param node_index: The NodeIndex of the parent's definition; every child is mutated with a copy.
+    :return: A list of (child_tree, function_source, mutation_type, node_index) tuples, mutation_type
+        being the mutType the host drew for the child and node_index the NodeIndex of its definition,
+        or None; mutants that fail to unparse are dropped.
+    """
+    candidates = []
+    for _ in range(population_size):
+        try:
+            child = host.spawn_child(parent, node_name, node_type, node_index=node_index)
+            with host.profiler.phase('unparse'):
+                source = ast.unparse(host.find_function_node(child, node_name, node_type))
+        except Exception:
+            continue
+        candidates.append((child, source, host.last_mutation_type, host.last_node_index))
+    return candidates
+
+
+def run_population(host, generations=None, population_size=8, workers=None, chunksize=1, selection='first',
+                   start_index=0, write_files=False, sandbox=None, cache=None, store=None, checkpoint=None,
+                   resume=None, lineage_db=None, compact=False, node_name='evolved_function',
+                   node_type=ast.FunctionDef):
+    """
+    Evolve the host's evolved_function with population_size mutants per generation.
+
+    Mutants are produced in this process, then compiled and run on a pool of `workers` processes
+    (all cores by default), handing out `chunksize` mutants per task. The next generation is picked
+    among the mutants that ran cleanly by the named selection policy. If none did, the newest
+    generation is dropped, as the serial driver does after mutTry failures.
+
+    :param host: The quine module providing spawn_child, find_function_node and set_base_code.
+    :param sandbox: An ast_liv.sandbox.Sandbox to run mutants in instead of an unbounded pool.
+    :param cache: An ast_liv.cache.VerdictCache; mutants already seen, in earlier generations or
+        earlier in the same batch, are not sent to the workers at all.
+    :param store: An ast_liv.store.GenerationStore recording every kept generation.
+    :param checkpoint: An ast_liv.checkpoint.Checkpointer that saves the run every so many
+        generations and when it ends.
+    :param resume: An ast_liv.checkpoint.Checkpoint to continue from; see run_generations.
+    :param lineage_db: An ast_liv.lineage.LineageDB that records every mutant of every generation.
+    :param compact: Keep every generation of the lineage but the first and the newest as an
+        ast_liv.compact.CompactTree of its evolved_function, rebuilt when a revert needs it.
+    :return: The list of parsed modules making up the lineage.
+    """
+
+    def save_checkpoint():
+        host.draws.reset()
+        if store is not None:
+            store.flush()
+        indices = [start_index + i for i in range(len(lineage))]
+        counters = dict(step=step, valid=valid)
+        if lineage_db is not None:
+            lineage_db.flush()
+            counters.update(lineage_run=lineage_db.run, lineage_rows=lineage_db.last_id)
+        size = checkpoint.save(host_source, start_index, indices, dict(zip(indices[1:], definitions)),
+                               records if store is not None else None, counters=counters, cache=cache)
+        print(f'Checkpoint at step {step}: {size} bytes written to {checkpoint.path}')
+        return step
+
+    policy = SELECTION_POLICIES[selection]
+    host_source = host.base_code
+    step = 0
+    valid = 0
+    # definitions of lineage[1:] packed for checkpoints
+    definitions = []
+    if resume is not None:
+        from .checkpoint import resume as restore_checkpoint, unpack
+        if store is not None and resume.records is None:
+            raise ValueError('The checkpoint was written by a run without a store')
+        host_source, start_index = resume.host, resume.start_index
+        lineage = [ast.parse(host_source)]
+        for index in resume.lineage[1:]:
+            definitions.append(resume.definitions[index])
+            lineage.append(with_definition(lineage[0], unpack(definitions[-1]), node_name, node_type))
+        step, valid = resume.counters['step'], resume.counters['valid']
+        if store is not None:
+            records = list(resume.records)
+        if lineage_db is not None:
+            if 'lineage_run' not in resume.counters:
+                raise ValueError('The checkpoint was written by a run without a lineage database')
+            parent_ids = lineage_db.resume_run(resume.counters['lineage_run'], resume.counters['lineage_rows'],
+                                               resume.lineage)
+        restore_checkpoint(resume, cache)
+        host.draws.reset()
+    else:
+        lineage = [ast.parse(host_source)]
+        if store is not None:
+            records = [store.add(start_index, host.find_function_node(lineage[0], node_name, node_type))]
+        if lineage_db is not None:
+            lineage_db.start_run(start_index, mode='population')
+            parent_ids = [lineage_db.add(start_index, function_node=host.find_function_node(lineage[0], node_name,
+                                                                                            node_type),
+                                         status=OK, kept=True)]
+    if compact:
+        from .compact import CompactLineage
+        compacted = CompactLineage(lineage[0], start_index, node_name, node_type)
+    unparser = host.ModuleUnparser()
+    # (tree, NodeIndex) of the head's definition, with host.mutation_sites
+    head_nodes = None
+    first_step = saved_at = step
+    start_time = time.perf_counter()
+    with contextlib.nullcontext() if sandbox is not None else multiprocessing.Pool(workers) as pool:
+        while generations is None or step < generations:
+            if checkpoint is not None and step != saved_at and checkpoint.due(step):
+                saved_at = save_checkpoint()
+            step += 1
+            parent = lineage[-1]
+            index = start_index + len(lineage)
+            if parent is None:
+                parent = lineage[-1] = compacted(index - 1)
+            host.set_base_code(parent)
+            if lineage_db is not None:
+                started = time.perf_counter()
+            if host.mutation_sites and (head_nodes is None or head_nodes[0] is not parent):
+                # the head was reverted to or rebuilt, so its index went with it
+                head_nodes = (parent, host.NodeIndex(host.find_function_node(parent, node_name, node_type)))
+            produced = produce_candidates(host, parent, population_size, node_name, node_type,
+                                          head_nodes[1] if host.mutation_sites else None)
+            if lineage_db is not None:
+                # produced together, so each mutant is charged an equal share
+                mutate_time = (time.perf_counter() - started) / max(len(produced), 1)
+            profiler = host.profiler
+            if cache is not None:
+                keys = [cache.key(host.find_function_node(child, node_name, node_type)) for child, _, _, _ in produced]
+            else:
+                keys = list(range(len(produced)))
+            known = {}
+            jobs = []
+            job_keys = []
+            for (child, source, _, _), key in zip(produced, keys):
+                if key in known:
+                    continue
+                verdict = cache.get(key) if cache is not None else None
+                known[key] = verdict
+                if verdict is None:
+                    jobs.append((host.__name__, node_name, source))
+                    job_keys.append(key)
+            with profiler.phase('exec'):
+                if sandbox is not None:
+                    results = sandbox.map(jobs)
+                else:
+                    results = pool.map(evaluate_function_source, jobs, chunksize)
+            for key, verdict in zip(job_keys, results):
+                known[key] = verdict
+                if cache is not None:
+                    cache.put(key, verdict)
+            if cache is not None:
+                cache.hits += len(produced) - len(known)
+            verdicts = [known[key] for key in keys]
+            valid += sum(1 for verdict in verdicts if verdict.status != SYNTAX)
+            survivors = []
+            for (child, source, _, _), verdict in zip(produced, verdicts):
+                if verdict.status == OK:
+                    node_count = sum(1 for _ in ast.walk(host.find_function_node(child, node_name, node_type)))
+                    survivors.append(Candidate(child, source, node_count, verdict))
+            print(f'Generation {index}: {len(survivors)}/{population_size} mutants survived')
+            chosen = policy(survivors) if survivors else None
+            if lineage_db is not None:
+                child_id = None
+                for attempt, ((child, source, operator, _), verdict, key) in enumerate(zip(produced, verdicts, keys), 1):
+                    kept = chosen is not None and child is chosen.tree
+                    row = lineage_db.add(index, parent_ids[-1], operator,
+                                         host.find_function_node(child, node_name, node_type), verdict,
+                                         key=key if cache is not None else None, attempt=attempt,
+                                         mutate_time=mutate_time, kept=kept)
+                    if kept:
+                        child_id = row
+                lineage_db.end_generation()
+            if chosen is None:
+                if len(lineage) > 1:
+                    lineage.pop()
+                    if compact:
+                        compacted.discard(index - 1)
+                    if checkpoint is not None:
+                        definitions.pop()
+                    if store is not None:
+                        records.pop()
+                    if lineage_db is not None:
+                        parent_ids.pop()
+                print(f'Reverting to generation {start_index + len(lineage) - 1}.')
+                profiler.end_generation(index)
+                continue
+            if lineage_db is not None:
+                parent_ids.append(child_id)
+            if compact and len(lineage) > 1:
+                # None marks a generation held only in compacted
+                compacted.add(index - 1, host.find_function_node(lineage[-1], node_name, node_type))
+                lineage[-1] = None
+            lineage.append(chosen.tree)
+            nodes = next(nodes for child, _, _, nodes in produced if child is chosen.tree)
+            head_nodes = (chosen.tree, nodes) if nodes is not None else None
+            if checkpoint is not None:
+                definitions.append(checkpoint.pack(host.find_function_node(chosen.tree, node_name, node_type)))
+            if store is not None:
+                records.append(store.add(index, host.find_function_node(chosen.tree, node_name, node_type),
+                                         parent=records[-1], source=chosen.source))
+            if chosen.verdict.output:
+                print(chosen.verdict.output, end='')
+            if write_files:
+                new_source = unparser.unparse(chosen.tree)
+                with profiler.phase('write'):
+                    with open(f'quine_ast_liv_{index}.py', 'w') as f:
+                        f.write(new_source)
+            profiler.end_generation(index)
+    if checkpoint is not None and step != saved_at:
+        save_checkpoint()
+    elapsed = time.perf_counter() - start_time
+    steps = step - first_step
+    print(f'{steps} generations of {population_size} mutants in {elapsed:.3f}s '
+          f'({steps * population_size / elapsed if elapsed else 0:.1f} mutants/sec)')
+    if step:
+        print(f'valid mutants: {valid}/{step * population_size} ({valid / (step * population_size):.1%})')
+    if cache is not None:
+        print(cache.summary())
+    if compact:
+        print(compacted.summary())
+        lineage = [compacted(start_index + i) if tree is None else tree for i, tree in enumerate(lineage)]
+    return lineage
@@ -0,0 +1,148 @@
+"""
+Per-phase timing of the mutation pipeline.
+
+The quine calls profiler.phase(name) around file reads, parsing, node lookup, generation, the
+mutator visit, node indexing, unparsing, compiling, running evolved_function and writing files.
+By default that profiler is a no-op; installing a Profiler from this module records how long
+every generation spent in each phase, how many nodes were generated and how many names were
+drawn. Each generation becomes one line of a JSONL trace, and summary() gives p50/p95/p99 per
+phase.
+
+A trace written by several processes (the os.execl loop appends one line per generation) can be
+summarised afterwards with:
+
+    python -m ast_liv.profiling trace.jsonl
+"""
+import ast
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile q (0-100) of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Collects phase timings and counters per generation.
+
+    Phases may nest (generation happens inside the mutator visit), so the phase totals of a
+    generation do not add up to its wall time.
+
+    :param path: Optional JSONL file; one record per generation is appended to it.
+    """
+    enabled = True
+
+    def __init__(self, path=None):
+        self.file = open(path, 'a') if path else None
+        self.samples = defaultdict(list)
+        self.totals = Counter()
+        self.generations = 0
+        self._seconds = Counter()
+        self._calls = Counter()
+        self._counts = Counter()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def record(self, name, seconds):
+        self._seconds[name] += seconds
+        self._calls[name] += 1
+
+    def count(self, name, n=1):
+        self._counts[name] += n
+
+    def generated(self, node):
+        self._counts['nodes_generated'] += sum(1 for _ in ast.walk(node)) if isinstance(node, ast.AST) else 0
+
+    def end_generation(self, index):
+        """Close the books on one generation: keep its phase totals and append its trace record."""
+        record = {
+            'generation': index,
+            'time': time.time(),
+            'phases': {name: {'calls': self._calls[name], 'seconds': seconds} for name, seconds in self._seconds.items()},
+            'counts': dict(self._counts),
+        }
+        add_record(self.samples, self.totals, record)
+        self.generations += 1
+        if self.file is not None:
+            self.file.write(json.dumps(record) + '\n')
+        self._seconds.clear()
+        self._calls.clear()
+        self._counts.clear()
+
+    def summary(self):
+        return format_summary(self.samples, self.totals, self.generations)
+
+    def close(self):
+        if self._seconds or self._counts:
+            self.end_generation(None)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def add_record(samples, totals, record):
+    for name, phase in record['phases'].items():
+        samples[name].append(phase['seconds'])
+        totals[name + '.calls'] += phase['calls']
+    totals.update(record['counts'])
+
+
+def format_summary(samples, totals, generations):
+    """
+    Return a table of per-generation seconds spent in each phase (p50/p95/p99 over generations),
+    followed by the counters summed over the run.
+    """
+    lines = [f'profile of {generations} generations (seconds per generation)',
+             f'{"phase":<10} {"calls":>8} {"total":>10} ' + ' '.join(f'{"p" + str(q):>10}' for q in PERCENTILES)]
+    for name in sorted(samples, key=lambda name: -sum(samples[name])):
+        values = sorted(samples[name])
+        # generations that never entered a phase spent no time in it
+        values = [0.0] * (generations - len(values)) + values
+        lines.append(f'{name:<10} {totals[name + ".calls"]:>8} {sum(values):>10.4f} '
+                     + ' '.join(f'{percentile(values, q):>10.6f}' for q in PERCENTILES))
+    for name, value in sorted(totals.items()):
+        if not name.endswith('.calls'):
+            lines.append(f'{name}: {value} ({value / generations if generations else 0:.1f} per generation)')
+    return '\n'.join(lines)
+
+
+def summarize_trace(path):
+    """Summarise a JSONL trace written by Profiler."""
+    samples = defaultdict(list)
+    totals = Counter()
+    generations = 0
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                add_record(samples, totals, json.loads(line))
+                generations += 1
+    return format_summary(samples, totals, generations)
+
+
+if __name__ == '__main__':
+    for trace in sys.argv[1:]:
+        print(summarize_trace(trace))
@@ -0,0 +1,170 @@
+"""
+Bounded execution of candidate evolved_functions in reusable child processes.
+
+Each worker caps its own address space with RLIMIT_AS and arms RLIMIT_CPU before every job;
+the parent enforces a wall-clock timeout on top and kills, reaps and replaces any worker that
+overruns or dies. Workers are long-lived, so a candidate costs a pipe round trip, not a fork.
+"""
+import math
+import os
+import signal
+import time
+from collections import deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+from .evaluation import Verdict, TIMEOUT, CRASH, CPUTimeExceeded, evaluate_function_source
+
+try:
+    import resource
+except ImportError:  # not available on Windows; only the wall-clock timeout applies there
+    resource = None
+
+
+def _address_space_size():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CPUTimeExceeded()
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_main(conn, memory_limit, cpu_limit):
+    """
+    Serve jobs from conn until it is closed. The memory cap is relative to the address space the
+    worker already has mapped when it starts, so it bounds what candidates can allocate.
+    """
+    if resource is not None:
+        if memory_limit:
+            soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+            limit = _address_space_size() + memory_limit
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        if cpu_limit:
+            signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        if resource is not None and cpu_limit:
+            soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            limit = math.ceil(_cpu_seconds() + cpu_limit)
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+        try:
+            verdict = evaluate_function_source(job)
+        except CPUTimeExceeded:
+            verdict = Verdict(TIMEOUT, 'cpu', '', 0.0)
+        if resource is not None and cpu_limit:
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        conn.send(verdict)
+
+
+class _Worker:
+
+    def __init__(self, memory_limit, cpu_limit):
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=_worker_main, args=(child_conn, memory_limit, cpu_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class Sandbox:
+    """
+    A fixed set of reusable worker processes that run candidates under time and memory limits.
+
+    :param workers: Number of worker processes.
+    :param timeout: Wall-clock seconds a single candidate may run before its worker is killed.
+    :param memory_limit: Bytes of additional address space a worker may map (RLIMIT_AS), or None.
+    :param cpu_limit: CPU seconds a single candidate may use (RLIMIT_CPU), or None.
+    """
+
+    def __init__(self, workers=1, timeout=2.0, memory_limit=512 * 2 ** 20, cpu_limit=1):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.restarts = 0
+        self._workers = [_Worker(memory_limit, cpu_limit) for _ in range(max(1, workers or os.cpu_count() or 1))]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=1)
+            worker.kill()
+        self._workers = []
+
+    def _replace(self, worker):
+        worker.kill()
+        self._workers[self._workers.index(worker)] = _Worker(self.memory_limit, self.cpu_limit)
+        self.restarts += 1
+
+    def run(self, job):
+        """Run a single (host_name, node_name, source) job and return its Verdict."""
+        return self.map([job])[0]
+
+    def map(self, jobs):
+        """
+        Run (host_name, node_name, source) jobs across the workers and return their Verdicts in order.
+
+        A worker that exceeds the timeout is killed and reported as a timeout; one that dies on its
+        own (segfault, hard rlimit) is reported as a crash with its exit code. Either way it is
+        replaced before the next job is handed out.
+        """
+        results = [None] * len(jobs)
+        pending = deque(enumerate(jobs))
+        busy = {}
+        while pending or busy:
+            for worker in self._workers:
+                if worker not in busy and pending:
+                    i, job = pending.popleft()
+                    worker.conn.send(job)
+                    busy[worker] = (i, time.monotonic())
+            now = time.monotonic()
+            next_deadline = min(started for _, started in busy.values()) + self.timeout
+            ready = wait([worker.conn for worker in busy], timeout=max(0.0, next_deadline - now))
+            for worker in list(busy):
+                i, started = busy[worker]
+                if worker.conn in ready:
+                    try:
+                        results[i] = worker.conn.recv()
+                    except (EOFError, OSError):
+                        worker.process.join()
+                        results[i] = Verdict(CRASH, f'exit code {worker.process.exitcode}', '',
+                                             time.monotonic() - started)
+                        self._replace(worker)
+                    del busy[worker]
+                elif time.monotonic() - started >= self.timeout:
+                    results[i] = Verdict(TIMEOUT, 'wall', '', time.monotonic() - started)
+                    self._replace(worker)
+                    del busy[worker]
+        return results
@@ -0,0 +1,133 @@
+"""
+Handing definitions to worker processes through shared memory instead of pipes.
+
+The supervisor publishes each parent it hands out as a snapshot: the ast_liv.compact bytes of
+its evolved_function in a multiprocessing.shared_memory segment of its own. A job then names
+the segment instead of carrying the definition, and a worker attaches to it read-only, once
+per parent, and decodes the trees it mutates straight out of it, without anything being pickled.
+
+Each worker writes the mutants it makes into an output region, a shared segment the supervisor
+creates for it with one fixed-size slot per job the worker can have queued. The worker only
+sends back the Verdict and the length it wrote; the supervisor copies the bytes out of the slot
+when it takes the reply, before the slot can be handed out again. A mutant too large for a
+slot is sent over the pipe instead.
+
+Segments are created and unlinked by the supervisor alone, so a worker that crashes leaks none.
+"""
+import itertools
+import os
+from multiprocessing import shared_memory
+
+from .compact import CompactTree
+
+# Bytes per output slot; a compact evolved_function of a few hundred nodes takes a few KiB.
+SLOT_SIZE = 256 * 2 ** 10
+
+# numbers the snapshots this process publishes
+_snapshot_numbers = itertools.count()
+
+
+class SnapshotPublisher:
+    """
+    Shared segments holding the compact bytes of the parents handed out, one per distinct
+    definition, until retain() releases them.
+    """
+
+    def __init__(self):
+        self.segments = {}
+        self.published = 0
+
+    def __len__(self):
+        return len(self.segments)
+
+    def publish(self, data):
+        """Return the name of a segment holding data, creating it unless data is already published."""
+        segment = self.segments.get(data)
+        if segment is None:
+            # named by a counter rather than at random, so a name is never used again for other bytes
+            segment = shared_memory.SharedMemory(name=f'ast_liv_{os.getpid()}_{next(_snapshot_numbers)}',
+                                                 create=True, size=max(len(data), 1))
+            segment.buf[:len(data)] = data
+            self.segments[data] = segment
+            self.published += 1
+        return segment.name
+
+    def retain(self, keep):
+        """Unlink the segments of every definition not in keep."""
+        for data in [data for data in self.segments if data not in keep]:
+            _release(self.segments.pop(data))
+
+    def close(self):
+        self.retain(())
+
+
+class SnapshotReader:
+    """A worker's view of the published snapshots; it stays attached to the last one it read."""
+
+    def __init__(self):
+        self.segment = None
+
+    def load(self, name):
+        """Decode the snapshot in segment name into a new ast node, reading it in place."""
+        if self.segment is None or self.segment.name != name:
+            self.close()
+            self.segment = shared_memory.SharedMemory(name=name)
+        view = self.segment.buf.toreadonly()
+        try:
+            return CompactTree.from_bytes(view, copy=False).to_ast()
+        finally:
+            view.release()
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+
+class OutputRegion:
+    """
+    A worker's output slots. The supervisor creates it with create=True and passes the name to
+    the worker, which attaches to it by name.
+
+    :param slots: Number of slots, one per job the worker can have queued.
+    :param slot_size: Bytes per slot.
+    """
+
+    def __init__(self, slots, slot_size=SLOT_SIZE, name=None, create=False):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.segment = shared_memory.SharedMemory(name=name, create=create, size=slots * slot_size if create else 0)
+        self.created = create
+
+    @property
+    def name(self):
+        return self.segment.name
+
+    def write(self, slot, data):
+        """Put data into slot and return its length, or return None if it does not fit."""
+        if len(data) > self.slot_size:
+            return None
+        start = slot * self.slot_size
+        self.segment.buf[start:start + len(data)] = data
+        return len(data)
+
+    def read(self, slot, length):
+        """Return a copy of the length bytes written to slot."""
+        start = slot * self.slot_size
+        return bytes(self.segment.buf[start:start + length])
+
+    def close(self):
+        if self.segment is not None:
+            if self.created:
+                _release(self.segment)
+            else:
+                self.segment.close()
+            self.segment = None
+
+
+def _release(segment):
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,212 @@
+"""
+Content-addressed storage for a lineage, instead of one full .py file per generation.
+
+A store is a directory holding the host module once (host.py) and, per generation, only the
+evolved_function definition, compressed and keyed by its structural hash, so a definition
+that reappears is stored once:
+
+    meta.json        node name and format version
+    host.py          the module the run started from
+    blobs.pack       append-only zlib blobs of unparsed definitions
+    generations.idx  append-only fixed-size records, one per kept generation
+
+Writes are buffered and appended in batches; blobs always reach disk before the records that
+point at them, so a store cut off mid-run is still readable up to its last complete batch.
+Any generation can be turned back into a runnable quine:
+
+    python -m ast_liv.store STORE GENERATION [-o quine_ast_liv_GENERATION.py]
+"""
+import argparse
+import ast
+import json
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+from .cache import structural_hash
+
+FORMAT_VERSION = 1
+# generation, parent record number (-1 for the root), structural hash, blob offset, blob length
+RECORD = struct.Struct('<Qq16sQI')
+
+Record = namedtuple('Record', ['number', 'generation', 'parent', 'hash', 'offset', 'length'])
+
+
+class GenerationStore:
+    """
+    A directory-backed store of one lineage.
+
+    :param path: Directory of the store; created if missing.
+    :param host_source: Source of the starting module. Required when creating a store and
+        ignored when opening an existing one.
+    :param node_name: Name of the evolving definition.
+    :param batch: Number of generations buffered before they are appended to disk.
+    """
+
+    def __init__(self, path, host_source=None, node_name='evolved_function', batch=64):
+        self.path = path
+        self.batch = batch
+        self.records = []
+        self.by_generation = {}
+        self.blobs = {}
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['version'] != FORMAT_VERSION:
+                raise ValueError(f'Unsupported store version {meta["version"]} in {path}')
+            self.node_name = meta['node_name']
+            self._load()
+        else:
+            if host_source is None:
+                raise ValueError(f'{path} is not a generation store and no host source was given to create one')
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'host.py'), 'w') as f:
+                f.write(host_source)
+            with open(meta_path, 'w') as f:
+                json.dump({'version': FORMAT_VERSION, 'node_name': node_name}, f)
+            self.node_name = node_name
+        with open(os.path.join(path, 'blobs.pack'), 'ab') as f:
+            self._pack_size = f.tell()
+        self._pending_blobs = []
+        self._pending_records = []
+        self._host = None
+
+    def _load(self):
+        index_path = os.path.join(self.path, 'generations.idx')
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        for number in range(len(data) // RECORD.size):
+            record = Record(number, *RECORD.unpack_from(data, number * RECORD.size))
+            self._remember(record)
+
+    def _remember(self, record):
+        self.records.append(record)
+        self.by_generation[record.generation] = record
+        self.blobs.setdefault(record.hash, (record.offset, record.length))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, generation, function_node, parent=None, source=None):
+        """
+        Record a generation whose definition is function_node.
+
+        :param generation: The generation number (as used in quine_ast_liv_{generation}.py).
+        :param parent: Record number of the parent generation, as returned by add(), or None.
+        :param source: The unparsed definition, if the caller already has it.
+        :return: The record number of the new generation.
+        """
+        key = bytes.fromhex(structural_hash(function_node))
+        location = self.blobs.get(key)
+        if location is None:
+            if source is None:
+                source = ast.unparse(function_node)
+            blob = zlib.compress(source.encode('utf-8'))
+            location = (self._pack_size, len(blob))
+            self._pack_size += len(blob)
+            self._pending_blobs.append(blob)
+            self.blobs[key] = location
+        record = Record(len(self.records), generation, -1 if parent is None else parent, key, *location)
+        self._remember(record)
+        self._pending_records.append(record)
+        if len(self._pending_records) >= self.batch:
+            self.flush()
+        return record.number
+
+    def flush(self):
+        """Append buffered blobs, then the records that refer to them."""
+        if self._pending_blobs:
+            with open(os.path.join(self.path, 'blobs.pack'), 'ab') as f:
+                f.write(b''.join(self._pending_blobs))
+            self._pending_blobs = []
+        if self._pending_records:
+            with open(os.path.join(self.path, 'generations.idx'), 'ab') as f:
+                f.write(b''.join(RECORD.pack(*record[1:]) for record in self._pending_records))
+            self._pending_records = []
+
+    def close(self):
+        self.flush()
+
+    def get(self, generation):
+        """Return the latest record stored for a generation number."""
+        try:
+            return self.by_generation[generation]
+        except KeyError:
+            raise KeyError(f'Generation {generation} is not in {self.path}') from None
+
+    def ancestry(self, record):
+        """Return the records from the root of the lineage down to record."""
+        chain = [record]
+        while chain[-1].parent >= 0:
+            chain.append(self.records[chain[-1].parent])
+        return chain[::-1]
+
+    def function_source(self, record):
+        """Return the unparsed definition stored for a record."""
+        self.flush()
+        with open(os.path.join(self.path, 'blobs.pack'), 'rb') as f:
+            f.seek(record.offset)
+            return zlib.decompress(f.read(record.length)).decode('utf-8')
+
+    def host_source(self):
+        if self._host is None:
+            with open(os.path.join(self.path, 'host.py')) as f:
+                self._host = f.read()
+        return self._host
+
+    def materialize(self, generation):
+        """
+        Return the full source of a generation: the host module with its definition replaced,
+        unparsed exactly as the driver writes quine_ast_liv_{index}.py.
+        """
+        record = self.get(generation)
+        tree = ast.parse(self.host_source())
+        function_node = ast.parse(self.function_source(record)).body[0]
+        for i, node in enumerate(tree.body):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == self.node_name:
+                tree.body[i] = function_node
+                break
+        else:
+            raise ValueError(f'host.py in {self.path} has no top-level {self.node_name}')
+        return ast.unparse(tree)
+
+    def export(self, generation, out_path=None):
+        """Write a generation as a runnable quine and return the file name."""
+        if out_path is None:
+            out_path = f'quine_ast_liv_{generation}.py'
+        with open(out_path, 'w') as f:
+            f.write(self.materialize(generation))
+        return out_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a generation from a generation store as a runnable quine.')
+    parser.add_argument('store', help='store directory written with --store')
+    parser.add_argument('generation', type=int, nargs='?', help='generation number (default: the latest)')
+    parser.add_argument('-o', '--output', help='output file (default: quine_ast_liv_{generation}.py)')
+    parser.add_argument('--ancestry', action='store_true', help='list the generations leading to it instead')
+    args = parser.parse_args(argv)
+    store = GenerationStore(args.store)
+    if not store.records:
+        parser.error(f'{args.store} holds no generations')
+    generation = store.records[-1].generation if args.generation is None else args.generation
+    if args.ancestry:
+        for record in store.ancestry(store.get(generation)):
+            print(f'record {record.number}: generation {record.generation} hash {record.hash.hex()}')
+        return
+    out_path = store.export(generation, args.output)
+    print(f'Wrote generation {generation} to {out_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+"""
+A long-lived supervisor that evolves the lineage with a pool of warm worker processes, in
+place of the os.execl chain that starts a new interpreter for every generation.
+
+Workers are forked from the quine once, so they start with it imported and its host module
+parsed. The supervisor hands them mutation jobs over pipes: a parent definition and a seed.
+A worker mutates the parent with spawn_child(), compiles and runs the child, and sends back
+the Verdict and the child's definition. A worker that crashes (a segfault in compile() on a
+deeply nested tree, a hard rlimit) or overruns the timeout is killed and replaced. Its job
+counts as a failed attempt, and the lineage goes on.
+
+Each worker has at most `backlog` jobs queued behind the one it runs, and answered jobs count
+until the lineage has taken them, so the supervisor never produces work faster than the pool
+and the lineage absorb it. Results are taken in the order the jobs were handed out, whichever
+worker finishes first. Results for a parent that has since been replaced are discarded, and
+queued jobs for it are skipped unrun. Every job's seed comes from `random`, so a seeded run
+with the same --workers and --backlog evolves the same lineage however the workers are
+scheduled. As in run_generations(), a child that fails to compile is replaced by a copy of its
+parent, and mutTry failures of one parent in a row revert the lineage by one generation.
+
+With shared=True (--shared-memory) definitions do not travel through the pipes at all: each
+parent is published once in shared memory and jobs name it, and workers write the mutants that
+ran cleanly into per-worker output regions (see ast_liv.sharing). A worker decodes a private
+copy of the parent from the snapshot for every job, which is cheaper than deep-copying it.
+The lineage is then kept as compact trees (ast_liv.compact) instead of unparsed text, so a
+child is mutated from exactly the tree its parent made rather than from that tree unparsed and
+parsed again.
+
+    python quine_ast_liv_0.py --supervise --workers 4 --generations 1000 --write-files
+    python quine_ast_liv_0.py --supervise --workers 4 --generations 1000 --shared-memory
+"""
+import ast
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from collections import deque
+from multiprocessing import Pipe, Process, Value
+from multiprocessing.connection import wait
+
+from .compact import CompactTree
+from .evaluation import OK, SYNTAX, TIMEOUT, CRASH, Verdict, evaluate_function_source, with_definition
+from .sandbox import _address_space_size
+
+try:
+    import resource
+except ImportError:  # not available on Windows; workers then run without a memory cap
+    resource = None
+
+READY = 'ready'
+
+
+def _worker_main(conn, epoch, host_name, node_name, node_type, memory_limit, output=None, require_source=False):
+    """
+    Serve mutation jobs from conn until it is closed. The host module's tree is parsed once;
+    the parent of the latest job is kept, since consecutive jobs mostly share it. A job handed
+    out before the lineage last changed (epoch) is answered with (None, None) without running.
+
+    With output, the (slots, slot size, name) of an ast_liv.sharing.OutputRegion, jobs name the
+    snapshot of their parent and carry the slot to write the child's compact bytes to, and the
+    reply holds the number of bytes written, or the bytes themselves if they do not fit, or b''
+    for a child that did not run cleanly. The child is compiled from its tree unless
+    require_source is set: some trees compile that ast.unparse() rejects or turns into invalid
+    source, so a driver that writes or stores its generations has the child unparsed and its
+    source compiled, as on the pipe path.
+    """
+    host = sys.modules[host_name]
+    host_tree = ast.parse(host.base_code)
+    host.set_base_code(host_tree)
+    host.get_identifier_pool()
+    if resource is not None and memory_limit:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = _address_space_size() + memory_limit
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    if output is not None:
+        from .sharing import OutputRegion, SnapshotReader
+        region = OutputRegion(*output)
+        snapshots = SnapshotReader()
+    conn.send(READY)
+    parent_definition = parent = None
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        job_epoch, definition, seed = job[:3]
+        if job_epoch != epoch.value:
+            conn.send((None, None))
+            continue
+        start = time.perf_counter()
+        try:
+            if definition != parent_definition:
+                function_node = snapshots.load(definition) if output is not None else ast.parse(definition).body[0]
+                parent = with_definition(host_tree, function_node, node_name, node_type)
+                parent_definition = definition
+                host.set_base_code(parent)
+            host.seed_random(seed)
+            # the mutation's own chatter (mutType, simplification) is not part of the candidate's output
+            with contextlib.redirect_stdout(io.StringIO()):
+                if output is not None:
+                    # decoding a private copy from the snapshot is cheaper than spawn_child()'s deepcopy of parent
+                    child = with_definition(host_tree, snapshots.load(definition), node_name, node_type)
+                    child = host.spawn_child(child, node_name, node_type, in_place=True)
+                else:
+                    child = host.spawn_child(parent, node_name, node_type)
+                function_node = host.find_function_node(child, node_name, node_type)
+                if output is None or require_source:
+                    source = ast.unparse(function_node)
+                else:
+                    source = ast.Module(body=[function_node], type_ignores=[])
+        except Exception as e:
+            conn.send((Verdict(SYNTAX, type(e).__name__, '', time.perf_counter() - start), None))
+            continue
+        verdict = evaluate_function_source((host_name, node_name, source))
+        if output is None:
+            conn.send((verdict, source))
+        elif verdict.status != OK:
+            # only a child that ran cleanly can be kept; of any other the supervisor only asks whether it was made
+            conn.send((verdict, b''))
+        else:
+            data = CompactTree.from_ast(function_node).to_bytes(narrow=False)
+            length = region.write(job[3], data)
+            conn.send((verdict, data if length is None else length))
+    if output is not None:
+        snapshots.close()
+        region.close()
+
+
+class _Worker:
+
+    def __init__(self, epoch, host_name, node_name, node_type, memory_limit, slots=None, require_source=False):
+        self.conn, child_conn = Pipe()
+        self.region = output = None
+        if slots is not None:
+            from .sharing import OutputRegion
+            self.region = OutputRegion(slots, create=True)
+            output = (slots, self.region.slot_size, self.region.name)
+        self.process = Process(target=_worker_main,
+                               args=(child_conn, epoch, host_name, node_name, node_type, memory_limit, output,
+                                     require_source), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.sent = 0
+        # [sequence number, job, time started or None, output slot] of the jobs sent and not answered
+        # yet, oldest first
+        self.jobs = deque()
+
+    def send(self, sequence, job):
+        # a worker has at most region.slots jobs unanswered, so the slot is free by the time it comes round
+        slot = self.sent % self.region.slots if self.region is not None else None
+        self.sent += 1
+        self.conn.send(job if slot is None else job + (slot,))
+        self.jobs.append([sequence, job, time.monotonic() if self.ready and not self.jobs else None, slot])
+
+    def take(self, message):
+        """Return the sequence number of the oldest job and its reply, with the child's bytes read out of its slot."""
+        sequence, _, _, slot = self.jobs.popleft()
+        verdict, child = message
+        if isinstance(child, int):
+            child = self.region.read(slot, child)
+        return sequence, (verdict, child)
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        if self.region is not None:
+            self.region.close()
+
+
+class WorkerPool:
+    """
+    Warm worker processes that mutate and run candidates, replaced when they crash or hang.
+
+    :param host: The quine module; workers reach it as sys.modules[host.__name__].
+    :param workers: Number of worker processes; all cores by default.
+    :param timeout: Wall-clock seconds a job may take once a worker starts it, or None.
+    :param memory_limit: Bytes of additional address space a worker may map (RLIMIT_AS), or None.
+    :param backlog: Jobs queued per worker beyond the one it is running.
+    :param shared: Jobs name a snapshot published with ast_liv.sharing.SnapshotPublisher instead
+        of holding a definition, and results carry the child's compact bytes, returned by the
+        worker through its output region.
+    :param require_source: With shared, run children from their unparsed source rather than their
+        tree, so that every child kept can be written out; for drivers that write or store the
+        generations they keep.
+    """
+
+    def __init__(self, host, workers=None, timeout=2.0, memory_limit=512 * 2 ** 20, backlog=1, shared=False,
+                 require_source=False, node_name='evolved_function', node_type=ast.FunctionDef):
+        # advanced by the driver whenever the jobs already handed out have become useless
+        self.epoch = Value('Q', 0, lock=False)
+        self.args = (self.epoch, host.__name__, node_name, node_type, memory_limit, 1 + backlog if shared else None,
+                     require_source)
+        self.timeout = timeout
+        self.backlog = backlog
+        self.restarts = 0
+        self._workers = [_Worker(*self.args) for _ in range(max(1, workers or os.cpu_count() or 1))]
+        self._sequence = 0
+        # results that arrived before the ones handed out earlier, by sequence number
+        self._done = {}
+        self._next = 0
+        while not all(worker.ready for worker in self._workers):
+            self._poll(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._workers)
+
+    @property
+    def capacity(self):
+        """Jobs that may be outstanding at once."""
+        return len(self._workers) * (1 + self.backlog)
+
+    @property
+    def outstanding(self):
+        return self._sequence - self._next
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=1)
+            worker.kill()
+        self._workers = []
+
+    def submit(self, definition, seed):
+        """
+        Hand a job, a parent definition (or snapshot name) to mutate after seeding with seed, to the least loaded
+        ready worker, waiting for one to have room if all are busy, and return its sequence number.
+        Only `capacity` jobs may be outstanding; take results with next_result() to make room.
+        """
+        if self.outstanding >= self.capacity:
+            raise ValueError(f'{self.outstanding} jobs are outstanding; take their results first')
+        while True:
+            ready = [worker for worker in self._workers if worker.ready and len(worker.jobs) <= self.backlog]
+            if ready:
+                break
+            self._poll(self._deadline())
+        worker = min(ready, key=lambda worker: len(worker.jobs))
+        sequence = self._sequence
+        self._sequence += 1
+        worker.send(sequence, (self.epoch.value, definition, seed))
+        return sequence
+
+    def advance(self):
+        """Mark every job handed out so far as stale; workers skip those they have not started."""
+        self.epoch.value += 1
+
+    def next_result(self):
+        """
+        Wait for the oldest outstanding job and return its (verdict, definition): definition is the
+        child's (its compact bytes when shared), or None when the mutation itself failed or the
+        worker crashed or hung. Both are None for a job skipped after advance().
+        """
+        if self.outstanding == 0:
+            raise ValueError('No job is outstanding')
+        while self._next not in self._done:
+            self._poll(self._deadline())
+        self._next += 1
+        return self._done.pop(self._next - 1)
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        started = [worker.jobs[0][2] for worker in self._workers if worker.jobs and worker.jobs[0][2] is not None]
+        return min(started) + self.timeout if started else None
+
+    def _poll(self, deadline):
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        ready = wait([worker.conn for worker in self._workers], timeout=timeout)
+        for worker in list(self._workers):
+            if worker.conn in ready:
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join()
+                    self._fail(worker, Verdict(CRASH, f'exit code {worker.process.exitcode}', '', 0.0))
+                    continue
+                if message == READY:
+                    worker.ready = True
+                else:
+                    sequence, result = worker.take(message)
+                    self._done[sequence] = result
+                # the next queued job starts now
+                if worker.jobs:
+                    worker.jobs[0][2] = time.monotonic()
+            elif (self.timeout is not None and worker.jobs and worker.jobs[0][2] is not None
+                  and time.monotonic() - worker.jobs[0][2] >= self.timeout):
+                self._fail(worker, Verdict(TIMEOUT, 'wall', '', self.timeout))
+
+    def _fail(self, worker, verdict):
+        """Report the worker's current job with verdict and replace the worker, handing it the jobs queued behind."""
+        self._done[worker.jobs.popleft()[0]] = (verdict, None)
+        worker.kill()
+        replacement = _Worker(*self.args)
+        for sequence, job, _, _ in worker.jobs:
+            replacement.send(sequence, job)
+        self._workers[self._workers.index(worker)] = replacement
+        self.restarts += 1
+
+
+def supervise(host, generations=None, workers=None, timeout=2.0, memory_limit=512 * 2 ** 20, backlog=1,
+              start_index=0, write_files=False, mutTry=5, store=None, shared=False, node_name='evolved_function',
+              node_type=ast.FunctionDef):
+    """
+    Evolve the host's evolved_function for `generations` steps (forever with None) on a WorkerPool.
+
+    :param host: The quine module.
+    :param write_files: Write every kept generation to quine_ast_liv_{index}.py, as the os.execl
+        chain does.
+    :param store: An ast_liv.store.GenerationStore recording every kept generation.
+    :param shared: Share parents and children with the workers through shared memory.
+    :return: The list of definitions making up the final lineage, start_index first: their
+        sources, or with shared their ast_liv.compact bytes.
+    """
+
+    def definition_node(definition):
+        if shared:
+            return CompactTree.from_bytes(definition).to_ast()
+        return ast.parse(definition).body[0]
+
+    host_tree = ast.parse(host.base_code)
+    root_node = host.find_function_node(host_tree, node_name, node_type)
+    root = CompactTree.from_ast(root_node).to_bytes(narrow=False) if shared else ast.unparse(root_node)
+    lineage = [root]
+    if store is not None:
+        records = [store.add(start_index, root_node, source=None if shared else root)]
+    if shared:
+        from .sharing import SnapshotPublisher
+        snapshots = SnapshotPublisher()
+    unparser = host.ModuleUnparser()
+    step = 0
+    failures = 0
+    mutants = 0
+    invalid = 0
+    stale = 0
+    start_time = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        pool = stack.enter_context(WorkerPool(host, workers, timeout, memory_limit, backlog, shared,
+                                              write_files or store is not None, node_name, node_type))
+        if shared:
+            stack.callback(snapshots.close)
+        print(f'Supervisor: {len(pool)} workers ready in {time.perf_counter() - start_time:.3f}s')
+        # the parent definition of every outstanding job, oldest first; a copy of the parent is the
+        # same module, so jobs stay valid across generations that do not change the definition
+        parents = deque()
+        while generations is None or step < generations:
+            while pool.outstanding < pool.capacity:
+                parents.append(lineage[-1])
+                pool.submit(snapshots.publish(lineage[-1]) if shared else lineage[-1], random.getrandbits(64))
+            verdict, definition = pool.next_result()
+            parent = parents.popleft()
+            if shared and parent not in parents and parent != lineage[-1]:
+                # no job left needs it; a revert to it publishes it again
+                snapshots.retain(set(parents) | {lineage[-1]})
+            if parent != lineage[-1]:
+                stale += 1
+                continue
+            mutants += 1
+            index = start_index + len(lineage)
+            if verdict.status == SYNTAX and definition is not None:
+                invalid += 1
+                definition = lineage[-1]
+            elif verdict.status != OK:
+                if verdict.status == SYNTAX:
+                    invalid += 1
+                print(f'Mutation attempt {failures + 1} failed: {verdict.status} {verdict.error}')
+                failures += 1
+                if failures >= mutTry:
+                    failures = 0
+                    if len(lineage) > 1:
+                        if lineage.pop() != lineage[-1]:
+                            pool.advance()
+                        if store is not None:
+                            records.pop()
+                    print(f'Mutation failed after {mutTry} attempts. '
+                          f'Reverting to generation {start_index + len(lineage) - 1}.')
+                    step += 1
+                    host.profiler.end_generation(index)
+                continue
+            step += 1
+            failures = 0
+            if definition != lineage[-1]:
+                pool.advance()
+            lineage.append(definition)
+            print(verdict.output, end='')
+            print('Generation:', index)
+            if store is not None or write_files:
+                function_node = definition_node(definition)
+            if store is not None:
+                records.append(store.add(index, function_node, parent=records[-1],
+                                         source=None if shared else definition))
+            if write_files:
+                new_source = unparser.unparse(with_definition(host_tree, function_node, node_name, node_type))
+                with host.profiler.phase('write'):
+                    with open(f'quine_ast_liv_{index}.py', 'w') as f:
+                        f.write(new_source)
+            host.profiler.end_generation(index)
+        restarts = pool.restarts
+    elapsed = time.perf_counter() - start_time
+    print(f'{step} generations in {elapsed:.3f}s ({step / elapsed if elapsed else 0:.1f} generations/sec)')
+    if mutants:
+        print(f'valid mutants: {mutants - invalid}/{mutants} ({(mutants - invalid) / mutants:.1%})')
+    print(f'supervisor: {stale} results for replaced parents discarded, {restarts} workers restarted')
+    if shared:
+        print(f'shared memory: {snapshots.published} parents published')
+    return lineage
@@ -0,0 +1,170 @@
+"""
+Constant tuning: perturb every numeric constant of evolved_function at once, for a whole batch
+of variants, and run them all through one compiled template.
+
+The perturbation is the one mutate_ast applies (each int or float constant moves by -2, -1, +1
+or +2), but instead of producing, compiling and running one module per variant, the definition
+is compiled once with every constant replaced by a read from __int_constants__[i] or
+__float_constants__[j], and each variant only rebinds those two rows before calling it.
+With NumPy the batch of perturbed rows is drawn as two matrices; without it, with random.
+"""
+import ast
+import contextlib
+import copy
+import io
+import math
+import random
+import time
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:  # optional; perturbations are then drawn one by one
+    numpy = None
+
+# The offsets mutate_ast adds to a numeric constant.
+DELTAS = (-2, -1, 1, 2)
+INT_CONSTANTS = '__int_constants__'
+FLOAT_CONSTANTS = '__float_constants__'
+# NumPy rows are int64; constants beyond this are perturbed in Python instead.
+INT64_SAFE = 2 ** 62
+
+TuningResult = namedtuple('TuningResult', ['ints', 'floats', 'output', 'runtime', 'coverage', 'survivors', 'batch',
+                                           'elapsed'])
+
+
+class _ConstantSlots(ast.NodeTransformer):
+    """
+    Find the tunable constants of a definition in a fixed order, optionally replacing each with
+    replace(node, row, slot), where row is INT_CONSTANTS or FLOAT_CONSTANTS and slot the
+    constant's position in that row. Bools are not numbers here, and constants inside match
+    patterns must stay literals.
+    """
+
+    def __init__(self, replace=None):
+        self.replace = replace
+        self.constants = []
+        self.slots = {INT_CONSTANTS: 0, FLOAT_CONSTANTS: 0}
+
+    def visit_Constant(self, node):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return node
+        self.constants.append(node)
+        if self.replace is None:
+            return node
+        row = INT_CONSTANTS if isinstance(value, int) else FLOAT_CONSTANTS
+        slot = self.slots[row]
+        self.slots[row] += 1
+        return ast.copy_location(self.replace(node, row, slot), node)
+
+    def visit_pattern(self, node):
+        return node
+
+    visit_MatchValue = visit_MatchSingleton = visit_MatchSequence = visit_MatchMapping = visit_pattern
+    visit_MatchClass = visit_MatchStar = visit_MatchAs = visit_MatchOr = visit_pattern
+
+
+def numeric_constants(function_node):
+    """Return the tunable Constant nodes of a definition, in template slot order."""
+    slots = _ConstantSlots()
+    slots.visit(function_node)
+    return slots.constants
+
+
+def build_template(function_node):
+    """Return a copy of the definition whose numeric constants read from the constant rows."""
+    def read_slot(node, row, slot):
+        return ast.Subscript(value=ast.Name(id=row, ctx=ast.Load()), slice=ast.Constant(value=slot), ctx=ast.Load())
+
+    return ast.fix_missing_locations(_ConstantSlots(read_slot).visit(copy.deepcopy(function_node)))
+
+
+def apply_constants(function_node, ints, floats):
+    """
+    Write one row of tuned values into a definition, in place, and return it. A negative value
+    becomes -constant: a bare negative Constant would unparse as -2 ** 3 and change meaning.
+    """
+    rows = {INT_CONSTANTS: ints, FLOAT_CONSTANTS: floats}
+
+    def write_slot(node, row, slot):
+        value = rows[row][slot]
+        if math.copysign(1, value) < 0:
+            return ast.UnaryOp(op=ast.USub(), operand=ast.Constant(value=-value))
+        return ast.Constant(value=value)
+
+    return ast.fix_missing_locations(_ConstantSlots(write_slot).visit(function_node))
+
+
+def perturb(ints, floats, batch):
+    """
+    Return (int_rows, float_rows): batch perturbed copies of each constant vector, as lists.
+    """
+    if numpy is None:
+        return ([[value + random.choice(DELTAS) for value in ints] for _ in range(batch)],
+                [[value + random.choice(DELTAS) for value in floats] for _ in range(batch)])
+    rng = numpy.random.default_rng(random.getrandbits(64))
+    deltas = numpy.array(DELTAS)
+    if all(abs(value) < INT64_SAFE for value in ints):
+        int_rows = (numpy.array(ints, dtype=numpy.int64) + rng.choice(deltas, size=(batch, len(ints)))).tolist()
+    else:
+        int_rows = [[value + random.choice(DELTAS) for value in ints] for _ in range(batch)]
+    float_rows = (numpy.array(floats, dtype=numpy.float64) + rng.choice(deltas, size=(batch, len(floats)))).tolist()
+    return int_rows, float_rows
+
+
+def tune_constants(host, tree, node_name='evolved_function', node_type=ast.FunctionDef, batch=64, coverage=False):
+    """
+    Run batch constant-perturbed variants of a tree's definition and return the first one that
+    ran cleanly, as a TuningResult, or None if the definition has no numeric constants.
+
+    Variants run in this process, in a copy of the host's globals, with their output captured,
+    so this is no place for a sandboxed run. result.output and result.runtime are those of the
+    chosen variant's run; result.ints and result.floats are None when no variant survived.
+
+    :param host: The quine module providing find_function_node and the globals to run in.
+    :param batch: Number of perturbed variants to draw and run.
+    :param coverage: Number the template's statements with ast_liv.coverage.number_statements()
+        and record in result.coverage the lines the chosen variant executed.
+    """
+    start = time.perf_counter()
+    node = host.find_function_node(tree, node_name, node_type)
+    constants = numeric_constants(node) if node is not None else []
+    if not constants:
+        return None
+    ints = [constant.value for constant in constants if isinstance(constant.value, int)]
+    floats = [constant.value for constant in constants if isinstance(constant.value, float)]
+    template = ast.Module(body=[build_template(node)], type_ignores=[])
+    if coverage:
+        from .coverage import number_statements, record_lines
+        number_statements(template.body[0])
+    with host.profiler.phase('compile'):
+        code_object = compile(template, f'<{node_name} template>', 'exec')
+    namespace = dict(vars(host))
+    exec(code_object, namespace)
+    function = namespace[node_name]
+    with host.profiler.phase('generate'):
+        int_rows, float_rows = perturb(ints, floats, batch)
+    chosen = None
+    survivors = 0
+    with host.profiler.phase('exec'):
+        for int_row, float_row in zip(int_rows, float_rows):
+            namespace[INT_CONSTANTS] = int_row
+            namespace[FLOAT_CONSTANTS] = float_row
+            output = io.StringIO()
+            started = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(output):
+                    if coverage and chosen is None:
+                        executed = frozenset(record_lines(function))
+                    else:
+                        function()
+            except Exception:
+                continue
+            survivors += 1
+            if chosen is None:
+                chosen = (int_row, float_row, output.getvalue(), time.perf_counter() - started,
+                          executed if coverage else None)
+    if chosen is None:
+        chosen = (None, None, '', 0.0, None)
+    return TuningResult(*chosen, survivors, batch, time.perf_counter() - start)
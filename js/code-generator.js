@@ -6,14 +6,16 @@ async function initPyodide() {
   });
 }
 
-window.pyodide = await initPyodide();
+// astgen.py is the quine's generator on its own (see scripts/generate_astgen_module.py);
+// fetch it while Pyodide loads
+const [pyodide, moduleText] = await Promise.all([
+  initPyodide(),
+  fetch("astgen.py").then((resp) => resp.text()),
+]);
+window.pyodide = pyodide;
 
-// load the Python module into Pyodide's virtual filesystem
-{
-  const resp = await fetch("quine_ast_liv_0.py");
-  const text = await resp.text();
-  window.pyodide.FS.writeFile("quine_ast_liv_0.py", text);
-}
+// load the Python module into Pyodide's virtual filesystem; it is imported on the first click
+window.pyodide.FS.writeFile("astgen.py", moduleText);
 
 const generateBtn = document.getElementById("generate-btn");
 const output = document.getElementById("output");
@@ -21,10 +23,10 @@ const output = document.getElementById("output");
 generateBtn.addEventListener("click", async () => {
   const code = `
 import ast
-from quine_ast_liv_0 import generate_random_ast
+from astgen import generate_random_ast
 node = generate_random_ast(3)
 ast.unparse(node)
 `;
   const result = await window.pyodide.runPythonAsync(code);
   output.textContent = result;
-});
\ No newline at end of file
+});
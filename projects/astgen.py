@@ -0,0 +1,1012 @@
+"""
+The random AST generator of quine_ast_liv_0.py, without the quine.
+
+Generated by scripts/generate_astgen_module.py from quine_ast_liv_0.py; do not edit. Importing
+it reads no files: identifiers are drawn from IDENTIFIER_COUNTS, counted from the quine when
+this file was generated, exactly as the quine draws them from its own source.
+
+    import ast, astgen
+    print(ast.unparse(astgen.generate_random_ast(3)))
+"""
+import ast
+import keyword
+import random
+import string
+
+
+def iter_nodes(node, node_class=None):
+    """
+    Yield node and every AST node below it depth-first, in field order, optionally only those
+    that are instances of node_class (a class or tuple of classes).
+
+    The walk keeps an explicit stack of the nodes still to visit instead of recursing, so deep
+    trees never raise RecursionError, and it holds only the unvisited siblings along the current
+    path, not lists per level. A node's children are read when the walk resumes after yielding
+    it, so the caller may replace its fields and the walk descends into the new ones.
+    """
+    stack = [node]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        sub = pop()
+        if node_class is None or isinstance(sub, node_class):
+            yield sub
+        for field in reversed(sub._fields):
+            value = getattr(sub, field, None)
+            if isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.AST):
+                        push(item)
+            elif isinstance(value, ast.AST):
+                push(value)
+
+
+def count_identifiers_from_code(base_code) -> dict:
+    """
+    Counts every identifier occurrence in the given Python source code.
+
+    Accepts either a source string or an already parsed ast.Module, so callers that
+    keep the lineage in memory do not have to unparse it first.
+
+    :param base_code: A string containing Python source code, or a parsed AST.
+    :return: A dict mapping identifier name to the number of times it occurs.
+    """
+    tree = base_code if isinstance(base_code, ast.AST) else ast.parse(base_code)
+    counts = {}
+    # in the order a recursive visitor meets them, which is the order names are drawn from
+    for node in iter_nodes(tree, (ast.Name, ast.FunctionDef, ast.ClassDef, ast.arg)):
+        if isinstance(node, ast.Name):
+            name = node.id
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        else:
+            name = node.name
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class IdentifierPool:
+    """
+    Identifier names of one source revision, ready for O(1) random draws.
+
+    The source is parsed once when the pool is built, unless it is given as the
+    {name: count} dict count_identifiers_from_code() would return for it. `names` holds
+    every distinct identifier and `weighted_names` repeats each one as often as it
+    occurs, so a uniform draw from it is a draw weighted by frequency.
+    """
+
+    def __init__(self, base_code):
+        self.source = base_code
+        self.counts = dict(base_code) if isinstance(base_code, dict) else count_identifiers_from_code(base_code)
+        self.names = list(self.counts)
+        self.weighted_names = [name for name, count in self.counts.items() for _ in range(count)]
+        self.draws = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def draw(self, weighted=False):
+        self.draws += 1
+        return draws.choice(self.weighted_names if weighted else self.names)
+
+
+_identifier_pool = None
+
+
+weighted_names = False
+
+
+class NullProfiler:
+    """
+    The profiler in effect unless one is installed with set_profiler(). Every hook does nothing,
+    and phase() hands back the profiler itself as an empty context manager, so instrumented code
+    costs a method call per phase and can stay in place for production runs.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+    def generated(self, node):
+        pass
+
+    def end_generation(self, index):
+        pass
+
+    def close(self):
+        pass
+
+
+profiler = NullProfiler()
+
+
+class RandomDraws:
+    """
+    Where random_expr(), random_stmt() and random_name() get their random decisions from, unless
+    another source is installed with set_draws(). Every draw comes straight from `random`: the
+    methods are the module's own functions, so going through this object costs nothing.
+    """
+
+    def __init__(self):
+        self.random = random.random
+        self.randint = random.randint
+        self.choice = random.choice
+        self.choices = random.choices
+        self.uniform = random.uniform
+
+    def reset(self):
+        """Drop decisions drawn ahead of time; nothing is, here."""
+
+
+draws = RandomDraws()
+
+
+def set_draws(new_draws):
+    """
+    Install new_draws (e.g. an ast_liv.draws.BlockDraws) as the source of generator decisions,
+    or restore the default when given None.
+    """
+    global draws
+    draws = new_draws if new_draws is not None else RandomDraws()
+
+
+def seed_random(seed=None):
+    """Seed `random`, dropping any decisions the draw source took from its previous state."""
+    random.seed(seed)
+    draws.reset()
+
+
+def set_base_code(code):
+    """
+    Point random_name() at a new source revision (a source string or a parsed ast.Module).
+    The identifier pool is rebuilt lazily on the next draw.
+    """
+    global base_code
+    base_code = code
+
+
+def get_identifier_pool():
+    """
+    Return the identifier pool for the current base_code, rebuilding it only when
+    base_code has been replaced by a different revision.
+    """
+    global _identifier_pool
+    if _identifier_pool is None or _identifier_pool.source is not base_code:
+        _identifier_pool = IdentifierPool(base_code)
+    return _identifier_pool
+
+
+def random_name():
+    profiler.count('names_drawn')
+    pool = get_identifier_pool()
+    if pool.names and draws.random() < 0.9:
+        return pool.draw(weighted_names)
+    else:
+        length = draws.randint(3, 8)
+        name = draws.choice(string.ascii_lowercase)
+        name += ''.join(draws.choices(NAME_CHARACTERS, k=length - 1))
+        return name
+
+
+class Scope:
+    """
+    Where generated code is going to live, for the grammar-directed generator.
+
+    A Scope knows its kind ('module', 'class', 'function', 'lambda' or 'comprehension'), whether it
+    is the body of an async def, and which names it binds, uses and declares global/nonlocal.
+    random_expr() and random_stmt() given a scope only emit constructs that compile there, draw
+    loaded names from bound ones where they can, and record every name they bind or use.
+    """
+
+    def __init__(self, kind='module', parent=None, is_async=False):
+        self.kind = kind
+        self.parent = parent
+        self.is_async = is_async
+        self.bound = set()
+        self.used = set()
+        self.declared = set()
+
+    @classmethod
+    def of(cls, node, parent=None):
+        """
+        Scope for the body of an existing def, class, lambda or module, seeded with every name it
+        already binds, uses or declares, so that new global/nonlocal statements never conflict.
+        """
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            kind = 'function'
+        elif isinstance(node, ast.Lambda):
+            kind = 'lambda'
+        elif isinstance(node, ast.ClassDef):
+            kind = 'class'
+        else:
+            kind = 'module'
+        scope = cls(kind, parent, isinstance(node, ast.AsyncFunctionDef))
+        # Uses anywhere below count (a global statement must not follow them), but bindings and
+        # declarations only count in the scope's own body, not inside nested scopes.
+        scope.used.update(sub.id for sub in iter_nodes(node, ast.Name))
+        scope.used.update(name for sub in iter_nodes(node, (ast.Global, ast.Nonlocal)) for name in sub.names)
+        stack = [node]
+        while stack:
+            sub = stack.pop()
+            if sub is not node and isinstance(sub, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                scope.bound.add(sub.name)
+                continue
+            if sub is not node and isinstance(sub, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp,
+                                                    ast.GeneratorExp)):
+                continue
+            if isinstance(sub, ast.Name) and not isinstance(sub.ctx, ast.Load):
+                scope.bound.add(sub.id)
+            elif isinstance(sub, ast.arg):
+                scope.bound.add(sub.arg)
+            elif isinstance(sub, (ast.Global, ast.Nonlocal)):
+                scope.declared.update(sub.names)
+            elif isinstance(sub, ast.alias):
+                scope.bound.add((sub.asname or sub.name).split('.')[0])
+            elif isinstance(sub, ast.ExceptHandler) and sub.name:
+                scope.bound.add(sub.name)
+            stack.extend(ast.iter_child_nodes(sub))
+        scope.used |= scope.bound | scope.declared
+        return scope
+
+    def child(self, kind, is_async=False):
+        return Scope(kind, self, is_async)
+
+    def snapshot(self):
+        return set(self.bound), set(self.used), set(self.declared)
+
+    def restore(self, snapshot):
+        """Forget what was generated since snapshot(), e.g. for a candidate that was thrown away."""
+        self.bound, self.used, self.declared = snapshot
+
+    def use(self, name):
+        # Lambdas and comprehensions are nested scopes, but a global statement in the enclosing
+        # scope still must not follow a use of the name inside them.
+        scope = self
+        while scope is not None:
+            scope.used.add(name)
+            if scope.kind not in ('lambda', 'comprehension'):
+                break
+            scope = scope.parent
+
+    def hidden_names(self):
+        """
+        Names declared global or nonlocal in the block this scope's code is checked in. Code added
+        to an existing body may land before the declaration, so these are never drawn.
+        """
+        names = set(self.declared)
+        scope = self
+        while scope.kind in ('lambda', 'comprehension') and scope.parent is not None:
+            scope = scope.parent
+            names |= scope.declared
+        return names
+
+    @property
+    def can_yield(self):
+        return self.kind == 'function' and not self.is_async
+
+    @property
+    def can_assign_expr(self):
+        # A walrus is refused anywhere in a comprehension, even inside a lambda there.
+        scope = self
+        while scope.kind == 'lambda':
+            scope = scope.parent
+        return scope is None or scope.kind != 'comprehension'
+
+    @property
+    def can_await(self):
+        return self.is_async and self.kind in ('function', 'comprehension')
+
+    def visible_names(self):
+        names = set(self.bound)
+        scope = self.parent
+        while scope is not None:
+            if scope.kind != 'class':
+                names |= scope.bound
+            scope = scope.parent
+        return names
+
+    def nonlocal_candidates(self):
+        """Names bound in an enclosing function that this scope has not touched yet."""
+        if self.kind != 'function':
+            return []
+        names = set()
+        # a global or nonlocal statement on the way out hides the name from nested scopes
+        hidden = set()
+        scope = self.parent
+        while scope is not None and scope.kind != 'module':
+            hidden |= scope.declared
+            if scope.kind == 'function':
+                names |= scope.bound - hidden
+            scope = scope.parent
+        return sorted(names - self.used - self.bound - self.declared)
+
+    def safe_name(self):
+        hidden = self.hidden_names()
+        name = random_name()
+        while keyword.iskeyword(name) or name == '__debug__' or name in hidden:
+            name = random_name()
+        return name
+
+    def fresh_name(self):
+        name = self.safe_name()
+        while name in self.used:
+            name = self.safe_name()
+        self.use(name)
+        return name
+
+    def load_name(self):
+        visible = self.visible_names() - self.hidden_names()
+        if visible and draws.random() < 0.7:
+            name = draws.choice(sorted(visible))
+        else:
+            name = self.safe_name()
+        self.use(name)
+        return name
+
+    def store_name(self):
+        bound = self.bound - self.hidden_names()
+        if bound and draws.random() < 0.5:
+            name = draws.choice(sorted(bound))
+        else:
+            name = self.safe_name()
+        self.bound.add(name)
+        self.use(name)
+        return name
+
+    def expr_types(self):
+        key = (self.can_assign_expr, self.can_await, self.can_yield)
+        types = _SCOPE_EXPR_TYPES.get(key)
+        if types is None:
+            types = [t for t in EXPR_TYPES if t not in ('await', 'starred', 'slice')]
+            if not self.can_assign_expr:
+                types.remove('namedexpr')
+            if self.can_await:
+                types.append('await')
+            if self.can_yield:
+                types.append('yield')
+            types = _SCOPE_EXPR_TYPES[key] = tuple(types)
+        return types
+
+    def stmt_types(self):
+        in_function = self.kind == 'function'
+        key = (in_function, in_function and self.is_async, in_function and bool(self.nonlocal_candidates()))
+        types = _SCOPE_STMT_TYPES.get(key)
+        if types is None:
+            types = [t for t in STMT_TYPES if t not in ('async_for', 'async_with', 'return', 'nonlocal')]
+            if in_function:
+                types.append('return')
+                if self.is_async:
+                    types += ['async_for', 'async_with']
+                if key[2]:
+                    types.append('nonlocal')
+            types = _SCOPE_STMT_TYPES[key] = tuple(types)
+        return types
+
+
+EXPR_TYPES = (
+    'binop', 'boolop', 'unaryop', 'compare', 'call', 'attribute', 'subscript',
+    'ifexp', 'lambda', 'list', 'tuple', 'dict', 'set', 'listcomp', 'setcomp',
+    'dictcomp', 'genexp', 'namedexpr', 'await', 'joinedstr', 'bytes',
+    'ellipsis', 'starred', 'slice'
+)
+
+
+EXPR_TYPES_IN_FUNCTION = EXPR_TYPES + ('yield',)
+
+
+STMT_TYPES = (
+    'assign', 'augassign', 'if', 'for', 'async_for', 'while',
+    'funcdef', 'async_funcdef', 'annassign', 'class',
+    'with', 'async_with', 'try', 'expr', 'return',
+    'import', 'importfrom', 'global', 'delete',
+    'assert', 'raise', 'nonlocal', 'match'
+)
+
+
+# Leaf statements by (in_loop, in_function).
+SIMPLE_STMT_TYPES = {
+    (in_loop, in_function): (('break', 'continue') if in_loop else ()) + (('return',) if in_function else ()) + ('pass', 'expr')
+    for in_loop in (False, True) for in_function in (False, True)
+}
+
+
+# Expression and statement types a Scope allows, by the properties they depend on.
+_SCOPE_EXPR_TYPES = {}
+
+
+_SCOPE_STMT_TYPES = {}
+
+
+# Operators are stateless and shared between nodes, as they are in parsed trees.
+BINARY_OPERATORS = (ast.Add(), ast.Sub(), ast.Mult(), ast.Div(), ast.Mod(), ast.Pow(), ast.BitAnd(), ast.BitOr(),
+                    ast.BitXor(), ast.LShift(), ast.RShift(), ast.FloorDiv())
+
+
+BOOLEAN_OPERATORS = (ast.And(), ast.Or())
+
+
+UNARY_OPERATORS = (ast.UAdd(), ast.USub(), ast.Not(), ast.Invert())
+
+
+COMPARISON_OPERATORS = (ast.Eq(), ast.NotEq(), ast.Lt(), ast.Gt(), ast.LtE(), ast.GtE(), ast.Is(), ast.IsNot(),
+                        ast.In(), ast.NotIn())
+
+
+NAME_CHARACTERS = string.ascii_lowercase + string.digits
+
+
+# Kinds of leaf constant, each as likely as the others.
+CONSTANT_KINDS = ('int', 'float', 'str', True, False, None)
+
+
+_FUNCTION_HAS_TYPE_PARAMS = 'type_params' in ast.FunctionDef._fields
+
+
+_FUNCTION_HAS_TYPE_COMMENT = 'type_comment' in ast.FunctionDef._fields
+
+
+_CLASS_HAS_TYPE_PARAMS = 'type_params' in ast.ClassDef._fields
+
+
+_WITH_HAS_TYPE_COMMENT = 'type_comment' in ast.With._fields
+
+
+def load_name(scope):
+    return random_name() if scope is None else scope.load_name()
+
+
+def store_name(scope):
+    return random_name() if scope is None else scope.store_name()
+
+
+def maybe_starred(node, scope):
+    """In grammar mode, occasionally unpack an element of a call, list, tuple or set."""
+    if scope is not None and draws.random() < 0.1:
+        return ast.Starred(value=node, ctx=ast.Load())
+    return node
+
+
+def random_expr(max_depth, in_function=False, scope=None):
+    """
+    Recursively generate a random ast.expr node.
+
+    With a Scope, the grammar-directed mode is used: only expressions that compile at that
+    position are chosen (no stray await, yield, starred or slice nodes) and names come from it.
+    """
+    if scope is not None:
+        in_function = scope.can_yield
+    if max_depth <= 0:
+        if draws.random() < 0.5:
+            # only the kind that was picked is drawn
+            value = draws.choice(CONSTANT_KINDS)
+            if value == 'int':
+                value = draws.randint(-100, 100)
+            elif value == 'float':
+                value = draws.uniform(-100, 100)
+            elif value == 'str':
+                value = ''.join(draws.choices(string.ascii_lowercase, k=5))
+            if scope is not None and isinstance(value, (int, float)) and value < 0:
+                # As parsed code has it: unparsed as an operand (await -1, -1 ** 2), a negative
+                # constant is not parenthesised, and reads back differently or not at all.
+                return ast.UnaryOp(op=UNARY_OPERATORS[1], operand=ast.Constant(value=-value))
+            return ast.Constant(value=value)
+        else:
+            return ast.Name(id=load_name(scope), ctx=ast.Load())
+    if scope is None:
+        expr_type = draws.choice(EXPR_TYPES_IN_FUNCTION if in_function else EXPR_TYPES)
+    else:
+        expr_type = draws.choice(scope.expr_types())
+    if expr_type == 'binop':
+        left = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        right = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        op = draws.choice(BINARY_OPERATORS)
+        return ast.BinOp(left=left, op=op, right=right)
+    elif expr_type == 'boolop':
+        op = draws.choice(BOOLEAN_OPERATORS)
+        values = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(draws.randint(2, 3))]
+        return ast.BoolOp(op=op, values=values)
+    elif expr_type == 'unaryop':
+        op = draws.choice(UNARY_OPERATORS)
+        operand = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.UnaryOp(op=op, operand=operand)
+    elif expr_type == 'compare':
+        left = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        num_ops = draws.randint(1, 3)
+        ops = []
+        comparators = []
+        for _ in range(num_ops):
+            ops.append(draws.choice(COMPARISON_OPERATORS))
+            comparators.append(random_expr(max_depth - 1, in_function=in_function, scope=scope))
+        return ast.Compare(left=left, ops=ops, comparators=comparators)
+    elif expr_type == 'call':
+        func_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if isinstance(func_expr, ast.Constant):
+            func_expr = ast.Name(id=load_name(scope), ctx=ast.Load())
+        args = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 2))]
+        keywords = []
+        if draws.random() < 0.5:
+            kw_name = random_name() if scope is None else scope.safe_name()
+            kw_value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            keywords.append(ast.keyword(arg=kw_name, value=kw_value))
+        return ast.Call(func=func_expr, args=args, keywords=keywords)
+    elif expr_type == 'attribute':
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Attribute(value=value, attr=random_name() if scope is None else scope.safe_name(), ctx=ast.Load())
+    elif expr_type == 'subscript':
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if scope is not None and draws.random() < 0.3:
+            index = ast.Slice(*[random_expr(max_depth - 1, scope=scope) if draws.random() < 0.5 else None for _ in range(3)])
+        else:
+            index = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Subscript(value=value, slice=index, ctx=ast.Load())
+    elif expr_type == 'ifexp':
+        cond = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        orelse_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.IfExp(test=cond, body=body_expr, orelse=orelse_expr)
+    elif expr_type == 'lambda':
+        num_args = draws.randint(0, 2)
+        if scope is None:
+            args_list = [ast.arg(arg=random_name(), annotation=None) for _ in range(num_args)]
+            body_scope = None
+        else:
+            body_scope = scope.child('lambda')
+            args_list = [ast.arg(arg=name, annotation=None) for name in {body_scope.store_name(): None for _ in range(num_args)}]
+        lambda_args = ast.arguments(posonlyargs=[], args=args_list, vararg=None, kwonlyargs=[], kw_defaults=[], defaults=[], kwarg=None)
+        body = random_expr(max_depth - 1, in_function=in_function, scope=body_scope)
+        return ast.Lambda(args=lambda_args, body=body)
+    elif expr_type == 'list':
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 3))]
+        return ast.List(elts=elements, ctx=ast.Load())
+    elif expr_type == 'tuple':
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 3))]
+        return ast.Tuple(elts=elements, ctx=ast.Load())
+    elif expr_type == 'dict':
+        n = draws.randint(0, 3)
+        keys = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(n)]
+        values = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(n)]
+        return ast.Dict(keys=keys, values=values)
+    elif expr_type == 'set':
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(1, 3))]
+        return ast.Set(elts=elements)
+    elif expr_type in ('listcomp', 'setcomp', 'dictcomp', 'genexp'):
+        if scope is not None:
+            scope = scope.child('comprehension', is_async=scope.can_await)
+            in_function = False
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if draws.random() < 0.5:
+            if_cond = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            comp = ast.comprehension(target=target, iter=iter_expr, ifs=[if_cond], is_async=0)
+        else:
+            comp = ast.comprehension(target=target, iter=iter_expr, ifs=[], is_async=0)
+        if expr_type == 'listcomp':
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.ListComp(elt=elt, generators=[comp])
+        elif expr_type == 'setcomp':
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.SetComp(elt=elt, generators=[comp])
+        elif expr_type == 'genexp':
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.GeneratorExp(elt=elt, generators=[comp])
+        elif expr_type == 'dictcomp':
+            key = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.DictComp(key=key, value=value, generators=[comp])
+    elif expr_type == 'namedexpr':
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.NamedExpr(target=target, value=value)
+    elif expr_type == 'yield':
+        if draws.random() < 0.5:
+            val = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.Yield(value=val)
+        else:
+            val = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            return ast.YieldFrom(value=val)
+
+    # Extended expression types
+    elif expr_type == 'await':
+        return ast.Await(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
+    elif expr_type == 'joinedstr':
+        fragments = []
+        for _ in range(draws.randint(1, 3)):
+            if draws.random() < 0.5:
+                fragments.append(ast.Constant(value=''.join(draws.choices(string.ascii_lowercase, k=draws.randint(1,5)))))
+            else:
+                # Nested f-strings can run out of quote styles when unparsed, so grammar mode keeps fields flat.
+                fragments.append(ast.FormattedValue(value=random_expr(max_depth - 1 if scope is None else 0, in_function=in_function, scope=scope), conversion=-1))
+        return ast.JoinedStr(values=fragments)
+    elif expr_type == 'bytes':
+        length = draws.randint(1, 4)
+        value = bytes(draws.randint(0, 255) for _ in range(length))
+        return ast.Constant(value=value)
+    elif expr_type == 'ellipsis':
+        return ast.Constant(value=Ellipsis)
+    elif expr_type == 'starred':
+        return ast.Starred(value=random_expr(max_depth - 1, in_function=in_function), ctx=ast.Load())
+    elif expr_type == 'slice':
+        lower = random_expr(max_depth - 1, in_function=in_function)
+        upper = random_expr(max_depth - 1, in_function=in_function)
+        step = random_expr(max_depth - 1, in_function=in_function)
+        return ast.Slice(lower=lower, upper=upper, step=step)
+
+
+def random_stmt(max_depth, in_function=False, in_loop=False, scope=None):
+    """
+    Recursively generate a random ast.stmt node.
+
+    With a Scope, the grammar-directed mode is used: statements that cannot appear in that scope
+    (return outside a function, async for outside an async def, nonlocal without an enclosing
+    binding, ...) are never chosen, and nested bodies get their own child scopes.
+    """
+    if scope is not None:
+        in_function = scope.kind == 'function'
+    if max_depth <= 0:
+        choice = draws.choice(SIMPLE_STMT_TYPES[bool(in_loop), bool(in_function)])
+        if choice == 'break':
+            return ast.Break()
+        elif choice == 'continue':
+            return ast.Continue()
+        elif choice == 'return':
+            if draws.random() < 0.5:
+                return ast.Return(value=None)
+            else:
+                return ast.Return(value=random_expr(0, in_function=in_function, scope=scope))
+        elif choice == 'pass':
+            return ast.Pass()
+        elif choice == 'expr':
+            return ast.Expr(value=random_expr(0, in_function=in_function, scope=scope))
+    if scope is None:
+        stmt_type = draws.choice(STMT_TYPES)
+    else:
+        stmt_type = draws.choice(scope.stmt_types())
+    if stmt_type == 'return' and (not in_function):
+        stmt_type = 'expr'
+    if stmt_type in ('break', 'continue'):
+        stmt_type = 'pass'
+    if stmt_type == 'assign':
+        num_targets = draws.randint(1, 2)
+        targets = [ast.Name(id=store_name(scope), ctx=ast.Store()) for _ in range(num_targets)]
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Assign(targets=targets, value=value)
+    elif stmt_type == 'augassign':
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        op = draws.choice(BINARY_OPERATORS)
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.AugAssign(target=target, op=op, value=value)
+    elif stmt_type == 'if':
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 2)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
+        return ast.If(test=test, body=body, orelse=orelse)
+    elif stmt_type == 'for':
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 1)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
+        return ast.For(target=target, iter=iter_expr, body=body, orelse=orelse)
+    elif stmt_type == 'while':
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 1)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
+        return ast.While(test=test, body=body, orelse=orelse)
+    elif stmt_type in ('funcdef', 'async_funcdef'):
+        name = store_name(scope)
+        args_count = draws.randint(0, 3)
+        if scope is None:
+            params = [ast.arg(arg=random_name(), annotation=None) for _ in range(args_count)]
+            body_scope = None
+        else:
+            body_scope = scope.child('function', is_async=stmt_type == 'async_funcdef')
+            params = [ast.arg(arg=param, annotation=None) for param in {body_scope.store_name(): None for _ in range(args_count)}]
+        arguments = ast.arguments(posonlyargs=[], args=params, vararg=None, kwonlyargs=[], kw_defaults=[], defaults=[], kwarg=None)
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=True, in_loop=False, scope=body_scope) for _ in range(body_count)]
+        if not body:
+            body = [ast.Pass()]
+        if stmt_type == 'async_funcdef':
+            return ast.AsyncFunctionDef(name=name, args=arguments, body=body, decorator_list=[], returns=None)
+        func_node = ast.FunctionDef(name=name, args=arguments, body=body, decorator_list=[], returns=None)
+        if _FUNCTION_HAS_TYPE_PARAMS:
+            func_node.type_params = []
+        if _FUNCTION_HAS_TYPE_COMMENT:
+            func_node.type_comment = None
+        return func_node
+    elif stmt_type == 'class':
+        if scope is None:
+            name = store_name(scope).capitalize()
+        else:
+            # only the capitalised name is bound, so it is drawn and recorded as it is
+            name = scope.safe_name().capitalize()
+            while keyword.iskeyword(name):
+                name = scope.safe_name().capitalize()
+            scope.bound.add(name)
+            scope.use(name)
+        bases = []
+        if draws.random() < 0.5:
+            bases.append(ast.Name(id='object', ctx=ast.Load()))
+            if scope is not None:
+                scope.use('object')
+        body_count = draws.randint(1, 3)
+        body_scope = None if scope is None else scope.child('class')
+        body = [random_stmt(max_depth - 1, in_function=False, in_loop=False, scope=body_scope) for _ in range(body_count)]
+        if not body:
+            body = [ast.Pass()]
+        class_node = ast.ClassDef(name=name, bases=bases, keywords=[], body=body, decorator_list=[])
+        if _CLASS_HAS_TYPE_PARAMS:
+            class_node.type_params = []
+        return class_node
+    elif stmt_type in ('with', 'async_with'):
+        num_items = draws.randint(1, 2)
+        items = []
+        for _ in range(num_items):
+            context_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            if draws.random() < 0.5:
+                optional_vars = ast.Name(id=store_name(scope), ctx=ast.Store())
+            else:
+                optional_vars = None
+            items.append(ast.withitem(context_expr=context_expr, optional_vars=optional_vars))
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
+        if not body:
+            body = [ast.Pass()]
+        if stmt_type == 'async_with':
+            return ast.AsyncWith(items=items, body=body)
+        node = ast.With(items=items, body=body)
+        if _WITH_HAS_TYPE_COMMENT:
+            node.type_comment = None
+        return node
+    elif stmt_type == 'try':
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
+        if not body:
+            body = [ast.Pass()]
+        handlers = []
+        orelse = []
+        finalbody = []
+        if draws.random() < 0.7:
+            num_handlers = draws.randint(1, 2)
+            h_body_counts = []
+            for i in range(num_handlers):
+                exc_type = ast.Name(id='Exception', ctx=ast.Load()) if draws.random() < 0.5 else None
+                if scope is not None and exc_type is None and i < num_handlers - 1:
+                    # A bare except: must be the last handler.
+                    exc_type = ast.Name(id='Exception', ctx=ast.Load())
+                if scope is not None and exc_type is not None:
+                    scope.use('Exception')
+                # a bare except: takes no name, so none is bound for it
+                exc_name = store_name(scope) if draws.random() < 0.5 and (scope is None or exc_type is not None) else None
+                h_body_count = draws.randint(1, 2)
+                h_body = []
+                if scope is None:
+                    h_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(h_body_count)]
+                h_body_counts.append(h_body_count)
+                handlers.append(ast.ExceptHandler(type=exc_type, name=exc_name, body=h_body))
+            if draws.random() < 0.5:
+                else_count = draws.randint(1, 2)
+                orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(else_count)]
+            if scope is not None:
+                # The symbol table visits the else: block before the handlers, so their bodies are
+                # generated after it, or a global there could follow a use of its name in else:.
+                for handler, h_body_count in zip(handlers, h_body_counts):
+                    handler.body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(h_body_count)]
+            for handler in handlers:
+                if not handler.body:
+                    handler.body = [ast.Pass()]
+        if not handlers or draws.random() < 0.5:
+            final_count = draws.randint(1, 2)
+            finalbody = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(final_count)]
+            if not finalbody:
+                finalbody = [ast.Pass()]
+        return ast.Try(body=body, handlers=handlers, orelse=orelse, finalbody=finalbody)
+    elif stmt_type == 'expr':
+        return ast.Expr(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
+    elif stmt_type == 'import':
+        num_names = draws.randint(1, 2)
+        names = [ast.alias(name=store_name(scope), asname=None) for _ in range(num_names)]
+        return ast.Import(names=names)
+    elif stmt_type == 'importfrom':
+        module_name = random_name() if scope is None else scope.safe_name()
+        num_names = draws.randint(1, 2)
+        aliases = [ast.alias(name=store_name(scope), asname=None) for _ in range(num_names)]
+        level = draws.choice((0, 0, 1))
+        return ast.ImportFrom(module=module_name, names=aliases, level=level)
+    elif stmt_type == 'global':
+        num_vars = draws.randint(1, 2)
+        if scope is None:
+            names = [random_name() for _ in range(num_vars)]
+        else:
+            # Names the scope has never touched, so no use or binding precedes the declaration.
+            names = list({scope.fresh_name(): None for _ in range(num_vars)})
+            scope.declared.update(names)
+        return ast.Global(names=names)
+
+    # Extended statement types
+    elif stmt_type == 'delete':
+        num_targets = draws.randint(1, 2)
+        targets = [ast.Name(id=load_name(scope), ctx=ast.Del()) for _ in range(num_targets)]
+        return ast.Delete(targets=targets)
+    elif stmt_type == 'assert':
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        msg = None if draws.random() < 0.5 else random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Assert(test=test, msg=msg)
+    elif stmt_type == 'raise':
+        exc = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Raise(exc=exc, cause=None)
+    elif stmt_type == 'nonlocal':
+        num_vars = draws.randint(1, 2)
+        if scope is None:
+            names = [random_name() for _ in range(num_vars)]
+        else:
+            names = list({draws.choice(scope.nonlocal_candidates()): None for _ in range(num_vars)})
+            scope.declared.update(names)
+            for name in names:
+                scope.use(name)
+        return ast.Nonlocal(names=names)
+    elif stmt_type == 'annassign':
+        if scope is None:
+            target = ast.Name(id=random_name(), ctx=ast.Store())
+        else:
+            name = store_name(scope)
+            while name in scope.declared:
+                name = store_name(scope)
+            target = ast.Name(id=name, ctx=ast.Store())
+        annotation = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope) if draws.random() < 0.5 else None
+        return ast.AnnAssign(target=target, annotation=annotation, value=value, simple=1)
+    elif stmt_type == 'async_for':
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse_count = draws.randint(0, 1)
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
+        return ast.AsyncFor(target=target, iter=iter_expr, body=body, orelse=orelse)
+    elif stmt_type == 'match':
+        subject = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if scope is None:
+            pat = ast.MatchValue(value=random_expr(max_depth - 1, in_function=in_function))
+        else:
+            # Value patterns only accept literals and dotted names.
+            value = draws.randint(0, 100) if draws.random() < 0.5 else ''.join(draws.choices(string.ascii_lowercase, k=3))
+            pat = ast.MatchValue(value=ast.Constant(value=value))
+        case_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope)]
+        case = ast.match_case(pattern=pat, guard=None, body=case_body)
+        return ast.Match(subject=subject, cases=[case])
+    elif stmt_type == 'return' and scope is not None:
+        return ast.Return(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
+
+
+def generate_random_ast(max_depth=3, grammar=False):
+    """
+    Generate a random AST for a module (ast.Module) with given max depth.
+    With grammar=True every statement is generated in a module Scope, so the result compiles.
+    """
+    num_statements = draws.randint(1, 3)
+    scope = Scope() if grammar else None
+    body = [random_stmt(max_depth, in_function=False, in_loop=False, scope=scope) for _ in range(num_statements)]
+    if not body:
+        body = [ast.Pass()]
+    module_node = ast.Module(body=body, type_ignores=[])
+    ast.fix_missing_locations(module_node)
+    return module_node
+
+
+IDENTIFIER_COUNTS = {
+    'mutate_function_source': 1, 'source_code': 13, 'node_name': 65, 'node_type': 61,
+    'profiler': 41, 'tree': 44, 'ast': 337, 'mutate_function_tree': 3, 'mutated_source': 2,
+    'find_function_node': 23, 'node': 254, 'isinstance': 111, 'executed': 17, 'node_index': 13,
+    'last_node_index': 6, 'mutType': 5, 'random': 18, 'last_mutation_type': 4, 'print': 27,
+    'attach_generated_subtree': 3, 'grammar_mode': 5, 'mutation_sites': 6,
+    'mutate_indexed_sites': 2, 'mutate_ast_subtree': 2, 'clone_module': 4, 'parent': 58, 'memo': 12,
+    'child': 30, 'list': 18, 'i': 15, 'enumerate': 6, 'copy': 3, 'spawn_child': 3, 'in_place': 2,
+    'simplify_mode': 3, 'before': 5, 'after': 5, 'simplify': 2, 'check_budget': 2, 'tune_child': 2,
+    'result': 15, 'tune_constants': 1, 'sys': 12, '__name__': 8, 'tune_batch': 4,
+    'coverage_mode': 8, 'len': 23, 'apply_constants': 1, 'Verdict': 4, 'edit_child_code': 2,
+    'history': 18, 'parent_index': 13, 'parent_code': 5, 'edited': 6, 'get_code_mutator': 1,
+    'code_object': 19, 'edits': 4, 'callable': 6, 'base': 3, 'DeferredTree': 1, 'ModuleUnparser': 3,
+    '__init__': 7, 'self': 310, 'unparse_node': 1, 'entry': 37, 'id': 21, 'unparse': 1, 'body': 39,
+    'str': 7, 'parts': 4, 'compile_evolved_function': 5, 'source': 22, 'compile': 2,
+    'load_evolved_function': 2, 'namespace': 5, 'dict': 6, 'globals': 1, 'exec': 1,
+    'check_candidate': 2, 'sandbox': 14, 'coverage': 3, 'start': 4, 'time': 12, 'SyntaxError': 3,
+    'ValueError': 7, 'TypeError': 2, 'type': 7, 'e': 3, 'verdict': 28, 'function': 3,
+    'frozenset': 1, 'record_lines': 1, 'Exception': 5, 'GenerationCache': 3, 'depth': 13,
+    'loader': 8, '__contains__': 2, 'index': 77, 'get': 1, 'put': 1, 'next': 2, 'iter': 1,
+    'load': 1, 'deferred': 2, 'KeyError': 1, 'code': 3, 'NodeIndex': 5, 'summary': 1,
+    '_recent_generations': 4, 'history_depth': 5, 'read_generation': 3, 'open': 4, 'file': 2,
+    'IOError': 1, 'get_recent_generations': 3, 'run_generations': 2, 'generations': 3,
+    'start_index': 12, 'write_files': 4, 'mutTry': 8, 'cache': 21, 'store': 21, 'checkpoint': 14,
+    'resume': 27, 'lineage_db': 30, 'compact': 7, 'evaluate': 3, 'key': 25, 'record': 6,
+    'operator': 9, 'status': 2, 'kept': 2, 'parent_ids': 5, 'candidate': 38, 'attempt': 9,
+    'mutated': 7, 'started': 4, 'load_generation': 2, 'save_checkpoint': 3, 'draws': 89,
+    'lineage': 12, 'definitions': 7, 'counters': 3, 'step': 14, 'mutants': 11, 'invalid': 7,
+    'oversized': 7, 'size': 5, 'records': 6, 'executed_lines': 5, 'base_code': 19, 'loadable': 5,
+    'host_tree': 6, 'compacted': 4, 'CompactLineage': 1, 'definition_loader': 1, 'unparser': 8,
+    'coverage_stats': 3, 'CoverageStats': 1, 'restore_checkpoint': 1, 'first_step': 2,
+    'saved_at': 4, 'start_time': 2, 'set_base_code': 2, 'range': 49, 'function_source': 3,
+    'tuned': 7, 'candidate_index': 4, 'bytecode_mode': 3, 'parent_nodes': 2, 'number_statements': 1,
+    'BudgetExceeded': 4, 'child_id': 2, 'statements': 3, 'sum': 2, '_': 51, 'iter_nodes': 9,
+    'new_source': 5, 'f': 6, 'elapsed': 4, 'steps': 3, 'input_node': 16, 'max_depth': 91,
+    'mutation_prob': 4, 'grammar': 19, 'RandomMutator': 2, 'in_function': 95, 'Scope': 10,
+    '_nonlocal_names': 4, 'super': 4, 'generic_visit': 2, 'visit_children': 1, 'site_prob': 1,
+    'site_weight': 2, 'dead_code_weight': 5, 'maybe_replace': 1, 'snapshot': 6, 'getattr': 11,
+    '_release_bindings': 4, 'random_expr': 59, 'random_stmt': 26, 'visit_list': 1, 'values': 16,
+    'new_values': 4, 'value': 85, 'visit_loop': 1, 'field': 43, 'old_in_loop': 4, 'setattr': 4,
+    'visit_scope': 1, 'old_scope': 4, 'visit_FunctionDef': 1, 'old_in_function': 4,
+    'visit_Lambda': 1, 'visit_AsyncFunctionDef': 1, 'visit_ClassDef': 1,
+    'visit_comprehension_scope': 2, 'visit_ListComp': 1, 'visit_SetComp': 1, 'visit_DictComp': 1,
+    'visit_GeneratorExp': 1, 'visit_leave_alone': 4, 'visit_JoinedStr': 1, 'visit_MatchValue': 2,
+    'visit_MatchSingleton': 2, 'visit_MatchSequence': 2, 'visit_MatchMapping': 2,
+    'visit_MatchClass': 2, 'visit_MatchStar': 2, 'visit_MatchAs': 2, 'visit_MatchOr': 2,
+    'visit_Starred': 1, 'visit_Slice': 1, 'mutator': 2, '_UNINDEXED_NODES': 3, '_SCOPE_NODES': 2,
+    '_COMPREHENSION_NODES': 3, 'CATEGORIES': 1, 'root': 3, 'category': 27, '__len__': 2, '_key': 1,
+    'staticmethod': 1, '_insert': 1, '_discard': 1, 'position': 20, 'entries': 9, 'last': 3,
+    'add': 1, 'stack': 28, 'has_children': 4, 'name': 64, 'item': 13, 'remove': 1, 'ancestors': 1,
+    'replace': 1, 'old': 5, 'new': 5, 'append': 1, 'owner': 12, 'appended': 1, 'sample': 1, 'k': 2,
+    'min': 1, 'site_context': 1, 'in_loop': 26, 'scope_nodes': 7, 'bool': 5, '_site_scope': 2,
+    'scope': 209, '_is_mutation_site': 2, 'any': 2, 'p': 2, 'nodes': 2, 'sub': 41,
+    'nonlocal_names': 5, 'bound': 7, 'sites': 2, 'expr_count': 4, 'total': 3, 'pick': 4,
+    'mutate_ast': 1, 'int': 28, 'float': 7, 'node_class': 8, 'pop': 4, 'push': 6, 'reversed': 4,
+    'iter_leaves': 2, 'pending': 2, 'tree_size': 5, 'tree_depth': 2, 'deepest': 4, 'max': 1,
+    'max_tree_nodes': 5, 'max_tree_depth': 5, '_BINDING_NODES': 2, '_dead_code_is_inert': 2,
+    'stmts': 6, 'stmt': 10, '_fold_is_small': 2, 'left': 8, 'right': 7, 'abs': 1, 'bytes': 5,
+    'tuple': 4, 'sequence': 2, 'count': 6, 'fold_constant': 2, 'operands': 6, 'op': 10, 'all': 1,
+    'operand': 6, 'eval': 1, 'math': 3, 'complex': 2, 'Simplifier': 2, 'docstrings': 3, 'first': 5,
+    'simplify_block': 1, 'docstring': 2, 'block': 5, 'visit_folded': 2, 'visit_BinOp': 1,
+    'visit_UnaryOp': 1, 'visit_BoolOp': 1, 'visit_Compare': 1, 'visit_pattern': 3, '__file__': 1,
+    'count_identifiers_from_code': 3, 'counts': 4, 'get_identifiers_from_code': 1,
+    'IdentifierPool': 2, 'draw': 1, 'weighted': 2, '_identifier_pool': 5, 'weighted_names': 2,
+    'NullProfiler': 3, 'enabled': 1, 'phase': 1, '__enter__': 1, '__exit__': 1, 'exc_info': 1,
+    'n': 4, 'generated': 1, 'end_generation': 1, 'close': 1, 'set_profiler': 2, 'new_profiler': 3,
+    'RandomDraws': 3, 'reset': 1, 'set_draws': 2, 'new_draws': 3, 'seed_random': 2, 'seed': 2,
+    'get_identifier_pool': 2, 'random_name': 13, 'pool': 3, 'length': 4, 'string': 6,
+    'NAME_CHARACTERS': 2, 'kind': 9, 'is_async': 4, 'set': 10, 'of': 1, 'cls': 2, 'classmethod': 1,
+    'restore': 1, 'use': 1, 'hidden_names': 1, 'names': 20, 'can_yield': 1, 'property': 3,
+    'can_assign_expr': 1, 'can_await': 1, 'visible_names': 1, 'nonlocal_candidates': 1, 'hidden': 5,
+    'sorted': 4, 'safe_name': 1, 'keyword': 2, 'fresh_name': 1, 'load_name': 5, 'visible': 3,
+    'store_name': 16, 'expr_types': 1, 'types': 18, '_SCOPE_EXPR_TYPES': 3, 't': 6, 'EXPR_TYPES': 4,
+    'stmt_types': 1, '_SCOPE_STMT_TYPES': 3, 'STMT_TYPES': 3, 'EXPR_TYPES_IN_FUNCTION': 2,
+    'SIMPLE_STMT_TYPES': 2, 'BINARY_OPERATORS': 3, 'BOOLEAN_OPERATORS': 2, 'UNARY_OPERATORS': 3,
+    'COMPARISON_OPERATORS': 2, 'CONSTANT_KINDS': 2, '_FUNCTION_HAS_TYPE_PARAMS': 2,
+    '_FUNCTION_HAS_TYPE_COMMENT': 2, '_CLASS_HAS_TYPE_PARAMS': 2, '_WITH_HAS_TYPE_COMMENT': 2,
+    'maybe_starred': 5, 'expr_type': 28, 'num_ops': 2, 'ops': 3, 'comparators': 3, 'func_expr': 4,
+    'args': 125, 'keywords': 3, 'kw_name': 2, 'kw_value': 2, 'cond': 2, 'body_expr': 2,
+    'orelse_expr': 2, 'num_args': 3, 'args_list': 3, 'body_scope': 10, 'lambda_args': 2,
+    'elements': 6, 'keys': 2, 'target': 14, 'iter_expr': 7, 'if_cond': 2, 'comp': 6, 'elt': 6,
+    'val': 4, 'fragments': 4, 'Ellipsis': 1, 'lower': 2, 'upper': 2, 'choice': 6, 'stmt_type': 30,
+    'num_targets': 4, 'targets': 4, 'test': 6, 'body_count': 16, 'orelse_count': 12, 'orelse': 11,
+    'args_count': 3, 'params': 3, 'param': 2, 'arguments': 3, 'func_node': 4, 'bases': 3,
+    'class_node': 3, 'num_items': 2, 'items': 4, 'context_expr': 2, 'optional_vars': 3,
+    'handlers': 6, 'finalbody': 5, 'num_handlers': 3, 'h_body_counts': 3, 'exc_type': 6,
+    'exc_name': 2, 'h_body_count': 5, 'h_body': 3, 'else_count': 2, 'handler': 5, 'zip': 1,
+    'final_count': 2, 'num_names': 4, 'module_name': 2, 'aliases': 2, 'level': 2, 'num_vars': 6,
+    'msg': 2, 'exc': 2, 'annotation': 2, 'subject': 2, 'pat': 3, 'case_body': 2, 'case': 2,
+    'generate_random_ast': 1, 'num_statements': 2, 'module_node': 3, 'get_terminal_leaves': 2,
+    'attach_to_random_leaf': 1, 'leaves': 3, 'random_leaf': 2, 'hasattr': 1, 'in_func': 2,
+    'new_stmt': 7, 'field_val': 3, 'main': 3, 'recent': 3, 'new_file': 3, 'os': 2,
+    'evolved_function': 2, 'a': 2, 'b': 2, 'parser': 53, 'argparse': 1, 'BlockDraws': 1,
+    'Profiler': 1, 'current_file': 6, 'current_index': 9, 'sandbox_options': 3, 'heads': 2,
+    'run_islands': 1, 'island': 2, 'generation': 2, 'Sandbox': 1, 'VerdictCache': 1,
+    'GenerationStore': 1, 'LineageDB': 1, 'Checkpointer': 1, 'load_checkpoint': 1, 'addresses': 3,
+    'parse_addresses': 1, 'run_island': 1, 'TCPTransport': 1, 'supervise': 1, 'run_population': 1,
+    'new_index': 2, 'mutation_successful': 4, 'fallback_index': 5,
+}
+
+
+base_code = IDENTIFIER_COUNTS
@@ -1,4 +1,4 @@
-import os, sys, random, ast, string
+import os, sys, random, ast, string, copy, keyword
 
 
 def mutate_function_source(source_code, node_name, node_type):
@@ -6,20 +6,664 @@ def mutate_function_source(source_code, node_name, node_type):
     Parse the source code and target the definition of evolved_function.
     Apply smart AST mutations only to that function.
     """
-    tree = ast.parse(source_code)
+    with profiler.phase('parse'):
+        tree = ast.parse(source_code)
+    mutate_function_tree(tree, node_name, node_type)
+    with profiler.phase('unparse'):
+        mutated_source = ast.unparse(tree)
+    return mutated_source
+
+def find_function_node(tree, node_name, node_type):
+    """
+    Return the first node of node_type named node_name in breadth-first order, or None.
+    Top-level definitions are checked first so the usual case does not walk the whole module.
+    """
+    for node in tree.body:
+        if isinstance(node, node_type) and node.name == node_name:
+            return node
     for node in ast.walk(tree):
         if isinstance(node, node_type) and node.name == node_name:
-            mutType = random.choice([0, 1])
-            print(mutType)
-            if mutType == 0:
-                attach_generated_subtree(node, max_depth=4)
-            if mutType == 1:
-                mutate_ast_subtree(node, max_depth=2, mutation_prob=0.5)
+            return node
+    return None
+
+def mutate_function_tree(tree, node_name, node_type, executed=None, node_index=None):
+    """
+    Apply one random mutation, in place, to the node_name definition inside an already parsed tree.
+    executed is the set of statement numbers that ran in the parent (see ast_liv.coverage); sites
+    outside it are replaced dead_code_weight times as often as the others. node_index is a
+    NodeIndex of the definition for mutate_indexed_sites(), kept up to date by either mutation;
+    the index of the mutated definition, if there is one, is left in last_node_index.
+    """
+    global last_mutation_type, last_node_index
+    last_node_index = None
+    with profiler.phase('lookup'):
+        node = find_function_node(tree, node_name, node_type)
+    if node is not None:
+        mutType = random.choice([0, 1])
+        last_mutation_type = mutType
+        print(mutType)
+        if mutType == 0:
+            attach_generated_subtree(node, max_depth=4, grammar=grammar_mode)
+            if node_index is not None:
+                node_index.appended(node, 'body')
+                last_node_index = node_index
+        if mutType == 1:
+            if mutation_sites:
+                last_node_index = mutate_indexed_sites(node, sites=mutation_sites, max_depth=2, grammar=grammar_mode,
+                                                       index=node_index, executed=executed)
+            else:
+                mutate_ast_subtree(node, max_depth=2, mutation_prob=0.5, grammar=grammar_mode, executed=executed)
+    return tree
+
+def clone_module(parent, node_name, node_type, memo=None):
+    """
+    Return a copy of the parent module that can be mutated without touching the parent.
+
+    Only the targeted definition is deep-copied; every other top-level node is shared
+    with the parent, so a child costs as much as the evolving function, not the module.
+    memo is passed on to copy.deepcopy(), which records in it the copy of every node.
+    """
+    with profiler.phase('copy'):
+        child = ast.Module(body=list(parent.body), type_ignores=list(parent.type_ignores))
+        for i, node in enumerate(child.body):
+            if isinstance(node, node_type) and node.name == node_name:
+                child.body[i] = copy.deepcopy(node, memo)
+                return child
+        return copy.deepcopy(parent, memo)
+
+def spawn_child(parent, node_name, node_type, executed=None, in_place=False, node_index=None):
+    """
+    Return a mutated child of the parent module without touching the parent.
+
+    The child comes from clone_module(), so only the mutated definition is copied; executed is
+    passed on to mutate_function_tree(). With in_place the parent itself is mutated and returned,
+    for callers that already hold a private copy of it.
+    node_index is the parent definition's NodeIndex, which is copied along with the definition
+    (or, in place, used as is) for mutate_indexed_sites(); the child's is left in last_node_index.
+    With simplify_mode the mutated definition is simplified before anything else sees it,
+    and check_budget() raises BudgetExceeded for a definition over the size budget.
+    """
+    global last_node_index
+    if in_place:
+        child = parent
+    elif node_index is not None:
+        memo = {}
+        child = clone_module(parent, node_name, node_type, memo)
+        node_index = node_index.copy(memo)
+    else:
+        child = clone_module(parent, node_name, node_type)
+    mutate_function_tree(child, node_name, node_type, executed, node_index)
+    node = find_function_node(child, node_name, node_type)
+    ast.fix_missing_locations(node or child)
+    if node is not None:
+        if simplify_mode:
+            before, after = simplify(node)
+            print(f'Simplified {node_name}: {before} -> {after} nodes')
+            # the simplifier rewrites the tree without telling the index
+            last_node_index = None
+        check_budget(node)
+    return child
+
+def tune_child(parent, node_name, node_type):
+    """
+    Return (child, verdict) for a child of the parent whose numeric constants were tuned by
+    ast_liv.tuning: tune_batch perturbed copies of the constant vector run through one compiled
+    template, and the first that runs cleanly is written into the child. verdict is that
+    variant's run, so the child need not be run again. Returns None when the definition has
+    no numeric constants or no variant survived.
+    """
+    from ast_liv.evaluation import Verdict
+    from ast_liv.tuning import tune_constants, apply_constants
+    result = tune_constants(sys.modules[__name__], parent, node_name, node_type, batch=tune_batch,
+                            coverage=coverage_mode)
+    if result is None or result.ints is None:
+        return None
+    print(f'Tuned {len(result.ints) + len(result.floats)} constants: {result.survivors}/{result.batch} '
+          f'variants ran cleanly in {result.elapsed:.3f}s')
+    print(result.output, end='')
+    child = clone_module(parent, node_name, node_type)
+    apply_constants(find_function_node(child, node_name, node_type), result.ints, result.floats)
+    return child, Verdict('ok', None, '', result.runtime, result.coverage)
+
+def edit_child_code(history, parent_index, node_name, node_type):
+    """
+    Return (tree, code_object) for a child made by editing the parent's compiled definition
+    (ast_liv.bytecode) instead of its AST, or None when no constant or operator of it can be
+    edited that way. tree is a DeferredTree: calling it builds the child's module.
+    """
+    from ast_liv.bytecode import DeferredTree, get_code_mutator
+    parent_code = history.code(parent_index, node_name, node_type)
+    parent = history.load(parent_index, deferred=True)
+    with profiler.phase('mutate'):
+        edited = get_code_mutator().mutate(
+            parent_code, lambda: find_function_node(history.load(parent_index), node_name, node_type))
+    if edited is None:
+        return None
+    code_object, edits = edited
+    if callable(parent):
+        base, edits = parent.base, {**parent.edits, **edits}
+    else:
+        base = parent_index
+    return DeferredTree(sys.modules[__name__], history, base, edits, node_name, node_type), code_object
+
+class ModuleUnparser:
+    """
+    ast.unparse() for a sequence of modules that share most of their top-level nodes.
+
+    The text of every top-level node is cached by node identity, so unparsing a child that only
+    differs from its parent in evolved_function regenerates that one definition and splices it
+    between the cached text of the others. Nodes must not be mutated in place once unparsed;
+    spawn_child() copies the definition it mutates, so lineages built with it are safe.
+    """
+
+    def __init__(self):
+        self._texts = {}
+
+    def unparse_node(self, node):
+        """Return the source of one top-level node, from the cache when possible."""
+        entry = self._texts.get(id(node))
+        if entry is None or entry[0] is not node:
+            with profiler.phase('unparse'):
+                entry = (node, ast.unparse(node))
+            self._texts[id(node)] = entry
+        return entry[1]
+
+    def unparse(self, tree):
+        """
+        Return exactly what ast.unparse(tree) would, and forget nodes no longer in tree.
+        """
+        body = tree.body
+        if tree.type_ignores or (body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant)
+                                 and isinstance(body[0].value.value, str)):
+            return ast.unparse(tree)
+        parts = []
+        for i, node in enumerate(body):
+            if i:
+                parts.append('\n\n' if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) else '\n')
+            parts.append(self.unparse_node(node))
+        self._texts = {id(node): self._texts[id(node)] for node in body}
+        return ''.join(parts)
+
+def compile_evolved_function(tree, node_name, node_type, source=None):
+    """
+    Compile only the node_name definition, as the sole statement of a module, and return the code object.
+
+    This validates a mutant at the cost of its own size rather than the host file's. When source
+    (the unparsed definition) is given it is compiled instead of the tree, so that text that will
+    be written to disk is checked exactly as it will be read back.
+    """
+    if source is None:
+        source = ast.Module(body=[find_function_node(tree, node_name, node_type)], type_ignores=[])
+    with profiler.phase('compile'):
+        return compile(source, f'<{node_name}>', 'exec')
+
+def load_evolved_function(tree, node_name, node_type, namespace=None, code_object=None):
+    """
+    Compile the node_name definition out of tree and return the resulting function object.
+
+    The function is executed into a copy of this module's globals, as it would be if
+    the generation had been written out and run as its own script.
+    """
+    if code_object is None:
+        code_object = compile_evolved_function(tree, node_name, node_type)
+    if namespace is None:
+        namespace = dict(globals())
+    exec(code_object, namespace)
+    return namespace[node_name]
+
+def check_candidate(tree, node_name, node_type, source=None, sandbox=None, code_object=None, coverage=False):
+    """
+    Compile a candidate's evolved_function and run it, returning an ast_liv Verdict.
+
+    source is the unparsed definition, if the caller already has it; see compile_evolved_function().
+    code_object, if given, is the already compiled definition and is run as is. With a sandbox
+    the function runs there and its captured output is echoed; otherwise it is called in this process.
+    With coverage, an in-process run records the lines it executes in the verdict; the definition
+    should have been numbered with ast_liv.coverage.number_statements(), and is compiled from the
+    tree so that those numbers are the lines of the code.
+    """
+    import time
+    from ast_liv.evaluation import Verdict
+    start = time.perf_counter()
+    try:
+        if code_object is None:
+            # a coverage run needs the tree's statement numbers as its lines, which source lacks
+            code_object = compile_evolved_function(tree, node_name, node_type,
+                                                   None if coverage and sandbox is None else source)
+    except (SyntaxError, ValueError, TypeError) as e:
+        return Verdict('syntax', type(e).__name__, '', time.perf_counter() - start)
+    if sandbox is not None:
+        if source is None:
+            source = ast.unparse(find_function_node(tree, node_name, node_type))
+        with profiler.phase('exec'):
+            verdict = sandbox.run((__name__, node_name, source))
+        print(verdict.output, end='')
+        return verdict
+    executed = None
+    try:
+        function = load_evolved_function(tree, node_name, node_type, code_object=code_object)
+        with profiler.phase('exec'):
+            if coverage:
+                from ast_liv.coverage import record_lines
+                executed = frozenset(record_lines(function))
+            else:
+                function()
+    except Exception as e:
+        return Verdict('exception', type(e).__name__, '', time.perf_counter() - start)
+    return Verdict('ok', None, '', time.perf_counter() - start, executed)
+
+class GenerationCache:
+    """
+    Bounded LRU of recent generations by index: the parsed module, its source when known, the
+    compiled evolved_function and the NodeIndex of the evolved_function, so that retrying or
+    reverting to a recent generation does not read, parse, compile or index anything.
+
+    :param depth: Number of generations kept in memory, or None to keep all of them.
+    :param loader: Function returning the source of a generation index that is not in memory,
+        e.g. by reading quine_ast_liv_{index}.py, or its already built ast.Module; without one,
+        get() misses are final.
+    """
+
+    def __init__(self, depth=8, loader=None):
+        self.depth = depth
+        self.loader = loader
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, index):
+        return index in self.entries
+
+    def get(self, index):
+        """Return the cached (tree, source, code, node_index) entry for index, or None."""
+        entry = self.entries.pop(index, None)
+        if entry is None:
+            return None
+        self.entries[index] = entry
+        return entry
+
+    def put(self, index, tree, source=None, code_object=None, node_index=None):
+        self.entries.pop(index, None)
+        self.entries[index] = [tree, source, code_object, node_index]
+        while self.depth is not None and len(self.entries) > self.depth:
+            del self.entries[next(iter(self.entries))]
+
+    def load(self, index, deferred=False):
+        """
+        Return the parsed module of a generation, going to the loader only on a miss.
+
+        A generation put as a callable (an ast_liv.bytecode.DeferredTree, see edit_child_code) is
+        built on first use, unless deferred is true, in which case the callable is returned.
+        """
+        entry = self.get(index)
+        if entry is not None:
+            self.hits += 1
+            if callable(entry[0]) and not deferred:
+                entry[0] = entry[0]()
+            return entry[0]
+        self.misses += 1
+        if self.loader is None:
+            raise KeyError(f'Generation {index} is no longer in memory and there is nowhere to load it from')
+        source = self.loader(index)
+        if isinstance(source, ast.Module):
+            tree, source = source, None
+        else:
+            with profiler.phase('parse'):
+                tree = ast.parse(source)
+        self.put(index, tree, source)
+        return tree
+
+    def source(self, index):
+        """Return the source a generation was loaded from, or None if it was created in memory."""
+        self.load(index)
+        return self.entries[index][1]
+
+    def code(self, index, node_name, node_type):
+        """Return the compiled node_name definition of a generation, compiling it at most once."""
+        entry = self.get(index)
+        if entry is not None and entry[2] is not None:
+            self.hits += 1
+            return entry[2]
+        tree = self.load(index)
+        entry = self.entries[index]
+        if entry[2] is None:
+            entry[2] = compile_evolved_function(tree, node_name, node_type)
+        return entry[2]
+
+    def node_index(self, index, node_name, node_type):
+        """Return the NodeIndex of a generation's node_name definition, building it at most once."""
+        tree = self.load(index)
+        entry = self.entries[index]
+        if entry[3] is None:
+            with profiler.phase('index'):
+                entry[3] = NodeIndex(find_function_node(tree, node_name, node_type))
+        return entry[3]
+
+    def summary(self):
+        return f'generation cache: {self.hits} hits, {self.misses} misses, {len(self.entries)} in memory'
+
+_recent_generations = None
+# Generations the legacy os.execl loop and run_generations keep parsed in memory for retries and reverts.
+history_depth = 8
+
+def read_generation(index):
+    """Return the source of quine_ast_liv_{index}.py, or '' if it cannot be read, as main() always has."""
+    try:
+        with profiler.phase('read'):
+            with open(f'quine_ast_liv_{index}.py', 'r') as file:
+                return file.read()
+    except IOError:
+        return ''
+
+def get_recent_generations():
+    """
+    Return the process-wide GenerationCache used by main(), backed by the quine_ast_liv_{index}.py files.
+    """
+    global _recent_generations
+    if _recent_generations is None:
+        _recent_generations = GenerationCache(history_depth, read_generation)
+    return _recent_generations
+
+def run_generations(generations=None, source_code=None, start_index=0, write_files=False, mutTry=5,
+                    sandbox=None, cache=None, store=None, depth=None, checkpoint=None, resume=None,
+                    lineage_db=None, compact=False, node_name='evolved_function', node_type=ast.FunctionDef):
+    """
+    Evolve the lineage inside this process instead of re-executing a new interpreter per generation.
+
+    The lineage is a list of generation indices whose parsed modules live in a GenerationCache
+    holding the most recent `depth` of them. Older ones are read back from the files written
+    with write_files or from the store on demand; with neither, every generation stays in
+    memory. Each step mutates the newest module,
+    compiles the child's evolved_function on its own, runs it and keeps the child if that succeeds.
+    A child that fails to compile is replaced by a copy of its parent, just like main() does.
+    When mutTry children in a row fail to run, the newest generation is dropped and its parent
+    is mutated again, mirroring the fallback in the __main__ block.
+
+    :param generations: Number of steps to run, or None to run forever.
+    :param source_code: Source of generation start_index; defaults to this file.
+    :param start_index: Index of the starting generation, used for file names.
+    :param write_files: Also write every kept generation to quine_ast_liv_{index}.py. Only the
+        evolved_function is unparsed per generation; the rest of the file is spliced from cache.
+    :param mutTry: Mutation attempts per generation before reverting.
+    :param sandbox: An ast_liv.sandbox.Sandbox to run each evolved_function in, bounded in time
+        and memory, instead of calling it in this process.
+    :param cache: An ast_liv.cache.VerdictCache; candidates whose evolved_function has been seen
+        before reuse the cached verdict instead of being compiled and run again.
+    :param store: An ast_liv.store.GenerationStore that records the evolved_function of every
+        kept generation, with a pointer to its parent.
+    :param depth: Generations kept parsed in memory; defaults to history_depth.
+        With coverage_mode, every kept generation reports how many of its statements ran, and its
+        children are mutated mostly where it executed.
+    :param checkpoint: An ast_liv.checkpoint.Checkpointer that saves the run every so many steps
+        and when it ends.
+    :param resume: An ast_liv.checkpoint.Checkpoint to continue from instead of source_code and
+        start_index. Steps already taken count towards generations, so the command that was
+        interrupted, with resume added, finishes the same run.
+    :param lineage_db: An ast_liv.lineage.LineageDB that records every mutant tried, with its
+        operator, verdict and timings, and which kept generation it was made from.
+    :param compact: Keep the evolved_function of every kept generation as an
+        ast_liv.compact.CompactTree and rebuild generations that fell out of the cache from it,
+        instead of reading files or the store back, or keeping every generation parsed.
+    :return: The GenerationCache of the run; its `lineage` attribute lists the indices of the
+        generations making up the final lineage, and load(index) returns any of them.
+    """
+    import time
+
+    def evaluate(tree, source, code_object=None):
+        nonlocal key
+        key = None
+        if cache is not None:
+            key = cache.key(find_function_node(tree, node_name, node_type))
+            verdict = cache.get(key)
+            if verdict is not None:
+                return verdict
+        verdict = check_candidate(tree, node_name, node_type, source=source, sandbox=sandbox, code_object=code_object,
+                                  coverage=coverage_mode)
+        if cache is not None:
+            cache.put(key, verdict)
+        return verdict
+
+    def record(tree, operator, verdict=None, status=None, kept=False):
+        # the structural hash evaluate() computed for the cache, if it was this tree's
+        return lineage_db.add(index, parent_ids[-1], operator,
+                              None if tree is None else find_function_node(tree, node_name, node_type),
+                              verdict, status, key if tree is candidate else None, attempt,
+                              mutated - started, kept)
+
+    def load_generation(index):
+        if index == start_index:
+            return source_code
+        if write_files:
+            return read_generation(index)
+        return store.materialize(index)
+
+    def save_checkpoint():
+        # the checkpoint holds the state of random; decisions already drawn from it would be lost
+        draws.reset()
+        for index in lineage[1:]:
+            if index not in definitions:
+                definitions[index] = checkpoint.pack(find_function_node(history.load(index), node_name, node_type))
+        if store is not None:
+            store.flush()
+        counters = dict(step=step, mutants=mutants, invalid=invalid, oversized=oversized)
+        if lineage_db is not None:
+            lineage_db.flush()
+            counters.update(lineage_run=lineage_db.run, lineage_rows=lineage_db.last_id)
+        size = checkpoint.save(source_code, start_index, lineage, definitions, records if store is not None else None,
+                               executed_lines, counters, cache)
+        print(f'Checkpoint at step {step}: {size} bytes written to {checkpoint.path}')
+        return step
+
+    if resume is not None:
+        source_code, start_index = resume.host, resume.start_index
+    if source_code is None:
+        source_code = base_code
+    loadable = write_files or store is not None
+    if not loadable and not compact:
+        depth = None
+    elif depth is None:
+        depth = history_depth
+    host_tree = ast.parse(source_code)
+    loader = load_generation if loadable else None
+    if compact:
+        from ast_liv.compact import CompactLineage
+        loader = compacted = CompactLineage(host_tree, start_index, node_name, node_type, fallback=loader)
+    if resume is not None:
+        from ast_liv.checkpoint import definition_loader
+        loader = definition_loader(resume, host_tree, node_name, node_type, fallback=loader)
+    history = GenerationCache(depth, loader)
+    history.put(start_index, host_tree, source_code)
+    lineage = history.lineage = [start_index]
+    unparser = ModuleUnparser()
+    # definitions of the lineage packed for checkpoints, and the statement numbers that ran in each generation
+    # of it when coverage_mode records them
+    definitions = {}
+    executed_lines = {}
+    if coverage_mode:
+        from ast_liv.coverage import CoverageStats, number_statements
+        coverage_stats = CoverageStats()
+    step = 0
+    mutants = 0
+    invalid = 0
+    oversized = 0
+    key = None
+    if resume is not None:
+        from ast_liv.checkpoint import resume as restore_checkpoint
+        if store is not None and resume.records is None:
+            raise ValueError('The checkpoint was written by a run without a store')
+        lineage[:] = resume.lineage
+        definitions.update(resume.definitions)
+        executed_lines.update(resume.executed)
+        step, mutants = resume.counters['step'], resume.counters['mutants']
+        invalid, oversized = resume.counters['invalid'], resume.counters['oversized']
+        if store is not None:
+            records = list(resume.records)
+        if lineage_db is not None:
+            if 'lineage_run' not in resume.counters:
+                raise ValueError('The checkpoint was written by a run without a lineage database')
+            parent_ids = lineage_db.resume_run(resume.counters['lineage_run'], resume.counters['lineage_rows'],
+                                               lineage)
+        restore_checkpoint(resume, cache)
+        draws.reset()
+    else:
+        if store is not None:
+            records = [store.add(start_index, find_function_node(host_tree, node_name, node_type))]
+        if lineage_db is not None:
+            lineage_db.start_run(start_index)
+            parent_ids = [lineage_db.add(start_index, function_node=find_function_node(host_tree, node_name, node_type),
+                                         status='ok', kept=True)]
+    first_step = saved_at = step
+    start_time = time.perf_counter()
+    while generations is None or step < generations:
+        if checkpoint is not None and step != saved_at and checkpoint.due(step):
+            saved_at = save_checkpoint()
+        step += 1
+        parent_index = lineage[-1]
+        parent = history.load(parent_index, deferred=True)
+        index = start_index + len(lineage)
+        # code edits never add or remove names, so a deferred parent shares its base's identifiers
+        set_base_code(parent.base_tree() if callable(parent) else parent)
+        child = None
+        for attempt in range(1, mutTry + 1):
+            function_source = code_object = tuned = candidate_index = None
+            mutants += 1
+            if lineage_db is not None:
+                started = time.perf_counter()
+            try:
+                candidate = None
+                if bytecode_mode and random.random() < 0.5:
+                    edited = edit_child_code(history, parent_index, node_name, node_type)
+                    if edited is not None:
+                        candidate, code_object = edited
+                        # operators are numbered as in ast_liv.lineage: mutTypes 0 and 1, then these
+                        operator = 2
+                        if loadable or compact or cache is not None or sandbox is not None or lineage_db is not None:
+                            candidate = candidate()
+                if candidate is None and callable(parent):
+                    parent = history.load(parent_index)
+                if candidate is None and tune_batch and random.random() < 0.5:
+                    tuned = tune_child(parent, node_name, node_type)
+                    if tuned is not None:
+                        candidate, tuned = tuned
+                    operator = 3
+                if candidate is None:
+                    parent_nodes = history.node_index(parent_index, node_name, node_type) if mutation_sites else None
+                    candidate = spawn_child(parent, node_name, node_type, executed_lines.get(parent_index),
+                                            node_index=parent_nodes)
+                    candidate_index = last_node_index
+                    operator = last_mutation_type
+                if coverage_mode and code_object is None:
+                    number_statements(find_function_node(candidate, node_name, node_type))
+                if loadable:
+                    function_source = unparser.unparse_node(find_function_node(candidate, node_name, node_type))
+            except BudgetExceeded as e:
+                oversized += 1
+                print(f'Mutation attempt {attempt} failed: {e}')
+                if lineage_db is not None:
+                    mutated = time.perf_counter()
+                    record(None, last_mutation_type, status='oversized')
+                continue
+            except Exception as e:
+                invalid += 1
+                print(f'Mutation attempt {attempt} failed:')
+                if lineage_db is not None:
+                    mutated = time.perf_counter()
+                    record(None, None, status='invalid')
+                continue
+            if lineage_db is not None:
+                mutated = time.perf_counter()
+            if tuned is not None:
+                # already run while tuning
+                verdict = tuned
+                key = None
+                if cache is not None:
+                    key = cache.key(find_function_node(candidate, node_name, node_type))
+                    cache.put(key, verdict)
+            else:
+                verdict = evaluate(candidate, function_source, code_object)
+            if verdict.status == 'syntax':
+                invalid += 1
+                if lineage_db is not None:
+                    record(candidate, operator, verdict)
+                candidate = parent
+                # the copy shares the parent's tree, and so its index
+                candidate_index = history.node_index(parent_index, node_name, node_type) if mutation_sites else None
+                operator = 4
+                try:
+                    parent_code = history.code(parent_index, node_name, node_type)
+                except (SyntaxError, ValueError, TypeError):
+                    # kept because its unparsed text compiled; check_candidate reports the tree itself
+                    parent_code = None
+                verdict = evaluate(parent, None, parent_code)
+            if verdict.status != 'ok':
+                print(f'Mutation attempt {attempt} failed: {verdict.status} {verdict.error}')
+                if lineage_db is not None:
+                    record(candidate, operator, verdict)
+                continue
+            if lineage_db is not None:
+                child_id = record(candidate, operator, verdict, kept=True)
+            child = candidate
             break
-    mutated_source = ast.unparse(tree)
-    return mutated_source
+        if child is None:
+            if len(lineage) > 1:
+                if compact:
+                    compacted.discard(lineage[-1])
+                definitions.pop(lineage.pop(), None)
+                if store is not None:
+                    records.pop()
+                if lineage_db is not None:
+                    parent_ids.pop()
+            print(f'Mutation failed after {mutTry} attempts. Reverting to generation {start_index + len(lineage) - 1}.')
+            if lineage_db is not None:
+                lineage_db.end_generation()
+            profiler.end_generation(index)
+            continue
+        lineage.append(index)
+        if lineage_db is not None:
+            parent_ids.append(child_id)
+            lineage_db.end_generation()
+        history.put(index, child, code_object=code_object, node_index=candidate_index)
+        if compact:
+            compacted.add(index, find_function_node(child, node_name, node_type))
+        # calling a generator or coroutine function runs none of its body; mutate those uniformly
+        executed_lines[index] = verdict.coverage if verdict.coverage and len(verdict.coverage) > 1 else None
+        if checkpoint is not None and not callable(child):
+            definitions[index] = checkpoint.pack(find_function_node(child, node_name, node_type))
+        if store is not None:
+            records.append(store.add(index, find_function_node(child, node_name, node_type), parent=records[-1],
+                                     source=unparser.unparse_node(find_function_node(child, node_name, node_type))))
+        print('Generation:', index)
+        if coverage_mode and verdict.coverage is not None and not callable(child):
+            statements = sum(1 for _ in iter_nodes(find_function_node(child, node_name, node_type), ast.stmt))
+            profiler.count('statements', statements)
+            profiler.count('statements_executed', len(verdict.coverage))
+            print(coverage_stats.add(statements, len(verdict.coverage)))
+        if write_files:
+            new_source = unparser.unparse(child)
+            with profiler.phase('write'):
+                with open(f'quine_ast_liv_{index}.py', 'w') as f:
+                    f.write(new_source)
+        profiler.end_generation(index)
+    if checkpoint is not None and step != saved_at:
+        save_checkpoint()
+    elapsed = time.perf_counter() - start_time
+    steps = step - first_step
+    print(f'{steps} generations in {elapsed:.3f}s ({steps / elapsed if elapsed else 0:.1f} generations/sec)')
+    if oversized:
+        print(f'mutants over the size budget: {oversized}/{mutants}')
+        mutants -= oversized
+    if mutants:
+        print(f'valid mutants: {mutants - invalid}/{mutants} ({(mutants - invalid) / mutants:.1%})')
+    print(history.summary())
+    if compact:
+        print(compacted.summary())
+    if cache is not None:
+        print(cache.summary())
+    if coverage_mode:
+        print(coverage_stats.summary())
+    return history
 
-def mutate_ast_subtree(input_node, max_depth=3, mutation_prob=0.3):
+def mutate_ast_subtree(input_node, max_depth=3, mutation_prob=0.3, grammar=False, executed=None):
     """
     Mutates the given AST subtree by randomly replacing nodes with newly generated random AST nodes.
     The mutation is performed in-place starting from the provided input_node.
@@ -27,6 +671,10 @@ def mutate_ast_subtree(input_node, max_depth=3, mutation_prob=0.3):
     :param input_node: The root AST node from which mutations will be applied.
     :param max_depth: Maximum depth for generating new random nodes.
     :param mutation_prob: The probability with which an eligible node is replaced.
+    :param grammar: Generate replacements with the grammar-directed generator, tracking the scope,
+        loop nesting and load/store position of every node visited.
+    :param executed: Statement numbers that ran in the parent (see ast_liv.coverage); nodes of
+        other statements are replaced with mutation_prob * dead_code_weight.
     :return: The mutated AST node.
     """
     import ast
@@ -34,66 +682,668 @@ def mutate_ast_subtree(input_node, max_depth=3, mutation_prob=0.3):
 
     class RandomMutator(ast.NodeTransformer):
 
-        def __init__(self, max_depth, mutation_prob, in_function=False):
+        def __init__(self, max_depth, mutation_prob, in_function=False, grammar=False, executed=None):
             self.max_depth = max_depth
             self.mutation_prob = mutation_prob
+            self.executed = executed
             self.in_function = in_function
+            self.grammar = grammar
+            self.scope = Scope() if grammar else None
+            # names of the nonlocal statements in the tree, whose bindings are left in place
+            self.nonlocal_names = _nonlocal_names([input_node]) if grammar else None
+            self.in_loop = False
             super().__init__()
 
         def generic_visit(self, node):
-            node = super().generic_visit(node)
-            if isinstance(node, ast.expr) and random.random() < self.mutation_prob:
-                candidate = random_expr(self.max_depth, in_function=self.in_function)
+            return self.maybe_replace(self.visit_children(node))
+
+        def visit_children(self, node):
+            if self.grammar and isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+                return self.visit_loop(node)
+            return super().generic_visit(node)
+
+        def site_prob(self, node):
+            if self.executed is None:
+                return self.mutation_prob
+            from ast_liv.coverage import site_weight
+            return self.mutation_prob * site_weight(node, self.executed, dead_code_weight)
+
+        def maybe_replace(self, node):
+            snapshot = self.scope.snapshot() if self.grammar else None
+            if isinstance(node, ast.expr) and random.random() < self.site_prob(node):
+                if self.grammar and not isinstance(getattr(node, 'ctx', None), (ast.Load, type(None))):
+                    return node
+                if self.grammar and not _release_bindings(self.scope, node, self.nonlocal_names):
+                    return node
+                with profiler.phase('generate'):
+                    candidate = random_expr(self.max_depth, in_function=self.in_function, scope=self.scope)
+                profiler.generated(candidate)
                 if isinstance(candidate, type(node)):
                     return candidate
-            elif isinstance(node, ast.stmt) and random.random() < self.mutation_prob:
-                candidate = random_stmt(self.max_depth, in_function=self.in_function)
+            elif isinstance(node, ast.stmt) and random.random() < self.site_prob(node):
+                if self.grammar and not _release_bindings(self.scope, node, self.nonlocal_names):
+                    return node
+                with profiler.phase('generate'):
+                    if self.grammar:
+                        candidate = random_stmt(self.max_depth, in_loop=self.in_loop, scope=self.scope)
+                    else:
+                        candidate = random_stmt(self.max_depth, in_function=self.in_function)
+                profiler.generated(candidate)
                 if isinstance(candidate, type(node)):
+                    if self.grammar:
+                        self.nonlocal_names |= _nonlocal_names([candidate])
                     return candidate
+            if snapshot is not None:
+                self.scope.restore(snapshot)
+            return node
+
+        def visit_list(self, values):
+            new_values = []
+            for value in values:
+                value = self.visit(value) if isinstance(value, ast.AST) else value
+                if value is None:
+                    continue
+                new_values.extend(value) if isinstance(value, list) else new_values.append(value)
+            return new_values
+
+        def visit_loop(self, node):
+            """Visit a loop with break/continue allowed in its body but not in its else clause."""
+            for field in node._fields:
+                value = getattr(node, field)
+                old_in_loop = self.in_loop
+                self.in_loop = self.in_loop or field == 'body'
+                if isinstance(value, list):
+                    setattr(node, field, self.visit_list(value))
+                elif isinstance(value, ast.AST):
+                    setattr(node, field, self.visit(value))
+                self.in_loop = old_in_loop
             return node
 
+        def visit_scope(self, node):
+            old_scope, old_in_loop = self.scope, self.in_loop
+            self.scope, self.in_loop = Scope.of(node, parent=self.scope), False
+            node = self.visit_children(node)
+            self.scope, self.in_loop = old_scope, old_in_loop
+            return self.maybe_replace(node)
+
         def visit_FunctionDef(self, node):
             old_in_function = self.in_function
             self.in_function = True
-            node = self.generic_visit(node)
+            node = self.visit_scope(node) if self.grammar else self.generic_visit(node)
             self.in_function = old_in_function
             return node
 
         def visit_Lambda(self, node):
             old_in_function = self.in_function
             self.in_function = True
-            node = self.generic_visit(node)
+            node = self.visit_scope(node) if self.grammar else self.generic_visit(node)
             self.in_function = old_in_function
             return node
-    mutator = RandomMutator(max_depth, mutation_prob)
-    mutated = mutator.visit(input_node)
+
+        def visit_AsyncFunctionDef(self, node):
+            return self.visit_scope(node) if self.grammar else self.generic_visit(node)
+
+        def visit_ClassDef(self, node):
+            return self.visit_scope(node) if self.grammar else self.generic_visit(node)
+
+        def visit_comprehension_scope(self, node):
+            if not self.grammar:
+                return self.generic_visit(node)
+            old_scope = self.scope
+            self.scope = self.scope.child('comprehension', is_async=self.scope.can_await)
+            node = self.visit_children(node)
+            self.scope = old_scope
+            return self.maybe_replace(node)
+
+        visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_comprehension_scope
+
+        def visit_leave_alone(self, node):
+            # Children of f-strings and match patterns only accept a few node types; grammar mode
+            # does not replace anything below them.
+            return node if self.grammar else self.generic_visit(node)
+
+        visit_JoinedStr = visit_MatchValue = visit_MatchSingleton = visit_MatchSequence = visit_leave_alone
+        visit_MatchMapping = visit_MatchClass = visit_MatchStar = visit_MatchAs = visit_MatchOr = visit_leave_alone
+        visit_Starred = visit_Slice = visit_leave_alone
+    mutator = RandomMutator(max_depth, mutation_prob, grammar=grammar, executed=executed)
+    with profiler.phase('mutate'):
+        mutated = mutator.visit(input_node)
     ast.fix_missing_locations(mutated)
     return mutated
 
+# Operator, context and operand-kind nodes are shared singletons in parsed trees, so they are not
+# indexed (they would collide by identity) and do not count as children.
+_UNINDEXED_NODES = (ast.expr_context, ast.operator, ast.boolop, ast.unaryop, ast.cmpop)
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+_COMPREHENSION_NODES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+class NodeIndex:
+    """
+    Flat tables of the nodes of one tree by category, with parent pointers, so that mutation
+    sites can be sampled without walking the tree.
+
+    entries['expr'] and entries['stmt'] hold the nodes of those classes, entries['leaf'] the nodes
+    without child nodes and entries['body'] an (owner, field) pair for every non-empty statement
+    list. Each table keeps a position map, so a node is added or removed in O(1); replace() and
+    append() update the index in time proportional to the subtrees involved, not the tree, and
+    copy() carries it over to a deep copy of the tree without walking the copy.
+
+    :param root: The node to index, typically the evolved_function definition.
+    """
+    CATEGORIES = ('expr', 'stmt', 'leaf', 'body')
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = {category: [] for category in self.CATEGORIES}
+        self._positions = {category: {} for category in self.CATEGORIES}
+        self.parents = {}
+        self.add(root)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __contains__(self, node):
+        return id(node) in self.parents
+
+    @staticmethod
+    def _key(category, entry):
+        return (id(entry[0]), entry[1]) if category == 'body' else id(entry)
+
+    def _insert(self, category, entry):
+        key = self._key(category, entry)
+        if key not in self._positions[category]:
+            self._positions[category][key] = len(self.entries[category])
+            self.entries[category].append(entry)
+
+    def _discard(self, category, key):
+        position = self._positions[category].pop(key, None)
+        if position is None:
+            return
+        entries = self.entries[category]
+        last = entries.pop()
+        if position < len(entries):
+            entries[position] = last
+            self._positions[category][self._key(category, last)] = position
+
+    def add(self, node, parent=None, field=None, position=None):
+        """Index node and everything below it as the child of parent.field[position]."""
+        stack = [(node, parent, field, position)]
+        while stack:
+            node, parent, field, position = stack.pop()
+            self.parents[id(node)] = (parent, field, position)
+            if isinstance(node, ast.expr):
+                self._insert('expr', node)
+            elif isinstance(node, ast.stmt):
+                self._insert('stmt', node)
+            has_children = False
+            for name, value in ast.iter_fields(node):
+                if isinstance(value, list):
+                    if value and isinstance(value[0], ast.stmt):
+                        self._insert('body', (node, name))
+                    for i, item in enumerate(value):
+                        if isinstance(item, ast.AST) and not isinstance(item, _UNINDEXED_NODES):
+                            has_children = True
+                            stack.append((item, node, name, i))
+                elif isinstance(value, ast.AST) and not isinstance(value, _UNINDEXED_NODES):
+                    has_children = True
+                    stack.append((value, node, name, None))
+            if not has_children:
+                self._insert('leaf', node)
+
+    def remove(self, node):
+        """Forget node and everything below it."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.parents.pop(id(node), None) is None:
+                continue
+            for category in ('expr', 'stmt', 'leaf'):
+                self._discard(category, id(node))
+            for name, value in ast.iter_fields(node):
+                if isinstance(value, list):
+                    self._discard('body', (id(node), name))
+                    stack.extend(item for item in value if isinstance(item, ast.AST))
+                elif isinstance(value, ast.AST):
+                    stack.append(value)
+
+    def parent(self, node):
+        """Return (parent, field, position) for an indexed node; position is None for non-list fields."""
+        return self.parents[id(node)]
+
+    def ancestors(self, node):
+        """Yield (child, parent, field) pairs from node up to the root."""
+        parent, field, _ = self.parents[id(node)]
+        while parent is not None:
+            yield node, parent, field
+            node = parent
+            parent, field, _ = self.parents[id(node)]
+
+    def replace(self, old, new):
+        """Put new where old is in the tree and update the index for both subtrees."""
+        parent, field, position = self.parents[id(old)]
+        if parent is None:
+            raise ValueError('The root of a NodeIndex cannot be replaced.')
+        if position is None:
+            setattr(parent, field, new)
+        else:
+            values = getattr(parent, field)
+            if position >= len(values) or values[position] is not old:
+                position = next(i for i, value in enumerate(values) if value is old)
+            values[position] = new
+        self.remove(old)
+        self.add(new, parent, field, position)
+        return new
+
+    def append(self, owner, field, node):
+        """Append node to the list owner.field and index it."""
+        getattr(owner, field).append(node)
+        return self.appended(owner, field)
+
+    def appended(self, owner, field):
+        """Index the node that was just appended to the list owner.field, and return it."""
+        values = getattr(owner, field)
+        node = values[-1]
+        self._discard('leaf', id(owner))
+        if isinstance(node, ast.stmt):
+            self._insert('body', (owner, field))
+        self.add(node, owner, field, len(values) - 1)
+        return node
+
+    def copy(self, memo):
+        """
+        Return the index of the copy of the tree that copy.deepcopy(self.root, memo) made, by
+        translating every entry through memo instead of walking the copy.
+        """
+        index = NodeIndex.__new__(NodeIndex)
+        index.root = memo[id(self.root)]
+        index.entries = {category: [memo[id(node)] for node in self.entries[category]]
+                         for category in ('expr', 'stmt', 'leaf')}
+        index.entries['body'] = [(memo[id(owner)], field) for owner, field in self.entries['body']]
+        index._positions = {category: {self._key(category, entry): position for position, entry in enumerate(entries)}
+                            for category, entries in index.entries.items()}
+        index.parents = {id(memo[key]): (None if parent is None else memo[id(parent)], field, position)
+                         for key, (parent, field, position) in self.parents.items()}
+        return index
+
+    def sample(self, category, k=1):
+        """Return up to k distinct entries of a category, drawn uniformly."""
+        entries = self.entries[category]
+        return random.sample(entries, min(k, len(entries)))
+
+    def site_context(self, node):
+        """
+        Return (in_function, in_loop, scope_nodes) for a site: whether it is inside a function,
+        whether break/continue are legal there, and the enclosing def/class/lambda/comprehension
+        nodes from the outermost to the innermost.
+        """
+        in_function = False
+        in_loop = None
+        scope_nodes = []
+        for child, parent, field in self.ancestors(node):
+            if isinstance(parent, (_SCOPE_NODES, _COMPREHENSION_NODES)):
+                scope_nodes.append(parent)
+                in_function = in_function or isinstance(parent, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda))
+                if in_loop is None:
+                    in_loop = False
+            elif in_loop is None and isinstance(parent, (ast.For, ast.AsyncFor, ast.While)) and field == 'body':
+                in_loop = True
+        return in_function, bool(in_loop), scope_nodes[::-1]
+
+def _site_scope(scope_nodes):
+    scope = Scope()
+    for node in scope_nodes:
+        if isinstance(node, _COMPREHENSION_NODES):
+            scope = scope.child('comprehension', is_async=scope.can_await)
+        else:
+            scope = Scope.of(node, parent=scope)
+    return scope
+
+def _is_mutation_site(index, node, grammar):
+    parent, field, _ = index.parent(node)
+    if parent is None or isinstance(parent, (ast.JoinedStr, ast.pattern)):
+        return False
+    if isinstance(node, ast.expr):
+        if not isinstance(getattr(node, 'ctx', None), (ast.Load, type(None))):
+            return False
+        if grammar and (isinstance(node, (ast.Starred, ast.Slice)) or
+                        any(isinstance(p, (ast.JoinedStr, ast.pattern)) for _, p, _ in index.ancestors(node))):
+            return False
+    return True
+
+def _nonlocal_names(nodes):
+    """Names declared by the nonlocal statements among nodes and below them."""
+    return {name for node in nodes for sub in iter_nodes(node, ast.Nonlocal) for name in sub.names}
+
+def _release_bindings(scope, node, nonlocal_names):
+    """
+    Before node is replaced in grammar mode, take the names it binds out of the scope it is in,
+    so that no nonlocal statement generated in its place counts on them. Returns False, leaving
+    the scope alone, if an existing nonlocal statement may count on one of them: node has to stay.
+    """
+    bound = Scope.of(node).bound
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        bound.add(node.name)
+    if not nonlocal_names.isdisjoint(bound):
+        return False
+    scope.bound -= bound
+    return True
+
+def mutate_indexed_sites(input_node, sites=1, max_depth=3, grammar=False, index=None, executed=None):
+    """
+    Replace `sites` randomly chosen expressions or statements below input_node with freshly
+    generated ones of the same category.
+
+    Unlike mutate_ast_subtree, which visits every node and rolls a die for each, the sites are
+    sampled straight from a NodeIndex. Given the index of input_node, as spawn_child() carries it
+    over from the parent, the cost is that of the generated subtrees alone; without one, building
+    it walks the whole tree first. Only expressions in load position are replaced. Each
+    replacement updates the index, so later sites are drawn from the tree as it now is.
+
+    :param input_node: The root AST node to mutate, in place; it is never replaced itself.
+    :param sites: Number of replacements to make.
+    :param max_depth: Maximum depth for generating new random nodes.
+    :param grammar: Generate replacements in the Scope of each site (see mutate_ast_subtree).
+    :param index: A NodeIndex of input_node to use and keep up to date; built when None.
+    :param executed: Statement numbers that ran in the parent (see ast_liv.coverage); a site
+        drawn outside them is kept with probability dead_code_weight and otherwise drawn again,
+        up to a few times.
+    :return: The NodeIndex of the mutated tree.
+    """
+    if index is None:
+        index = NodeIndex(input_node)
+    if executed is not None:
+        from ast_liv.coverage import site_weight
+    if grammar:
+        nonlocal_names = {name for node in index.entries['stmt'] if isinstance(node, ast.Nonlocal) for name in node.names}
+    with profiler.phase('mutate'):
+        for _ in range(sites):
+            expr_count = len(index.entries['expr'])
+            total = expr_count + len(index.entries['stmt'])
+            if not total:
+                break
+            for _ in range(8 if executed is not None else 1):
+                pick = random.randrange(total)
+                node = index.entries['expr'][pick] if pick < expr_count else index.entries['stmt'][pick - expr_count]
+                if executed is None or random.random() < site_weight(node, executed, dead_code_weight):
+                    break
+            if not _is_mutation_site(index, node, grammar):
+                continue
+            in_function, in_loop, scope_nodes = index.site_context(node)
+            scope = _site_scope(scope_nodes) if grammar else None
+            if grammar and not _release_bindings(scope, node, nonlocal_names):
+                continue
+            with profiler.phase('generate'):
+                if isinstance(node, ast.expr):
+                    candidate = random_expr(max_depth, in_function=in_function, scope=scope)
+                elif grammar:
+                    candidate = random_stmt(max_depth, in_loop=in_loop, scope=scope)
+                else:
+                    candidate = random_stmt(max_depth, in_function=in_function, in_loop=in_loop)
+            profiler.generated(candidate)
+            if isinstance(candidate, (ast.expr, ast.stmt)) and isinstance(node, ast.expr) == isinstance(candidate, ast.expr):
+                # Locate only the new subtree, at the position of the node it replaces.
+                ast.fix_missing_locations(ast.copy_location(candidate, node))
+                index.replace(node, candidate)
+                if grammar:
+                    nonlocal_names |= _nonlocal_names([candidate])
+    return index
+
 def mutate_ast(node):
     """
-    Recursively traverse and smartly mutate AST nodes.
+    Traverse and smartly mutate AST nodes, without recursion.
     - For numeric constants, add a small random offset.
     - For binary operations, with some probability, swap the operator.
     """
-    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
-        delta = random.choice([i for i in range(-2, 3) if i != 0])
-        node.value += delta
-    elif isinstance(node, ast.BinOp):
-        if random.random() < 0.5:
-            ops = [ast.Add(), ast.Sub(), ast.Mult(), ast.Div()]
-            node.op = random.choice(ops)
-    for field, value in ast.iter_fields(node):
-        if isinstance(value, list):
-            for item in value:
-                if isinstance(item, ast.AST):
-                    mutate_ast(item)
-        elif isinstance(value, ast.AST):
-            mutate_ast(value)
+    for sub in iter_nodes(node, (ast.Constant, ast.BinOp)):
+        if isinstance(sub, ast.Constant):
+            if isinstance(sub.value, (int, float)):
+                sub.value += random.choice([i for i in range(-2, 3) if i != 0])
+        elif random.random() < 0.5:
+            sub.op = random.choice([ast.Add(), ast.Sub(), ast.Mult(), ast.Div()])
     return node
+
+def iter_nodes(node, node_class=None):
+    """
+    Yield node and every AST node below it depth-first, in field order, optionally only those
+    that are instances of node_class (a class or tuple of classes).
+
+    The walk keeps an explicit stack of the nodes still to visit instead of recursing, so deep
+    trees never raise RecursionError, and it holds only the unvisited siblings along the current
+    path, not lists per level. A node's children are read when the walk resumes after yielding
+    it, so the caller may replace its fields and the walk descends into the new ones.
+    """
+    stack = [node]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        sub = pop()
+        if node_class is None or isinstance(sub, node_class):
+            yield sub
+        for field in reversed(sub._fields):
+            value = getattr(sub, field, None)
+            if isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.AST):
+                        push(item)
+            elif isinstance(value, ast.AST):
+                push(value)
+
+def iter_leaves(node, node_class=None):
+    """Yield the nodes under node, node included, that have no child nodes, in the order of iter_nodes()."""
+    stack = [node]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        sub = pop()
+        pending = len(stack)
+        for field in reversed(sub._fields):
+            value = getattr(sub, field, None)
+            if isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.AST):
+                        push(item)
+            elif isinstance(value, ast.AST):
+                push(value)
+        if len(stack) == pending and (node_class is None or isinstance(sub, node_class)):
+            yield sub
+
+def tree_size(node):
+    """Number of AST nodes in the tree rooted at node."""
+    return sum(1 for _ in iter_nodes(node))
+
+def tree_depth(node):
+    """Length of the longest root-to-leaf path of the tree rooted at node, without recursion."""
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+    return deepest
+
+class BudgetExceeded(ValueError):
+    """A mutant is larger than max_tree_nodes or deeper than max_tree_depth."""
+
+def check_budget(node):
+    """
+    Raise BudgetExceeded if node is larger than max_tree_nodes or deeper than max_tree_depth.
+    Drivers treat the error like any other failed mutation attempt, so bloated mutants never
+    become a generation.
+    """
+    if max_tree_nodes is not None:
+        size = tree_size(node)
+        if size > max_tree_nodes:
+            raise BudgetExceeded(f'{size} nodes exceeds the budget of {max_tree_nodes}')
+    if max_tree_depth is not None:
+        depth = tree_depth(node)
+        if depth > max_tree_depth:
+            raise BudgetExceeded(f'depth {depth} exceeds the budget of {max_tree_depth}')
+
+# Nodes that make dead code matter: they bind names (changing what is local to the scope),
+# declare names, turn a function into a generator, or give it a __class__ cell.
+_BINDING_NODES = (ast.Global, ast.Nonlocal, ast.Yield, ast.YieldFrom, ast.Import, ast.ImportFrom,
+                  ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.NamedExpr)
+
+def _dead_code_is_inert(stmts):
+    for stmt in stmts:
+        for node in iter_nodes(stmt):
+            if isinstance(node, _BINDING_NODES):
+                return False
+            if isinstance(node, ast.Name) and (not isinstance(node.ctx, ast.Load) or node.id in ('super', '__class__')):
+                return False
+            if isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+                return False
+            if isinstance(node, ast.MatchMapping) and node.rest:
+                return False
+    return True
+
+def _fold_is_small(node, values):
+    # Refuse folds whose result could be huge: 9 ** 9 ** 9, 'x' * 10 ** 9, 1 << 10 ** 9.
+    if isinstance(node, ast.BinOp):
+        left, right = values
+        if isinstance(node.op, (ast.Pow, ast.LShift)):
+            return isinstance(right, (int, float)) and abs(right) <= 64 and not isinstance(left, (str, bytes, tuple))
+        if isinstance(node.op, ast.Mult):
+            for sequence, count in ((left, right), (right, left)):
+                if isinstance(sequence, (str, bytes, tuple)) and isinstance(count, int) and count > 64:
+                    return False
+        if isinstance(node.op, ast.MatMult):
+            return False
+    return True
+
+def fold_constant(node):
+    """
+    Return a Constant equal to a BinOp, UnaryOp, BoolOp or Compare whose operands are all
+    constants, or None when folding is unsafe: the expression raises, compares identity, or
+    would produce a huge or non-literal value.
+    """
+    import math
+    if isinstance(node, ast.BinOp):
+        operands = [node.left, node.right]
+    elif isinstance(node, ast.UnaryOp):
+        operands = [node.operand]
+    elif isinstance(node, ast.BoolOp):
+        operands = node.values
+    elif isinstance(node, ast.Compare):
+        if any(isinstance(op, (ast.Is, ast.IsNot)) for op in node.ops):
+            return None
+        operands = [node.left] + node.comparators
+    else:
+        return None
+    if not all(isinstance(operand, ast.Constant) for operand in operands):
+        return None
+    if not _fold_is_small(node, [operand.value for operand in operands]):
+        return None
+    try:
+        value = eval(compile(ast.fix_missing_locations(ast.Expression(body=node)), '<fold>', 'eval'), {'__builtins__': {}})
+    except Exception:
+        return None
+    if isinstance(value, (str, bytes)) and len(value) > 256:
+        return None
+    if isinstance(value, int) and value.bit_length() > 256:
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, complex) and not (math.isfinite(value.real) and math.isfinite(value.imag)):
+        return None
+    if not isinstance(value, (bool, int, float, complex, str, bytes, type(None))):
+        return None
+    return ast.copy_location(ast.Constant(value=value), node)
+
+class Simplifier(ast.NodeTransformer):
+    """
+    Shrink a tree without changing what it does:
+
+    - fold operators applied to constants (see fold_constant);
+    - drop statements after return/raise/break/continue in the same block, unless they bind
+      or declare a name, or contain a yield;
+    - drop expression statements that are a bare constant, except a docstring;
+    - drop pass statements from blocks that have other statements.
+
+    A block left empty gets a single pass, or disappears if it is an else/finally clause that
+    may be empty. Match patterns are left alone, since they only accept literal forms.
+    """
+
+    def generic_visit(self, node):
+        docstrings = {}
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first = node.body[0] if node.body else None
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+                docstrings['body'] = first
+        node = super().generic_visit(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                setattr(node, field, self.simplify_block(node, field, value, docstrings.get(field)))
+        return node
+
+    def simplify_block(self, owner, field, stmts, docstring):
+        block = []
+        for i, stmt in enumerate(stmts):
+            if stmt is docstring:
+                block.append(stmt)
+                continue
+            if isinstance(stmt, ast.Pass) or (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant)):
+                continue
+            block.append(stmt)
+            if isinstance(stmt, (ast.Return, ast.Raise, ast.Break, ast.Continue)) and _dead_code_is_inert(stmts[i + 1:]):
+                break
+        if block:
+            return block
+        if field == 'orelse' or (field == 'finalbody' and getattr(owner, 'handlers', None)):
+            return []
+        return [ast.copy_location(ast.Pass(), stmts[0])]
+
+    def visit_folded(self, node):
+        node = super().generic_visit(node)
+        return fold_constant(node) or node
+
+    visit_BinOp = visit_UnaryOp = visit_BoolOp = visit_Compare = visit_folded
+
+    def visit_pattern(self, node):
+        return node
+
+    visit_MatchValue = visit_MatchSingleton = visit_MatchSequence = visit_MatchMapping = visit_pattern
+    visit_MatchClass = visit_MatchStar = visit_MatchAs = visit_MatchOr = visit_pattern
+
+def simplify(node):
+    """
+    Simplify the tree rooted at node in place with Simplifier.
+
+    :return: The node counts (before, after).
+    """
+    before = tree_size(node)
+    with profiler.phase('simplify'):
+        Simplifier().visit(node)
+    after = tree_size(node)
+    profiler.count('nodes_simplified_away', before - after)
+    return before, after
+
 with open(__file__, 'r') as f:
     base_code = f.read()
 
+def count_identifiers_from_code(base_code) -> dict:
+    """
+    Counts every identifier occurrence in the given Python source code.
+
+    Accepts either a source string or an already parsed ast.Module, so callers that
+    keep the lineage in memory do not have to unparse it first.
+
+    :param base_code: A string containing Python source code, or a parsed AST.
+    :return: A dict mapping identifier name to the number of times it occurs.
+    """
+    tree = base_code if isinstance(base_code, ast.AST) else ast.parse(base_code)
+    counts = {}
+    # in the order a recursive visitor meets them, which is the order names are drawn from
+    for node in iter_nodes(tree, (ast.Name, ast.FunctionDef, ast.ClassDef, ast.arg)):
+        if isinstance(node, ast.Name):
+            name = node.id
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        else:
+            name = node.name
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
 def get_identifiers_from_code(base_code: str) -> list:
     """
     Extracts all identifier names from the given Python source code.
@@ -107,166 +1357,556 @@ def get_identifiers_from_code(base_code: str) -> list:
     :param source_code: A string containing Python source code.
     :return: A list of unique identifier names found in the source code.
     """
-    tree = ast.parse(base_code)
-    identifiers = set()
+    return list(count_identifiers_from_code(base_code))
 
-    class IdentifierVisitor(ast.NodeVisitor):
+class IdentifierPool:
+    """
+    Identifier names of one source revision, ready for O(1) random draws.
 
-        def visit_Name(self, node):
-            identifiers.add(node.id)
-            self.generic_visit(node)
+    The source is parsed once when the pool is built, unless it is given as the
+    {name: count} dict count_identifiers_from_code() would return for it. `names` holds
+    every distinct identifier and `weighted_names` repeats each one as often as it
+    occurs, so a uniform draw from it is a draw weighted by frequency.
+    """
 
-        def visit_FunctionDef(self, node):
-            identifiers.add(node.name)
-            self.generic_visit(node)
+    def __init__(self, base_code):
+        self.source = base_code
+        self.counts = dict(base_code) if isinstance(base_code, dict) else count_identifiers_from_code(base_code)
+        self.names = list(self.counts)
+        self.weighted_names = [name for name, count in self.counts.items() for _ in range(count)]
+        self.draws = 0
 
-        def visit_ClassDef(self, node):
-            identifiers.add(node.name)
-            self.generic_visit(node)
+    def __len__(self):
+        return len(self.names)
+
+    def draw(self, weighted=False):
+        self.draws += 1
+        return draws.choice(self.weighted_names if weighted else self.names)
+
+_identifier_pool = None
+weighted_names = False
+# Generate mutations with the grammar-directed (Scope-aware) generator.
+grammar_mode = False
+# When non-zero, replace this many sampled sites (mutate_indexed_sites) instead of visiting every node.
+mutation_sites = 0
+# Simplify every mutant with Simplifier, and reject mutants over these sizes (None: no limit).
+simplify_mode = False
+max_tree_nodes = None
+max_tree_depth = None
+# When non-zero, half the attempts of run_generations() tune the parent's numeric constants in
+# batches of this many variants (tune_child) instead of mutating its structure.
+tune_batch = 0
+# Make half the attempts of run_generations() by editing the parent's code object (edit_child_code).
+bytecode_mode = False
+# Record which statements of evolved_function run (ast_liv.coverage) and mutate statements that
+# did not run in the parent dead_code_weight times as often as those that did.
+coverage_mode = False
+dead_code_weight = 0.1
+# The mutType drawn by the last mutate_function_tree() call, for the lineage database (ast_liv.lineage).
+last_mutation_type = None
+# The NodeIndex of the definition the last mutate_function_tree() or spawn_child() call mutated,
+# or None when it kept none up to date.
+last_node_index = None
+
+class NullProfiler:
+    """
+    The profiler in effect unless one is installed with set_profiler(). Every hook does nothing,
+    and phase() hands back the profiler itself as an empty context manager, so instrumented code
+    costs a method call per phase and can stay in place for production runs.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+    def generated(self, node):
+        pass
+
+    def end_generation(self, index):
+        pass
+
+    def close(self):
+        pass
+
+profiler = NullProfiler()
 
-        def visit_arg(self, node):
-            identifiers.add(node.arg)
-            self.generic_visit(node)
-    IdentifierVisitor().visit(tree)
-    return list(identifiers)
+def set_profiler(new_profiler):
+    """
+    Install new_profiler (e.g. an ast_liv.profiling.Profiler) for all instrumented phases,
+    or restore the no-op profiler when given None.
+    """
+    global profiler
+    profiler = new_profiler if new_profiler is not None else NullProfiler()
+
+class RandomDraws:
+    """
+    Where random_expr(), random_stmt() and random_name() get their random decisions from, unless
+    another source is installed with set_draws(). Every draw comes straight from `random`: the
+    methods are the module's own functions, so going through this object costs nothing.
+    """
+
+    def __init__(self):
+        self.random = random.random
+        self.randint = random.randint
+        self.choice = random.choice
+        self.choices = random.choices
+        self.uniform = random.uniform
+
+    def reset(self):
+        """Drop decisions drawn ahead of time; nothing is, here."""
+
+draws = RandomDraws()
+
+def set_draws(new_draws):
+    """
+    Install new_draws (e.g. an ast_liv.draws.BlockDraws) as the source of generator decisions,
+    or restore the default when given None.
+    """
+    global draws
+    draws = new_draws if new_draws is not None else RandomDraws()
+
+def seed_random(seed=None):
+    """Seed `random`, dropping any decisions the draw source took from its previous state."""
+    random.seed(seed)
+    draws.reset()
+
+def set_base_code(code):
+    """
+    Point random_name() at a new source revision (a source string or a parsed ast.Module).
+    The identifier pool is rebuilt lazily on the next draw.
+    """
+    global base_code
+    base_code = code
+
+def get_identifier_pool():
+    """
+    Return the identifier pool for the current base_code, rebuilding it only when
+    base_code has been replaced by a different revision.
+    """
+    global _identifier_pool
+    if _identifier_pool is None or _identifier_pool.source is not base_code:
+        _identifier_pool = IdentifierPool(base_code)
+    return _identifier_pool
 
 def random_name():
-    names = get_identifiers_from_code(base_code)
-    if names and random.random() < 0.9:
-        return random.choice(names)
+    profiler.count('names_drawn')
+    pool = get_identifier_pool()
+    if pool.names and draws.random() < 0.9:
+        return pool.draw(weighted_names)
     else:
-        length = random.randint(3, 8)
-        name = random.choice(string.ascii_lowercase)
-        name += ''.join(random.choices(string.ascii_lowercase + string.digits, k=length - 1))
+        length = draws.randint(3, 8)
+        name = draws.choice(string.ascii_lowercase)
+        name += ''.join(draws.choices(NAME_CHARACTERS, k=length - 1))
         return name
 
-def random_expr(max_depth, in_function=False):
-    """Recursively generate a random ast.expr node."""
+class Scope:
+    """
+    Where generated code is going to live, for the grammar-directed generator.
+
+    A Scope knows its kind ('module', 'class', 'function', 'lambda' or 'comprehension'), whether it
+    is the body of an async def, and which names it binds, uses and declares global/nonlocal.
+    random_expr() and random_stmt() given a scope only emit constructs that compile there, draw
+    loaded names from bound ones where they can, and record every name they bind or use.
+    """
+
+    def __init__(self, kind='module', parent=None, is_async=False):
+        self.kind = kind
+        self.parent = parent
+        self.is_async = is_async
+        self.bound = set()
+        self.used = set()
+        self.declared = set()
+
+    @classmethod
+    def of(cls, node, parent=None):
+        """
+        Scope for the body of an existing def, class, lambda or module, seeded with every name it
+        already binds, uses or declares, so that new global/nonlocal statements never conflict.
+        """
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            kind = 'function'
+        elif isinstance(node, ast.Lambda):
+            kind = 'lambda'
+        elif isinstance(node, ast.ClassDef):
+            kind = 'class'
+        else:
+            kind = 'module'
+        scope = cls(kind, parent, isinstance(node, ast.AsyncFunctionDef))
+        # Uses anywhere below count (a global statement must not follow them), but bindings and
+        # declarations only count in the scope's own body, not inside nested scopes.
+        scope.used.update(sub.id for sub in iter_nodes(node, ast.Name))
+        scope.used.update(name for sub in iter_nodes(node, (ast.Global, ast.Nonlocal)) for name in sub.names)
+        stack = [node]
+        while stack:
+            sub = stack.pop()
+            if sub is not node and isinstance(sub, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                scope.bound.add(sub.name)
+                continue
+            if sub is not node and isinstance(sub, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp,
+                                                    ast.GeneratorExp)):
+                continue
+            if isinstance(sub, ast.Name) and not isinstance(sub.ctx, ast.Load):
+                scope.bound.add(sub.id)
+            elif isinstance(sub, ast.arg):
+                scope.bound.add(sub.arg)
+            elif isinstance(sub, (ast.Global, ast.Nonlocal)):
+                scope.declared.update(sub.names)
+            elif isinstance(sub, ast.alias):
+                scope.bound.add((sub.asname or sub.name).split('.')[0])
+            elif isinstance(sub, ast.ExceptHandler) and sub.name:
+                scope.bound.add(sub.name)
+            stack.extend(ast.iter_child_nodes(sub))
+        scope.used |= scope.bound | scope.declared
+        return scope
+
+    def child(self, kind, is_async=False):
+        return Scope(kind, self, is_async)
+
+    def snapshot(self):
+        return set(self.bound), set(self.used), set(self.declared)
+
+    def restore(self, snapshot):
+        """Forget what was generated since snapshot(), e.g. for a candidate that was thrown away."""
+        self.bound, self.used, self.declared = snapshot
+
+    def use(self, name):
+        # Lambdas and comprehensions are nested scopes, but a global statement in the enclosing
+        # scope still must not follow a use of the name inside them.
+        scope = self
+        while scope is not None:
+            scope.used.add(name)
+            if scope.kind not in ('lambda', 'comprehension'):
+                break
+            scope = scope.parent
+
+    def hidden_names(self):
+        """
+        Names declared global or nonlocal in the block this scope's code is checked in. Code added
+        to an existing body may land before the declaration, so these are never drawn.
+        """
+        names = set(self.declared)
+        scope = self
+        while scope.kind in ('lambda', 'comprehension') and scope.parent is not None:
+            scope = scope.parent
+            names |= scope.declared
+        return names
+
+    @property
+    def can_yield(self):
+        return self.kind == 'function' and not self.is_async
+
+    @property
+    def can_assign_expr(self):
+        # A walrus is refused anywhere in a comprehension, even inside a lambda there.
+        scope = self
+        while scope.kind == 'lambda':
+            scope = scope.parent
+        return scope is None or scope.kind != 'comprehension'
+
+    @property
+    def can_await(self):
+        return self.is_async and self.kind in ('function', 'comprehension')
+
+    def visible_names(self):
+        names = set(self.bound)
+        scope = self.parent
+        while scope is not None:
+            if scope.kind != 'class':
+                names |= scope.bound
+            scope = scope.parent
+        return names
+
+    def nonlocal_candidates(self):
+        """Names bound in an enclosing function that this scope has not touched yet."""
+        if self.kind != 'function':
+            return []
+        names = set()
+        # a global or nonlocal statement on the way out hides the name from nested scopes
+        hidden = set()
+        scope = self.parent
+        while scope is not None and scope.kind != 'module':
+            hidden |= scope.declared
+            if scope.kind == 'function':
+                names |= scope.bound - hidden
+            scope = scope.parent
+        return sorted(names - self.used - self.bound - self.declared)
+
+    def safe_name(self):
+        hidden = self.hidden_names()
+        name = random_name()
+        while keyword.iskeyword(name) or name == '__debug__' or name in hidden:
+            name = random_name()
+        return name
+
+    def fresh_name(self):
+        name = self.safe_name()
+        while name in self.used:
+            name = self.safe_name()
+        self.use(name)
+        return name
+
+    def load_name(self):
+        visible = self.visible_names() - self.hidden_names()
+        if visible and draws.random() < 0.7:
+            name = draws.choice(sorted(visible))
+        else:
+            name = self.safe_name()
+        self.use(name)
+        return name
+
+    def store_name(self):
+        bound = self.bound - self.hidden_names()
+        if bound and draws.random() < 0.5:
+            name = draws.choice(sorted(bound))
+        else:
+            name = self.safe_name()
+        self.bound.add(name)
+        self.use(name)
+        return name
+
+    def expr_types(self):
+        key = (self.can_assign_expr, self.can_await, self.can_yield)
+        types = _SCOPE_EXPR_TYPES.get(key)
+        if types is None:
+            types = [t for t in EXPR_TYPES if t not in ('await', 'starred', 'slice')]
+            if not self.can_assign_expr:
+                types.remove('namedexpr')
+            if self.can_await:
+                types.append('await')
+            if self.can_yield:
+                types.append('yield')
+            types = _SCOPE_EXPR_TYPES[key] = tuple(types)
+        return types
+
+    def stmt_types(self):
+        in_function = self.kind == 'function'
+        key = (in_function, in_function and self.is_async, in_function and bool(self.nonlocal_candidates()))
+        types = _SCOPE_STMT_TYPES.get(key)
+        if types is None:
+            types = [t for t in STMT_TYPES if t not in ('async_for', 'async_with', 'return', 'nonlocal')]
+            if in_function:
+                types.append('return')
+                if self.is_async:
+                    types += ['async_for', 'async_with']
+                if key[2]:
+                    types.append('nonlocal')
+            types = _SCOPE_STMT_TYPES[key] = tuple(types)
+        return types
+
+EXPR_TYPES = (
+    'binop', 'boolop', 'unaryop', 'compare', 'call', 'attribute', 'subscript',
+    'ifexp', 'lambda', 'list', 'tuple', 'dict', 'set', 'listcomp', 'setcomp',
+    'dictcomp', 'genexp', 'namedexpr', 'await', 'joinedstr', 'bytes',
+    'ellipsis', 'starred', 'slice'
+)
+EXPR_TYPES_IN_FUNCTION = EXPR_TYPES + ('yield',)
+
+STMT_TYPES = (
+    'assign', 'augassign', 'if', 'for', 'async_for', 'while',
+    'funcdef', 'async_funcdef', 'annassign', 'class',
+    'with', 'async_with', 'try', 'expr', 'return',
+    'import', 'importfrom', 'global', 'delete',
+    'assert', 'raise', 'nonlocal', 'match'
+)
+# Leaf statements by (in_loop, in_function).
+SIMPLE_STMT_TYPES = {
+    (in_loop, in_function): (('break', 'continue') if in_loop else ()) + (('return',) if in_function else ()) + ('pass', 'expr')
+    for in_loop in (False, True) for in_function in (False, True)
+}
+# Expression and statement types a Scope allows, by the properties they depend on.
+_SCOPE_EXPR_TYPES = {}
+_SCOPE_STMT_TYPES = {}
+
+# Operators are stateless and shared between nodes, as they are in parsed trees.
+BINARY_OPERATORS = (ast.Add(), ast.Sub(), ast.Mult(), ast.Div(), ast.Mod(), ast.Pow(), ast.BitAnd(), ast.BitOr(),
+                    ast.BitXor(), ast.LShift(), ast.RShift(), ast.FloorDiv())
+BOOLEAN_OPERATORS = (ast.And(), ast.Or())
+UNARY_OPERATORS = (ast.UAdd(), ast.USub(), ast.Not(), ast.Invert())
+COMPARISON_OPERATORS = (ast.Eq(), ast.NotEq(), ast.Lt(), ast.Gt(), ast.LtE(), ast.GtE(), ast.Is(), ast.IsNot(),
+                        ast.In(), ast.NotIn())
+NAME_CHARACTERS = string.ascii_lowercase + string.digits
+# Kinds of leaf constant, each as likely as the others.
+CONSTANT_KINDS = ('int', 'float', 'str', True, False, None)
+_FUNCTION_HAS_TYPE_PARAMS = 'type_params' in ast.FunctionDef._fields
+_FUNCTION_HAS_TYPE_COMMENT = 'type_comment' in ast.FunctionDef._fields
+_CLASS_HAS_TYPE_PARAMS = 'type_params' in ast.ClassDef._fields
+_WITH_HAS_TYPE_COMMENT = 'type_comment' in ast.With._fields
+
+def load_name(scope):
+    return random_name() if scope is None else scope.load_name()
+
+def store_name(scope):
+    return random_name() if scope is None else scope.store_name()
+
+def maybe_starred(node, scope):
+    """In grammar mode, occasionally unpack an element of a call, list, tuple or set."""
+    if scope is not None and draws.random() < 0.1:
+        return ast.Starred(value=node, ctx=ast.Load())
+    return node
+
+def random_expr(max_depth, in_function=False, scope=None):
+    """
+    Recursively generate a random ast.expr node.
+
+    With a Scope, the grammar-directed mode is used: only expressions that compile at that
+    position are chosen (no stray await, yield, starred or slice nodes) and names come from it.
+    """
+    if scope is not None:
+        in_function = scope.can_yield
     if max_depth <= 0:
-        if random.random() < 0.5:
-            value_choices = [random.randint(-100, 100), random.uniform(-100, 100), ''.join(random.choices(string.ascii_lowercase, k=5)), True, False, None]
-            return ast.Constant(value=random.choice(value_choices))
+        if draws.random() < 0.5:
+            # only the kind that was picked is drawn
+            value = draws.choice(CONSTANT_KINDS)
+            if value == 'int':
+                value = draws.randint(-100, 100)
+            elif value == 'float':
+                value = draws.uniform(-100, 100)
+            elif value == 'str':
+                value = ''.join(draws.choices(string.ascii_lowercase, k=5))
+            if scope is not None and isinstance(value, (int, float)) and value < 0:
+                # As parsed code has it: unparsed as an operand (await -1, -1 ** 2), a negative
+                # constant is not parenthesised, and reads back differently or not at all.
+                return ast.UnaryOp(op=UNARY_OPERATORS[1], operand=ast.Constant(value=-value))
+            return ast.Constant(value=value)
         else:
-            return ast.Name(id=random_name(), ctx=ast.Load())
-    expr_type = random.choice([
-        'binop', 'boolop', 'unaryop', 'compare', 'call', 'attribute', 'subscript',
-        'ifexp', 'lambda', 'list', 'tuple', 'dict', 'set', 'listcomp', 'setcomp',
-        'dictcomp', 'genexp', 'namedexpr', 'await', 'joinedstr', 'bytes',
-        'ellipsis', 'starred', 'slice'
-    ] + (['yield'] if in_function else []))
+            return ast.Name(id=load_name(scope), ctx=ast.Load())
+    if scope is None:
+        expr_type = draws.choice(EXPR_TYPES_IN_FUNCTION if in_function else EXPR_TYPES)
+    else:
+        expr_type = draws.choice(scope.expr_types())
     if expr_type == 'binop':
-        left = random_expr(max_depth - 1, in_function=in_function)
-        right = random_expr(max_depth - 1, in_function=in_function)
-        op = random.choice([ast.Add(), ast.Sub(), ast.Mult(), ast.Div(), ast.Mod(), ast.Pow(), ast.BitAnd(), ast.BitOr(), ast.BitXor(), ast.LShift(), ast.RShift(), ast.FloorDiv()])
+        left = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        right = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        op = draws.choice(BINARY_OPERATORS)
         return ast.BinOp(left=left, op=op, right=right)
     elif expr_type == 'boolop':
-        op = random.choice([ast.And(), ast.Or()])
-        values = [random_expr(max_depth - 1, in_function=in_function) for _ in range(random.randint(2, 3))]
+        op = draws.choice(BOOLEAN_OPERATORS)
+        values = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(draws.randint(2, 3))]
         return ast.BoolOp(op=op, values=values)
     elif expr_type == 'unaryop':
-        op = random.choice([ast.UAdd(), ast.USub(), ast.Not(), ast.Invert()])
-        operand = random_expr(max_depth - 1, in_function=in_function)
+        op = draws.choice(UNARY_OPERATORS)
+        operand = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.UnaryOp(op=op, operand=operand)
     elif expr_type == 'compare':
-        left = random_expr(max_depth - 1, in_function=in_function)
-        num_ops = random.randint(1, 3)
+        left = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        num_ops = draws.randint(1, 3)
         ops = []
         comparators = []
-        comp_ops = [ast.Eq(), ast.NotEq(), ast.Lt(), ast.Gt(), ast.LtE(), ast.GtE(), ast.Is(), ast.IsNot(), ast.In(), ast.NotIn()]
         for _ in range(num_ops):
-            ops.append(random.choice(comp_ops))
-            comparators.append(random_expr(max_depth - 1, in_function=in_function))
+            ops.append(draws.choice(COMPARISON_OPERATORS))
+            comparators.append(random_expr(max_depth - 1, in_function=in_function, scope=scope))
         return ast.Compare(left=left, ops=ops, comparators=comparators)
     elif expr_type == 'call':
-        func_expr = random_expr(max_depth - 1, in_function=in_function)
+        func_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         if isinstance(func_expr, ast.Constant):
-            func_expr = ast.Name(id=random_name(), ctx=ast.Load())
-        args = [random_expr(max_depth - 1, in_function=in_function) for _ in range(random.randint(0, 2))]
+            func_expr = ast.Name(id=load_name(scope), ctx=ast.Load())
+        args = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 2))]
         keywords = []
-        if random.random() < 0.5:
-            kw_name = random_name()
-            kw_value = random_expr(max_depth - 1, in_function=in_function)
+        if draws.random() < 0.5:
+            kw_name = random_name() if scope is None else scope.safe_name()
+            kw_value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             keywords.append(ast.keyword(arg=kw_name, value=kw_value))
         return ast.Call(func=func_expr, args=args, keywords=keywords)
     elif expr_type == 'attribute':
-        value = random_expr(max_depth - 1, in_function=in_function)
-        return ast.Attribute(value=value, attr=random_name(), ctx=ast.Load())
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        return ast.Attribute(value=value, attr=random_name() if scope is None else scope.safe_name(), ctx=ast.Load())
     elif expr_type == 'subscript':
-        value = random_expr(max_depth - 1, in_function=in_function)
-        index = random_expr(max_depth - 1, in_function=in_function)
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if scope is not None and draws.random() < 0.3:
+            index = ast.Slice(*[random_expr(max_depth - 1, scope=scope) if draws.random() < 0.5 else None for _ in range(3)])
+        else:
+            index = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.Subscript(value=value, slice=index, ctx=ast.Load())
     elif expr_type == 'ifexp':
-        cond = random_expr(max_depth - 1, in_function=in_function)
-        body_expr = random_expr(max_depth - 1, in_function=in_function)
-        orelse_expr = random_expr(max_depth - 1, in_function=in_function)
+        cond = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        orelse_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.IfExp(test=cond, body=body_expr, orelse=orelse_expr)
     elif expr_type == 'lambda':
-        num_args = random.randint(0, 2)
-        args_list = [ast.arg(arg=random_name(), annotation=None) for _ in range(num_args)]
+        num_args = draws.randint(0, 2)
+        if scope is None:
+            args_list = [ast.arg(arg=random_name(), annotation=None) for _ in range(num_args)]
+            body_scope = None
+        else:
+            body_scope = scope.child('lambda')
+            args_list = [ast.arg(arg=name, annotation=None) for name in {body_scope.store_name(): None for _ in range(num_args)}]
         lambda_args = ast.arguments(posonlyargs=[], args=args_list, vararg=None, kwonlyargs=[], kw_defaults=[], defaults=[], kwarg=None)
-        body = random_expr(max_depth - 1, in_function=in_function)
+        body = random_expr(max_depth - 1, in_function=in_function, scope=body_scope)
         return ast.Lambda(args=lambda_args, body=body)
     elif expr_type == 'list':
-        elements = [random_expr(max_depth - 1, in_function=in_function) for _ in range(random.randint(0, 3))]
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 3))]
         return ast.List(elts=elements, ctx=ast.Load())
     elif expr_type == 'tuple':
-        elements = [random_expr(max_depth - 1, in_function=in_function) for _ in range(random.randint(0, 3))]
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(0, 3))]
         return ast.Tuple(elts=elements, ctx=ast.Load())
     elif expr_type == 'dict':
-        n = random.randint(0, 3)
-        keys = [random_expr(max_depth - 1, in_function=in_function) for _ in range(n)]
-        values = [random_expr(max_depth - 1, in_function=in_function) for _ in range(n)]
+        n = draws.randint(0, 3)
+        keys = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(n)]
+        values = [random_expr(max_depth - 1, in_function=in_function, scope=scope) for _ in range(n)]
         return ast.Dict(keys=keys, values=values)
     elif expr_type == 'set':
-        elements = [random_expr(max_depth - 1, in_function=in_function) for _ in range(random.randint(1, 3))]
+        elements = [maybe_starred(random_expr(max_depth - 1, in_function=in_function, scope=scope), scope) for _ in range(draws.randint(1, 3))]
         return ast.Set(elts=elements)
     elif expr_type in ('listcomp', 'setcomp', 'dictcomp', 'genexp'):
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        iter_expr = random_expr(max_depth - 1, in_function=in_function)
-        if random.random() < 0.5:
-            if_cond = random_expr(max_depth - 1, in_function=in_function)
+        if scope is not None:
+            scope = scope.child('comprehension', is_async=scope.can_await)
+            in_function = False
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if draws.random() < 0.5:
+            if_cond = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             comp = ast.comprehension(target=target, iter=iter_expr, ifs=[if_cond], is_async=0)
         else:
             comp = ast.comprehension(target=target, iter=iter_expr, ifs=[], is_async=0)
         if expr_type == 'listcomp':
-            elt = random_expr(max_depth - 1, in_function=in_function)
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.ListComp(elt=elt, generators=[comp])
         elif expr_type == 'setcomp':
-            elt = random_expr(max_depth - 1, in_function=in_function)
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.SetComp(elt=elt, generators=[comp])
         elif expr_type == 'genexp':
-            elt = random_expr(max_depth - 1, in_function=in_function)
+            elt = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.GeneratorExp(elt=elt, generators=[comp])
         elif expr_type == 'dictcomp':
-            key = random_expr(max_depth - 1, in_function=in_function)
-            value = random_expr(max_depth - 1, in_function=in_function)
+            key = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.DictComp(key=key, value=value, generators=[comp])
     elif expr_type == 'namedexpr':
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        value = random_expr(max_depth - 1, in_function=in_function)
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.NamedExpr(target=target, value=value)
     elif expr_type == 'yield':
-        if random.random() < 0.5:
-            val = random_expr(max_depth - 1, in_function=in_function)
+        if draws.random() < 0.5:
+            val = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.Yield(value=val)
         else:
-            val = random_expr(max_depth - 1, in_function=in_function)
+            val = random_expr(max_depth - 1, in_function=in_function, scope=scope)
             return ast.YieldFrom(value=val)
 
     # Extended expression types
     elif expr_type == 'await':
-        return ast.Await(value=random_expr(max_depth - 1, in_function=in_function))
+        return ast.Await(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
     elif expr_type == 'joinedstr':
         fragments = []
-        for _ in range(random.randint(1, 3)):
-            if random.random() < 0.5:
-                fragments.append(ast.Constant(value=''.join(random.choices(string.ascii_lowercase, k=random.randint(1,5)))))
+        for _ in range(draws.randint(1, 3)):
+            if draws.random() < 0.5:
+                fragments.append(ast.Constant(value=''.join(draws.choices(string.ascii_lowercase, k=draws.randint(1,5)))))
             else:
-                fragments.append(ast.FormattedValue(value=random_expr(max_depth - 1, in_function=in_function), conversion=-1))
+                # Nested f-strings can run out of quote styles when unparsed, so grammar mode keeps fields flat.
+                fragments.append(ast.FormattedValue(value=random_expr(max_depth - 1 if scope is None else 0, in_function=in_function, scope=scope), conversion=-1))
         return ast.JoinedStr(values=fragments)
     elif expr_type == 'bytes':
-        length = random.randint(1, 4)
-        value = bytes(random.randint(0, 255) for _ in range(length))
+        length = draws.randint(1, 4)
+        value = bytes(draws.randint(0, 255) for _ in range(length))
         return ast.Constant(value=value)
     elif expr_type == 'ellipsis':
         return ast.Constant(value=Ellipsis)
@@ -278,245 +1918,277 @@ def random_expr(max_depth, in_function=False):
         step = random_expr(max_depth - 1, in_function=in_function)
         return ast.Slice(lower=lower, upper=upper, step=step)
 
-def random_stmt(max_depth, in_function=False, in_loop=False):
-    """Recursively generate a random ast.stmt node."""
+def random_stmt(max_depth, in_function=False, in_loop=False, scope=None):
+    """
+    Recursively generate a random ast.stmt node.
+
+    With a Scope, the grammar-directed mode is used: statements that cannot appear in that scope
+    (return outside a function, async for outside an async def, nonlocal without an enclosing
+    binding, ...) are never chosen, and nested bodies get their own child scopes.
+    """
+    if scope is not None:
+        in_function = scope.kind == 'function'
     if max_depth <= 0:
-        simple_opts = []
-        if in_loop:
-            simple_opts += ['break', 'continue']
-        if in_function:
-            simple_opts += ['return']
-        simple_opts += ['pass', 'expr']
-        choice = random.choice(simple_opts)
+        choice = draws.choice(SIMPLE_STMT_TYPES[bool(in_loop), bool(in_function)])
         if choice == 'break':
             return ast.Break()
         elif choice == 'continue':
             return ast.Continue()
         elif choice == 'return':
-            if random.random() < 0.5:
+            if draws.random() < 0.5:
                 return ast.Return(value=None)
             else:
-                return ast.Return(value=random_expr(0, in_function=in_function))
+                return ast.Return(value=random_expr(0, in_function=in_function, scope=scope))
         elif choice == 'pass':
             return ast.Pass()
         elif choice == 'expr':
-            return ast.Expr(value=random_expr(0, in_function=in_function))
-    stmt_type = random.choice([
-        'assign', 'augassign', 'if', 'for', 'async_for', 'while',
-        'funcdef', 'async_funcdef', 'annassign', 'class',
-        'with', 'async_with', 'try', 'expr', 'return',
-        'import', 'importfrom', 'global', 'delete',
-        'assert', 'raise', 'nonlocal', 'match'
-    ])
+            return ast.Expr(value=random_expr(0, in_function=in_function, scope=scope))
+    if scope is None:
+        stmt_type = draws.choice(STMT_TYPES)
+    else:
+        stmt_type = draws.choice(scope.stmt_types())
     if stmt_type == 'return' and (not in_function):
         stmt_type = 'expr'
     if stmt_type in ('break', 'continue'):
         stmt_type = 'pass'
     if stmt_type == 'assign':
-        num_targets = random.randint(1, 2)
-        targets = [ast.Name(id=random_name(), ctx=ast.Store()) for _ in range(num_targets)]
-        value = random_expr(max_depth - 1, in_function=in_function)
+        num_targets = draws.randint(1, 2)
+        targets = [ast.Name(id=store_name(scope), ctx=ast.Store()) for _ in range(num_targets)]
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.Assign(targets=targets, value=value)
     elif stmt_type == 'augassign':
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        op = random.choice([ast.Add(), ast.Sub(), ast.Mult(), ast.Div(), ast.Mod(), ast.Pow(), ast.BitAnd(), ast.BitOr(), ast.BitXor(), ast.LShift(), ast.RShift(), ast.FloorDiv()])
-        value = random_expr(max_depth - 1, in_function=in_function)
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        op = draws.choice(BINARY_OPERATORS)
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.AugAssign(target=target, op=op, value=value)
     elif stmt_type == 'if':
-        test = random_expr(max_depth - 1, in_function=in_function)
-        body_count = random.randint(1, 3)
-        orelse_count = random.randint(0, 2)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(body_count)]
-        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(orelse_count)] if orelse_count > 0 else []
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 2)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
         return ast.If(test=test, body=body, orelse=orelse)
     elif stmt_type == 'for':
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        iter_expr = random_expr(max_depth - 1, in_function=in_function)
-        body_count = random.randint(1, 3)
-        orelse_count = random.randint(0, 1)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True) for _ in range(body_count)]
-        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(orelse_count)] if orelse_count > 0 else []
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 1)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
         return ast.For(target=target, iter=iter_expr, body=body, orelse=orelse)
     elif stmt_type == 'while':
-        test = random_expr(max_depth - 1, in_function=in_function)
-        body_count = random.randint(1, 3)
-        orelse_count = random.randint(0, 1)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True) for _ in range(body_count)]
-        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(orelse_count)] if orelse_count > 0 else []
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        orelse_count = draws.randint(0, 1)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
         return ast.While(test=test, body=body, orelse=orelse)
-    elif stmt_type == 'funcdef':
-        name = random_name()
-        args_count = random.randint(0, 3)
-        params = [ast.arg(arg=random_name(), annotation=None) for _ in range(args_count)]
+    elif stmt_type in ('funcdef', 'async_funcdef'):
+        name = store_name(scope)
+        args_count = draws.randint(0, 3)
+        if scope is None:
+            params = [ast.arg(arg=random_name(), annotation=None) for _ in range(args_count)]
+            body_scope = None
+        else:
+            body_scope = scope.child('function', is_async=stmt_type == 'async_funcdef')
+            params = [ast.arg(arg=param, annotation=None) for param in {body_scope.store_name(): None for _ in range(args_count)}]
         arguments = ast.arguments(posonlyargs=[], args=params, vararg=None, kwonlyargs=[], kw_defaults=[], defaults=[], kwarg=None)
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=True, in_loop=False) for _ in range(body_count)]
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=True, in_loop=False, scope=body_scope) for _ in range(body_count)]
         if not body:
             body = [ast.Pass()]
+        if stmt_type == 'async_funcdef':
+            return ast.AsyncFunctionDef(name=name, args=arguments, body=body, decorator_list=[], returns=None)
         func_node = ast.FunctionDef(name=name, args=arguments, body=body, decorator_list=[], returns=None)
-        if hasattr(ast.FunctionDef, '_fields') and 'type_params' in ast.FunctionDef._fields:
+        if _FUNCTION_HAS_TYPE_PARAMS:
             func_node.type_params = []
-        if hasattr(ast.FunctionDef, '_fields') and 'type_comment' in ast.FunctionDef._fields:
+        if _FUNCTION_HAS_TYPE_COMMENT:
             func_node.type_comment = None
         return func_node
     elif stmt_type == 'class':
-        name = random_name().capitalize()
+        if scope is None:
+            name = store_name(scope).capitalize()
+        else:
+            # only the capitalised name is bound, so it is drawn and recorded as it is
+            name = scope.safe_name().capitalize()
+            while keyword.iskeyword(name):
+                name = scope.safe_name().capitalize()
+            scope.bound.add(name)
+            scope.use(name)
         bases = []
-        if random.random() < 0.5:
+        if draws.random() < 0.5:
             bases.append(ast.Name(id='object', ctx=ast.Load()))
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=False, in_loop=False) for _ in range(body_count)]
+            if scope is not None:
+                scope.use('object')
+        body_count = draws.randint(1, 3)
+        body_scope = None if scope is None else scope.child('class')
+        body = [random_stmt(max_depth - 1, in_function=False, in_loop=False, scope=body_scope) for _ in range(body_count)]
         if not body:
             body = [ast.Pass()]
         class_node = ast.ClassDef(name=name, bases=bases, keywords=[], body=body, decorator_list=[])
-        if hasattr(ast.ClassDef, '_fields') and 'type_params' in ast.ClassDef._fields:
+        if _CLASS_HAS_TYPE_PARAMS:
             class_node.type_params = []
         return class_node
-    elif stmt_type == 'with':
-        num_items = random.randint(1, 2)
+    elif stmt_type in ('with', 'async_with'):
+        num_items = draws.randint(1, 2)
         items = []
         for _ in range(num_items):
-            context_expr = random_expr(max_depth - 1, in_function=in_function)
-            if random.random() < 0.5:
-                optional_vars = ast.Name(id=random_name(), ctx=ast.Store())
+            context_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+            if draws.random() < 0.5:
+                optional_vars = ast.Name(id=store_name(scope), ctx=ast.Store())
             else:
                 optional_vars = None
             items.append(ast.withitem(context_expr=context_expr, optional_vars=optional_vars))
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(body_count)]
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
         if not body:
             body = [ast.Pass()]
+        if stmt_type == 'async_with':
+            return ast.AsyncWith(items=items, body=body)
         node = ast.With(items=items, body=body)
-        if hasattr(ast.With, '_fields') and 'type_comment' in ast.With._fields:
+        if _WITH_HAS_TYPE_COMMENT:
             node.type_comment = None
         return node
     elif stmt_type == 'try':
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(body_count)]
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(body_count)]
         if not body:
             body = [ast.Pass()]
         handlers = []
         orelse = []
         finalbody = []
-        if random.random() < 0.7:
-            num_handlers = random.randint(1, 2)
-            for _ in range(num_handlers):
-                exc_type = ast.Name(id='Exception', ctx=ast.Load()) if random.random() < 0.5 else None
-                exc_name = random_name() if random.random() < 0.5 else None
-                h_body_count = random.randint(1, 2)
-                h_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(h_body_count)]
-                if not h_body:
-                    h_body = [ast.Pass()]
+        if draws.random() < 0.7:
+            num_handlers = draws.randint(1, 2)
+            h_body_counts = []
+            for i in range(num_handlers):
+                exc_type = ast.Name(id='Exception', ctx=ast.Load()) if draws.random() < 0.5 else None
+                if scope is not None and exc_type is None and i < num_handlers - 1:
+                    # A bare except: must be the last handler.
+                    exc_type = ast.Name(id='Exception', ctx=ast.Load())
+                if scope is not None and exc_type is not None:
+                    scope.use('Exception')
+                # a bare except: takes no name, so none is bound for it
+                exc_name = store_name(scope) if draws.random() < 0.5 and (scope is None or exc_type is not None) else None
+                h_body_count = draws.randint(1, 2)
+                h_body = []
+                if scope is None:
+                    h_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(h_body_count)]
+                h_body_counts.append(h_body_count)
                 handlers.append(ast.ExceptHandler(type=exc_type, name=exc_name, body=h_body))
-            if random.random() < 0.5:
-                else_count = random.randint(1, 2)
-                orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(else_count)]
-        if not handlers or random.random() < 0.5:
-            final_count = random.randint(1, 2)
-            finalbody = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(final_count)]
+            if draws.random() < 0.5:
+                else_count = draws.randint(1, 2)
+                orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(else_count)]
+            if scope is not None:
+                # The symbol table visits the else: block before the handlers, so their bodies are
+                # generated after it, or a global there could follow a use of its name in else:.
+                for handler, h_body_count in zip(handlers, h_body_counts):
+                    handler.body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(h_body_count)]
+            for handler in handlers:
+                if not handler.body:
+                    handler.body = [ast.Pass()]
+        if not handlers or draws.random() < 0.5:
+            final_count = draws.randint(1, 2)
+            finalbody = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(final_count)]
             if not finalbody:
                 finalbody = [ast.Pass()]
         return ast.Try(body=body, handlers=handlers, orelse=orelse, finalbody=finalbody)
     elif stmt_type == 'expr':
-        return ast.Expr(value=random_expr(max_depth - 1, in_function=in_function))
+        return ast.Expr(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
     elif stmt_type == 'import':
-        num_names = random.randint(1, 2)
-        names = [ast.alias(name=random_name(), asname=None) for _ in range(num_names)]
+        num_names = draws.randint(1, 2)
+        names = [ast.alias(name=store_name(scope), asname=None) for _ in range(num_names)]
         return ast.Import(names=names)
     elif stmt_type == 'importfrom':
-        module_name = random_name()
-        num_names = random.randint(1, 2)
-        aliases = [ast.alias(name=random_name(), asname=None) for _ in range(num_names)]
-        level = random.choice([0, 0, 1])
+        module_name = random_name() if scope is None else scope.safe_name()
+        num_names = draws.randint(1, 2)
+        aliases = [ast.alias(name=store_name(scope), asname=None) for _ in range(num_names)]
+        level = draws.choice((0, 0, 1))
         return ast.ImportFrom(module=module_name, names=aliases, level=level)
     elif stmt_type == 'global':
-        num_vars = random.randint(1, 2)
-        names = [random_name() for _ in range(num_vars)]
+        num_vars = draws.randint(1, 2)
+        if scope is None:
+            names = [random_name() for _ in range(num_vars)]
+        else:
+            # Names the scope has never touched, so no use or binding precedes the declaration.
+            names = list({scope.fresh_name(): None for _ in range(num_vars)})
+            scope.declared.update(names)
         return ast.Global(names=names)
 
     # Extended statement types
     elif stmt_type == 'delete':
-        num_targets = random.randint(1, 2)
-        targets = [ast.Name(id=random_name(), ctx=ast.Del()) for _ in range(num_targets)]
+        num_targets = draws.randint(1, 2)
+        targets = [ast.Name(id=load_name(scope), ctx=ast.Del()) for _ in range(num_targets)]
         return ast.Delete(targets=targets)
     elif stmt_type == 'assert':
-        test = random_expr(max_depth - 1, in_function=in_function)
-        msg = None if random.random() < 0.5 else random_expr(max_depth - 1, in_function=in_function)
+        test = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        msg = None if draws.random() < 0.5 else random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.Assert(test=test, msg=msg)
     elif stmt_type == 'raise':
-        exc = random_expr(max_depth - 1, in_function=in_function)
+        exc = random_expr(max_depth - 1, in_function=in_function, scope=scope)
         return ast.Raise(exc=exc, cause=None)
     elif stmt_type == 'nonlocal':
-        num_vars = random.randint(1, 2)
-        names = [random_name() for _ in range(num_vars)]
+        num_vars = draws.randint(1, 2)
+        if scope is None:
+            names = [random_name() for _ in range(num_vars)]
+        else:
+            names = list({draws.choice(scope.nonlocal_candidates()): None for _ in range(num_vars)})
+            scope.declared.update(names)
+            for name in names:
+                scope.use(name)
         return ast.Nonlocal(names=names)
     elif stmt_type == 'annassign':
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        annotation = random_expr(max_depth - 1, in_function=in_function)
-        value = random_expr(max_depth - 1, in_function=in_function) if random.random() < 0.5 else None
+        if scope is None:
+            target = ast.Name(id=random_name(), ctx=ast.Store())
+        else:
+            name = store_name(scope)
+            while name in scope.declared:
+                name = store_name(scope)
+            target = ast.Name(id=name, ctx=ast.Store())
+        annotation = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        value = random_expr(max_depth - 1, in_function=in_function, scope=scope) if draws.random() < 0.5 else None
         return ast.AnnAssign(target=target, annotation=annotation, value=value, simple=1)
     elif stmt_type == 'async_for':
-        target = ast.Name(id=random_name(), ctx=ast.Store())
-        iter_expr = random_expr(max_depth - 1, in_function=in_function)
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True) for _ in range(body_count)]
-        orelse_count = random.randint(0, 1)
-        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(orelse_count)] if orelse_count > 0 else []
+        target = ast.Name(id=store_name(scope), ctx=ast.Store())
+        iter_expr = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        body_count = draws.randint(1, 3)
+        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=True, scope=scope) for _ in range(body_count)]
+        orelse_count = draws.randint(0, 1)
+        orelse = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope) for _ in range(orelse_count)] if orelse_count > 0 else []
         return ast.AsyncFor(target=target, iter=iter_expr, body=body, orelse=orelse)
-    elif stmt_type == 'async_funcdef':
-        name = random_name()
-        args_count = random.randint(0, 3)
-        params = [ast.arg(arg=random_name(), annotation=None) for _ in range(args_count)]
-        arguments = ast.arguments(posonlyargs=[], args=params, vararg=None, kwonlyargs=[], kw_defaults=[], defaults=[], kwarg=None)
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=True, in_loop=False) for _ in range(body_count)]
-        if not body:
-            body = [ast.Pass()]
-        return ast.AsyncFunctionDef(name=name, args=arguments, body=body, decorator_list=[], returns=None)
-    elif stmt_type == 'async_with':
-        num_items = random.randint(1, 2)
-        items = []
-        for _ in range(num_items):
-            context_expr = random_expr(max_depth - 1, in_function=in_function)
-            optional_vars = ast.Name(id=random_name(), ctx=ast.Store()) if random.random() < 0.5 else None
-            items.append(ast.withitem(context_expr=context_expr, optional_vars=optional_vars))
-        body_count = random.randint(1, 3)
-        body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop) for _ in range(body_count)]
-        if not body:
-            body = [ast.Pass()]
-        return ast.AsyncWith(items=items, body=body)
     elif stmt_type == 'match':
-        subject = random_expr(max_depth - 1, in_function=in_function)
-        pat = ast.MatchValue(value=random_expr(max_depth - 1, in_function=in_function))
-        case_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop)]
+        subject = random_expr(max_depth - 1, in_function=in_function, scope=scope)
+        if scope is None:
+            pat = ast.MatchValue(value=random_expr(max_depth - 1, in_function=in_function))
+        else:
+            # Value patterns only accept literals and dotted names.
+            value = draws.randint(0, 100) if draws.random() < 0.5 else ''.join(draws.choices(string.ascii_lowercase, k=3))
+            pat = ast.MatchValue(value=ast.Constant(value=value))
+        case_body = [random_stmt(max_depth - 1, in_function=in_function, in_loop=in_loop, scope=scope)]
         case = ast.match_case(pattern=pat, guard=None, body=case_body)
         return ast.Match(subject=subject, cases=[case])
+    elif stmt_type == 'return' and scope is not None:
+        return ast.Return(value=random_expr(max_depth - 1, in_function=in_function, scope=scope))
 
-def generate_random_ast(max_depth=3):
-    """Generate a random AST for a module (ast.Module) with given max depth."""
-    num_statements = random.randint(1, 3)
-    body = [random_stmt(max_depth, in_function=False, in_loop=False) for _ in range(num_statements)]
+def generate_random_ast(max_depth=3, grammar=False):
+    """
+    Generate a random AST for a module (ast.Module) with given max depth.
+    With grammar=True every statement is generated in a module Scope, so the result compiles.
+    """
+    num_statements = draws.randint(1, 3)
+    scope = Scope() if grammar else None
+    body = [random_stmt(max_depth, in_function=False, in_loop=False, scope=scope) for _ in range(num_statements)]
     if not body:
         body = [ast.Pass()]
     module_node = ast.Module(body=body, type_ignores=[])
     ast.fix_missing_locations(module_node)
     return module_node
 
-def get_terminal_leaves(node):
+def get_terminal_leaves(node, node_class=None):
     """
-    Recursively traverse the AST to find terminal leaves.
-    Terminal leaves are nodes without children.
+    Return the terminal leaves of the AST: the nodes without child nodes, optionally only those
+    of node_class. Field values that are not nodes (names, numbers, None) are not leaves.
     """
-    leaves = []
-    if not isinstance(node, ast.AST):
-        return [node]
-    for field, value in ast.iter_fields(node):
-        if isinstance(value, list):
-            for item in value:
-                leaves.extend(get_terminal_leaves(item))
-        elif isinstance(value, ast.AST):
-            leaves.extend(get_terminal_leaves(value))
-    return leaves
+    return list(iter_leaves(node, node_class))
 
 def attach_to_random_leaf(node, max_depth):
     """
@@ -527,53 +2199,66 @@ def attach_to_random_leaf(node, max_depth):
         random_leaf = random.choice(leaves)
         attach_generated_subtree(random_leaf, max_depth)
 
-def attach_generated_subtree(input_node, max_depth=3):
+def attach_generated_subtree(input_node, max_depth=3, grammar=False):
     """
     Given an input AST node, attach a randomly generated subtree to it.
     
     This function searches for a field in the node that is a list (typically the 'body' field)
     and appends a new randomly generated statement (or statement list) to that field.
     It respects context (e.g. if the node is a FunctionDef, it generates statements accordingly).
+    With grammar=True the statement is generated in the Scope of the node's body.
     
     Raises a ValueError if no list-type field is found.
     """
     if hasattr(input_node, 'body') and isinstance(input_node.body, list):
         in_func = isinstance(input_node, ast.FunctionDef)
-        new_stmt = random_stmt(max_depth, in_function=in_func)
+        with profiler.phase('generate'):
+            if grammar:
+                scope = Scope.of(input_node) if isinstance(input_node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) else Scope()
+                new_stmt = random_stmt(max_depth, scope=scope)
+            else:
+                new_stmt = random_stmt(max_depth, in_function=in_func)
+        profiler.generated(new_stmt)
         input_node.body.append(new_stmt)
         return input_node
     for field in getattr(input_node, '_fields', []):
         field_val = getattr(input_node, field)
         if isinstance(field_val, list):
-            new_stmt = random_stmt(max_depth, in_function=False)
+            with profiler.phase('generate'):
+                new_stmt = random_stmt(max_depth, in_function=False)
+            profiler.generated(new_stmt)
             field_val.append(new_stmt)
             return input_node
     raise ValueError('Input node does not have a list attribute to attach a new subtree.')
 
 def main(index):
-    try:
-        with open(f'quine_ast_liv_{index-1}.py', 'r') as file:
-            content = file.read()
-    except FileNotFoundError:
-        content = ''
-    except IOError as e:
-        content = ''
-    source_code = content
+    # The parent generation comes from the recent-generations cache, so retries and reverts within
+    # one process read and parse each file once; spawn_child() leaves the cached tree untouched.
+    recent = get_recent_generations()
     node_name = 'evolved_function'
     node_type = ast.FunctionDef
-    new_source = mutate_function_source(source_code, node_name, node_type)
+    parent = recent.load(index - 1)
+    source_code = recent.source(index - 1)
+    tree = spawn_child(parent, node_name, node_type)
+    node = find_function_node(tree, node_name, node_type)
+    unparser = ModuleUnparser()
     new_file = f'quine_ast_liv_{index}.py'
 
     try:
-        code_object = compile(new_source, "temp_file.py", "exec")
+        if node is not None:
+            compile_evolved_function(tree, node_name, node_type, unparser.unparse_node(node))
+        new_source = unparser.unparse(tree)
     except SyntaxError as e:
-        new_source = source_code
+        new_source = source_code if source_code is not None else unparser.unparse(parent)
 
     #visualize_ast_tree(source_code, output_filename=f'ast_visualization_{index}', format='png', view=False, cleanup=True, node_name=node_name)
 
-    with open(new_file, 'w') as f:
-        f.write(new_source)
-    os.execl(sys.executable, sys.executable, new_file)
+    with profiler.phase('write'):
+        with open(new_file, 'w') as f:
+            f.write(new_source)
+    profiler.end_generation(index)
+    profiler.close()
+    os.execl(sys.executable, sys.executable, new_file, *sys.argv[1:])
 
 def evolved_function():
     """
@@ -587,20 +2272,254 @@ def evolved_function():
 
 if __name__ == '__main__':
     import sys
+    import argparse
     import traceback
-    current_file = sys.argv[0]
+    parser = argparse.ArgumentParser(description='Evolve evolved_function one generation at a time.')
+    parser.add_argument('--generations', type=int, default=None,
+                        help='run this many generations in-process instead of re-executing a new file per generation')
+    parser.add_argument('--write-files', action='store_true',
+                        help='with --generations or --supervise, also write every generation to quine_ast_liv_{index}.py')
+    parser.add_argument('--population', type=int, default=None,
+                        help='evaluate this many mutants per generation on a worker pool and keep one')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for --population or --supervise (default: all cores)')
+    parser.add_argument('--supervise', action='store_true',
+                        help='evolve in a long-lived supervisor that runs mutants on --workers warm worker '
+                             'processes, restarting any that crash, instead of re-executing a new file per '
+                             'generation; runs forever without --generations')
+    parser.add_argument('--backlog', type=int, default=1,
+                        help='with --supervise, jobs queued per worker beyond the one it runs (default %(default)s)')
+    parser.add_argument('--shared-memory', action='store_true',
+                        help='with --supervise, hand parents to the workers and take mutants back through shared '
+                             'memory (ast_liv.sharing) instead of pipes')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='mutants handed to a worker per task in --population mode')
+    parser.add_argument('--selection', default='first', choices=['first', 'random', 'smallest', 'largest'],
+                        help='how the next generation is picked among surviving mutants')
+    parser.add_argument('--sandbox', action='store_true',
+                        help='run every evolved_function in a reusable child process with the limits below')
+    parser.add_argument('--timeout', type=float, default=2.0,
+                        help='wall-clock seconds per evolved_function call in --sandbox mode')
+    parser.add_argument('--cpu-limit', type=int, default=1,
+                        help='CPU seconds per evolved_function call in --sandbox mode (RLIMIT_CPU)')
+    parser.add_argument('--memory-limit', type=int, default=512,
+                        help='MiB of extra address space per sandbox worker (RLIMIT_AS)')
+    parser.add_argument('--cache', type=int, default=None, metavar='ENTRIES',
+                        help='skip compiling and running evolved_functions already seen, remembering the '
+                             'verdicts of this many in memory (10000 when only --cache-file is given)')
+    parser.add_argument('--cache-file', default=None,
+                        help='with --cache, also persist verdicts in this shelve file')
+    parser.add_argument('--store', default=None, metavar='DIR',
+                        help='record every kept generation in a compact generation store; '
+                             'export one with python -m ast_liv.store DIR GENERATION')
+    parser.add_argument('--lineage', default=None, metavar='DB',
+                        help='with --generations or --population, record every mutant, its parent, operator, '
+                             'verdict and timings in the SQLite database DB; query it with python -m ast_liv.lineage DB')
+    parser.add_argument('--grammar', action='store_true',
+                        help='mutate with the grammar-directed generator, which tracks scope and loop nesting '
+                             'so that nearly every mutant compiles')
+    parser.add_argument('--profile', default=None, metavar='TRACE',
+                        help='time every pipeline phase, append one JSONL record per generation to TRACE '
+                             'and print p50/p95/p99 per phase at the end')
+    parser.add_argument('--mutation-sites', type=int, default=0, metavar='K',
+                        help='replace K sites sampled from a node index instead of rolling a die for every node')
+    parser.add_argument('--history-depth', type=int, default=history_depth, metavar='N',
+                        help='keep the N most recent generations parsed and compiled in memory for retries and '
+                             'reverts (default %(default)s); older ones are read back from disk')
+    parser.add_argument('--compact', action='store_true',
+                        help='with --generations or --population, keep older generations of the lineage as flat '
+                             'arrays (ast_liv.compact) instead of parsed modules, files or the store')
+    parser.add_argument('--simplify', action='store_true',
+                        help='fold constants and drop dead code, bare constants and redundant pass from every '
+                             'mutant, reporting node counts before and after')
+    parser.add_argument('--max-nodes', type=int, default=None,
+                        help='reject mutants whose evolved_function has more AST nodes than this')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='reject mutants whose evolved_function is nested deeper than this')
+    parser.add_argument('--tune-constants', type=int, default=0, metavar='BATCH',
+                        help='with --generations, spend half the mutation attempts perturbing every numeric '
+                             'constant BATCH times at once and running the variants through one compiled template')
+    parser.add_argument('--bytecode', action='store_true',
+                        help='with --generations, make half the mutation attempts by editing constants and '
+                             'operators of the compiled evolved_function directly, building its source only '
+                             'when a generation is written out')
+    parser.add_argument('--coverage', action='store_true',
+                        help='with --generations, record which statements of evolved_function run, report it per '
+                             'generation and mutate statements that did not run less often')
+    parser.add_argument('--dead-code-weight', type=float, default=dead_code_weight, metavar='W',
+                        help='with --coverage, relative chance of mutating a statement that did not run '
+                             '(default %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed the random number generator, so that a run can be reproduced')
+    parser.add_argument('--predraw', type=int, default=0, metavar='BLOCK',
+                        help='draw the random decisions of the generators BLOCK at a time ahead of use')
+    parser.add_argument('--checkpoint', default=None, metavar='FILE',
+                        help='with --generations or --population, save the state of the run to FILE every '
+                             '--checkpoint-interval generations and when it ends')
+    parser.add_argument('--checkpoint-interval', type=int, default=100, metavar='N',
+                        help='generations between checkpoints (default %(default)s)')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the run saved in --checkpoint; generations already run count towards '
+                             '--generations')
+    parser.add_argument('--islands', type=int, default=None,
+                        help='evolve this many islands as separate processes that exchange migrants')
+    parser.add_argument('--island', type=int, default=None,
+                        help='run only this island of a multi-host island model; needs --island-addresses')
+    parser.add_argument('--island-addresses', default=None, metavar='HOST:PORT,...',
+                        help='listening address of every island of a multi-host run, in island order')
+    parser.add_argument('--island-transport', default='queue', choices=['queue', 'tcp'],
+                        help='how --islands processes exchange migrants: multiprocessing queues, or TCP on '
+                             'localhost ports from --island-port up, as separate hosts would')
+    parser.add_argument('--island-port', type=int, default=7400,
+                        help='first localhost port for --island-transport tcp')
+    parser.add_argument('--migration-interval', type=int, default=10, metavar='M',
+                        help='generations between migrations in island mode')
+    parser.add_argument('--migrants', type=int, default=1,
+                        help='best generations of each epoch sent to every neighbouring island')
+    parser.add_argument('--topology', default='ring', choices=['ring', 'all', 'random'],
+                        help='which islands each island sends its migrants to')
+    args = parser.parse_args()
+    if args.cache is not None and args.cache < 1:
+        parser.error('--cache needs at least 1 entry')
+    if args.resume and args.checkpoint is None:
+        parser.error('--resume needs --checkpoint')
+    if args.checkpoint is not None and (args.islands is not None or args.island is not None
+                                        or (args.generations is None and args.population is None)):
+        parser.error('--checkpoint needs --generations or --population, without island mode')
+    if args.supervise and (args.population is not None or args.islands is not None or args.island is not None
+                           or args.checkpoint is not None or args.lineage is not None
+                           or args.cache is not None or args.cache_file is not None):
+        parser.error('--supervise cannot be combined with --population, island mode, --checkpoint, --lineage '
+                     'or --cache')
+    if args.lineage is not None and (args.islands is not None or args.island is not None
+                                     or (args.generations is None and args.population is None)):
+        parser.error('--lineage needs --generations or --population, without island mode')
+    if args.tune_constants and args.sandbox:
+        parser.error('--tune-constants runs its variants in this process and cannot be combined with --sandbox')
+    if args.shared_memory and not args.supervise:
+        parser.error('--shared-memory needs --supervise')
+    if args.compact and (args.generations is None and args.population is None or args.supervise
+                         or args.islands is not None or args.island is not None):
+        parser.error('--compact needs --generations or --population, without island mode or --supervise')
+    if args.predraw:
+        from ast_liv.draws import BlockDraws
+        set_draws(BlockDraws(args.predraw))
+    if args.seed is not None:
+        seed_random(args.seed)
+    grammar_mode = args.grammar
+    bytecode_mode = args.bytecode
+    coverage_mode = args.coverage
+    dead_code_weight = args.dead_code_weight
+    tune_batch = args.tune_constants
+    simplify_mode = args.simplify
+    max_tree_nodes = args.max_nodes
+    max_tree_depth = args.max_depth
+    history_depth = args.history_depth
+    mutation_sites = args.mutation_sites
+    if args.profile:
+        from ast_liv.profiling import Profiler
+        set_profiler(Profiler(args.profile))
+    current_file = os.path.basename(sys.argv[0])
     print('Current file:', current_file)
     if current_file.startswith('quine_ast_liv_') and current_file.endswith('.py'):
         current_index = int(current_file[14:-3])
     else:
         current_index = 0
 
+    if args.islands is not None:
+        from ast_liv.islands import run_islands
+        sandbox_options = None
+        if args.sandbox:
+            sandbox_options = dict(workers=1, timeout=args.timeout, memory_limit=args.memory_limit * 2 ** 20,
+                                   cpu_limit=args.cpu_limit)
+        heads = run_islands(sys.modules[__name__], args.islands, args.generations,
+                            interval=args.migration_interval, migrants=args.migrants, topology=args.topology,
+                            selection=args.selection, transport=args.island_transport, port=args.island_port,
+                            sandbox=sandbox_options, cache_size=args.cache, store=args.store, seed=args.seed)
+        for island, (generation, source) in sorted(heads.items()):
+            print(f'Island {island}: final generation {generation}, '
+                  f'{tree_size(find_function_node(ast.parse(source), "evolved_function", ast.FunctionDef))} nodes')
+        sys.exit(0)
+
+    sandbox = None
+    if args.sandbox:
+        from ast_liv.sandbox import Sandbox
+        sandbox = Sandbox(workers=args.workers if args.population is not None else 1, timeout=args.timeout,
+                          memory_limit=args.memory_limit * 2 ** 20, cpu_limit=args.cpu_limit)
+    cache = None
+    if args.cache is not None or args.cache_file is not None:
+        from ast_liv.cache import VerdictCache
+        cache = VerdictCache(10000 if args.cache is None else args.cache, args.cache_file)
+    store = None
+    if args.store is not None:
+        from ast_liv.store import GenerationStore
+        store = GenerationStore(args.store, host_source=base_code)
+    lineage_db = None
+    if args.lineage is not None:
+        from ast_liv.lineage import LineageDB
+        lineage_db = LineageDB(args.lineage, seed=args.seed)
+    checkpoint = resume = None
+    if args.checkpoint is not None:
+        from ast_liv.checkpoint import Checkpointer, load_checkpoint
+        checkpoint = Checkpointer(args.checkpoint, args.checkpoint_interval, args.seed)
+        if args.resume:
+            import time
+            started = time.perf_counter()
+            resume = load_checkpoint(args.checkpoint)
+            checkpoint.seed = resume.seed
+            print(f'Resuming at step {resume.counters["step"]}, generation {resume.lineage[-1]}, '
+                  f'from {args.checkpoint} (read in {time.perf_counter() - started:.3f}s)')
+    if args.population is not None or args.generations is not None or args.island is not None or args.supervise:
+        try:
+            if args.island is not None:
+                from ast_liv.islands import TCPTransport, parse_addresses, run_island
+                if args.island_addresses is None:
+                    parser.error('--island needs --island-addresses')
+                addresses = parse_addresses(args.island_addresses)
+                run_island(sys.modules[__name__], args.island, len(addresses), TCPTransport(args.island, addresses),
+                           args.generations, interval=args.migration_interval, migrants=args.migrants,
+                           topology=args.topology, selection=args.selection, sandbox=sandbox, cache=cache,
+                           store=store, seed=args.seed)
+            elif args.supervise:
+                from ast_liv.supervisor import supervise
+                supervise(sys.modules[__name__], args.generations, workers=args.workers, timeout=args.timeout,
+                          memory_limit=args.memory_limit * 2 ** 20, backlog=args.backlog, start_index=current_index,
+                          write_files=args.write_files, store=store, shared=args.shared_memory)
+            elif args.population is not None:
+                from ast_liv.population import run_population
+                run_population(sys.modules[__name__], args.generations, population_size=args.population,
+                               workers=args.workers, chunksize=args.chunksize, selection=args.selection,
+                               start_index=current_index, write_files=args.write_files, sandbox=sandbox,
+                               cache=cache, store=store, checkpoint=checkpoint, resume=resume, lineage_db=lineage_db,
+                               compact=args.compact)
+            else:
+                run_generations(args.generations, start_index=current_index, write_files=args.write_files,
+                                sandbox=sandbox, cache=cache, store=store, depth=args.history_depth,
+                                checkpoint=checkpoint, resume=resume, lineage_db=lineage_db, compact=args.compact)
+        finally:
+            if sandbox is not None:
+                sandbox.close()
+            if cache is not None:
+                cache.close()
+            if store is not None:
+                store.close()
+            if lineage_db is not None:
+                lineage_db.close()
+            if profiler.enabled:
+                profiler.close()
+                print(profiler.summary())
+        sys.exit(0)
+
+    if current_file == f'quine_ast_liv_{current_index}.py':
+        # This generation's source is already in memory; main() never has to read it back.
+        get_recent_generations().put(current_index, ast.parse(base_code), base_code)
     new_index = current_index + 1
     mutation_successful = False
     mutTry = 5
     for attempt in range(1, mutTry + 1):
         try:
-            evolved_function()
+            with profiler.phase('exec'):
+                evolved_function()
             main(new_index)
             mutation_successful = True
             break
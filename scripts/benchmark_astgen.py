@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Seeded benchmark of the random AST generator and mutators in quine_ast_liv_0.py.
+
+Measures trees/sec for generate_random_ast at several max_depth values, mutants/sec for
+mutate_ast_subtree, mutate_indexed_sites and attach_generated_subtree applied to evolved_function, the fraction of
+results that compile, their mean node count and the tracemalloc peak of each run. Every
+benchmark reseeds the RNG, so two runs of the same tree produce the same trees and only
+the timings differ.
+
+Throughput on a shared or throttled machine drifts between runs, so every run also times a
+fixed calibration workload (deep-copying evolved_function) interleaved with the benchmarks, and
+the compare mode scales the baseline's throughput by the change in calibration speed.
+
+Usage:
+    python scripts/benchmark_astgen.py --output bench.json
+    python scripts/benchmark_astgen.py --compare bench.json      # exit code 1 on regressions
+"""
+import argparse
+import ast
+import copy
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# Which direction is better for each metric; metrics not listed are reported but never flagged.
+HIGHER_IS_BETTER = {'per_sec': True, 'valid_fraction': True, 'peak_kib': False}
+CALIBRATION = 'calibration'
+
+
+def load_quine(project_root):
+    sys.path.insert(0, project_root)
+    import quine_ast_liv_0
+    return quine_ast_liv_0
+
+
+def node_count(tree):
+    return sum(1 for _ in ast.walk(tree))
+
+
+def compiles(tree):
+    try:
+        compile(ast.fix_missing_locations(tree), '<benchmark>', 'exec')
+    except Exception:
+        return False
+    return True
+
+
+def as_module(node):
+    return node if isinstance(node, ast.Module) else ast.Module(body=[node], type_ignores=[])
+
+
+def time_cases(cases, count, seed, repeat, reseed=random.seed):
+    """
+    Return the best wall time of count calls for every case. Repetitions are interleaved across
+    cases, so a slow patch on a noisy machine hits every benchmark instead of one.
+    """
+    best = {}
+    for _ in range(repeat):
+        for name, make in cases.items():
+            gc.collect()
+            reseed(seed)
+            start = time.perf_counter()
+            for _ in range(count):
+                try:
+                    make()
+                except Exception:
+                    pass
+            elapsed = time.perf_counter() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return best
+
+
+def measure_case(make, count, seed, seconds, reseed=random.seed):
+    """
+    Build count results once more under tracemalloc and return the metrics of the case: throughput
+    from the timed runs, the valid fraction, the mean node count and the peak traced memory.
+    """
+    reseed(seed)
+    trees = []
+    tracemalloc.start()
+    for _ in range(count):
+        try:
+            trees.append(make())
+        except Exception:
+            trees.append(None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    built = [tree for tree in trees if tree is not None]
+    return {
+        'count': count,
+        'seconds': seconds,
+        'per_sec': count / seconds if seconds else 0.0,
+        'valid_fraction': sum(1 for tree in built if compiles(as_module(tree))) / count,
+        'mean_nodes': sum(node_count(tree) for tree in built) / len(built) if built else 0.0,
+        'peak_kib': peak / 1024,
+    }
+
+
+def mutate_indexed(quine, parent, grammar, sites=3):
+    node = copy.deepcopy(parent)
+    quine.mutate_indexed_sites(node, sites=sites, max_depth=2, grammar=grammar)
+    return node
+
+
+def run_benchmarks(quine, depths, count, seed, repeat, grammar):
+    parent = quine.find_function_node(ast.parse(quine.base_code), 'evolved_function', ast.FunctionDef)
+    quine.get_identifier_pool()
+    cases = {}
+    for depth in depths:
+        cases[f'generate_depth_{depth}'] = lambda depth=depth: quine.generate_random_ast(max_depth=depth, grammar=grammar)
+    cases['mutate_ast_subtree'] = lambda: quine.mutate_ast_subtree(copy.deepcopy(parent), max_depth=2,
+                                                                   mutation_prob=0.5, grammar=grammar)
+    cases['mutate_indexed_sites'] = lambda: mutate_indexed(quine, parent, grammar)
+    cases['attach_generated_subtree'] = lambda: quine.attach_generated_subtree(copy.deepcopy(parent), max_depth=4,
+                                                                               grammar=grammar)
+    cases[CALIBRATION] = lambda: copy.deepcopy(parent)
+    seconds = time_cases(cases, count, seed, repeat, quine.seed_random)
+    del cases[CALIBRATION]
+    results = {name: measure_case(make, count, seed, seconds[name], quine.seed_random) for name, make in cases.items()}
+    return results, count / seconds[CALIBRATION]
+
+
+def compare(baseline, current, tolerance):
+    """
+    Return (lines, regressions): a report of every metric that moved by more than tolerance
+    (a fraction) and the number of those that moved in the wrong direction.
+    """
+    lines = []
+    regressions = 0
+    scale = 1.0
+    if baseline['meta'].get('calibration_per_sec') and current['meta'].get('calibration_per_sec'):
+        scale = current['meta']['calibration_per_sec'] / baseline['meta']['calibration_per_sec']
+        lines.append(f'machine speed relative to baseline: {scale:.2f}x (baseline throughput scaled to match)')
+    for name, metrics in current['results'].items():
+        old_metrics = baseline['results'].get(name)
+        if old_metrics is None:
+            lines.append(f'{name}: not in baseline')
+            continue
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if metric in ('count', 'seconds') or not old:
+                continue
+            if metric == 'per_sec':
+                old *= scale
+            change = (value - old) / abs(old)
+            if abs(change) <= tolerance:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                worse = change < 0 if HIGHER_IS_BETTER[metric] else change > 0
+                label = 'REGRESSION' if worse else 'improved'
+                regressions += worse
+            else:
+                label = 'changed'
+            lines.append(f'{name}.{metric}: {old:.4g} -> {value:.4g} ({change:+.1%}) {label}')
+    return lines, regressions
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(script_dir)
+
+    parser = argparse.ArgumentParser(description='Benchmark the AST generator and mutators.')
+    parser.add_argument('--depths', default='1,2,3,4,5', help='comma-separated max_depth values for generate_random_ast')
+    parser.add_argument('--count', type=int, default=200, help='trees or mutants per benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='timed repetitions; the fastest is kept')
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('--grammar', action='store_true', help='benchmark the grammar-directed generator')
+    parser.add_argument('--predraw', type=int, default=0, metavar='BLOCK',
+                        help='draw the generators\' random decisions BLOCK at a time (ast_liv.draws)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against a results file written by --output')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='relative change below which a metric is not reported (default 0.15)')
+    args = parser.parse_args()
+
+    quine = load_quine(project_root)
+    if args.predraw:
+        from ast_liv.draws import BlockDraws
+        quine.set_draws(BlockDraws(args.predraw))
+    depths = [int(depth) for depth in args.depths.split(',')]
+    results, calibration_per_sec = run_benchmarks(quine, depths, args.count, args.seed, args.repeat, args.grammar)
+    current = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'seed': args.seed,
+            'count': args.count,
+            'repeat': args.repeat,
+            'grammar': args.grammar,
+            'predraw': args.predraw,
+            'calibration_per_sec': calibration_per_sec,
+        },
+        'results': results,
+    }
+
+    print(f'{"benchmark":<26} {"per sec":>10} {"valid":>7} {"nodes":>8} {"peak KiB":>10}')
+    for name, r in current['results'].items():
+        print(f'{name:<26} {r["per_sec"]:>10.1f} {r["valid_fraction"]:>7.1%} {r["mean_nodes"]:>8.1f} {r["peak_kib"]:>10.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'Wrote results to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('seed') != args.seed or baseline['meta'].get('grammar') != args.grammar:
+            print('Warning: baseline was run with a different seed or generator mode', file=sys.stderr)
+        lines, regressions = compare(baseline, current, args.tolerance)
+        print('\n'.join(lines) if lines else f'No metric moved by more than {args.tolerance:.0%}.')
+        if regressions:
+            print(f'{regressions} regression(s) against {args.compare}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Check that the grammar-directed generator of quine_ast_liv_0.py (--grammar) only produces code
+that compiles.
+
+Modules are generated with generate_random_ast(depth, grammar=True) from a few thousand seeds
+at each depth. Then the quine's own evolved_function is mutated in grammar mode, as many times
+by each mutator: mutate_ast_subtree, mutate_indexed_sites and attach_generated_subtree. As in
+a run, each mutant is the child of the one before, in lineages of LINEAGE_LENGTH generations
+that start over from the original function. Every result is unparsed and compiled, as mutants
+are evaluated. The check fails, with exit status 1, if any does not compile; it prints what the
+compiler said about the first few and their seeds.
+
+Usage:
+    python scripts/check_grammar.py [--seeds N] [--depths 3 4 5 6]
+"""
+import argparse
+import ast
+import copy
+import os
+import sys
+import warnings
+
+# generations of a lineage before the mutators start over from the original evolved_function
+LINEAGE_LENGTH = 50
+
+
+def load_quine(project_root):
+    sys.path.insert(0, project_root)
+    import quine_ast_liv_0
+    return quine_ast_liv_0
+
+
+def compile_error(tree):
+    """Return the error compiling the source of tree raises, or None if it compiles."""
+    try:
+        compile(ast.unparse(ast.fix_missing_locations(tree)), '<grammar>', 'exec')
+    except (SyntaxError, ValueError, TypeError) as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+
+def mutators(quine):
+    """The grammar-mode mutations spawn_child() can make, each applied to a function definition."""
+    return {
+        'mutate_ast_subtree': lambda node: quine.mutate_ast_subtree(node, max_depth=2, mutation_prob=0.5,
+                                                                     grammar=True),
+        'mutate_indexed_sites': lambda node: quine.mutate_indexed_sites(node, sites=3, max_depth=2, grammar=True),
+        'attach_generated_subtree': lambda node: quine.attach_generated_subtree(node, max_depth=4, grammar=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile code from the grammar-directed generator.')
+    parser.add_argument('--seeds', type=int, default=3000, help='seeds per depth and per mutator (default: 3000)')
+    parser.add_argument('--depths', type=int, nargs='+', default=[3, 4, 5, 6],
+                        help='depths of the generated modules (default: 3 4 5 6)')
+    args = parser.parse_args()
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    quine = load_quine(project_root)
+    # constant conditions and the like only draw SyntaxWarnings
+    warnings.simplefilter('ignore')
+    failures = []
+    for depth in args.depths:
+        for seed in range(args.seeds):
+            quine.seed_random(seed)
+            error = compile_error(quine.generate_random_ast(depth, grammar=True))
+            if error is not None:
+                failures.append(f'generate_random_ast({depth}, grammar=True) after seed_random({seed}): {error}')
+    host = ast.parse(quine.base_code)
+    quine.set_base_code(host)
+    # a top-level def compiles the same alone, and copying it alone is much quicker
+    function_node = quine.find_function_node(host, 'evolved_function', ast.FunctionDef)
+    for name, mutate in mutators(quine).items():
+        for seed in range(args.seeds):
+            if seed % LINEAGE_LENGTH == 0:
+                parent = function_node
+            quine.seed_random(seed)
+            node = copy.deepcopy(parent)
+            mutate(node)
+            error = compile_error(ast.Module(body=[node], type_ignores=[]))
+            if error is not None:
+                failures.append(f'{name} after seed_random({seed}), {seed % LINEAGE_LENGTH} generations '
+                                f'into a lineage from seed {seed - seed % LINEAGE_LENGTH}: {error}')
+            else:
+                parent = node
+    for failure in failures[:20]:
+        print(f'Error: {failure}', file=sys.stderr)
+    if failures:
+        print(f'{len(failures)} generated trees do not compile.', file=sys.stderr)
+        sys.exit(1)
+    print(f'All {args.seeds * (len(args.depths) + 3)} generated trees compile.')
+
+
+if __name__ == '__main__':
+    main()
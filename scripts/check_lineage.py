@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Check that runs sharing one lineage database (ast_liv.lineage) keep to their own rows.
+
+Two LineageDB connections write interleaved runs into one temporary database, as two
+processes given the same --lineage file would. Then one run is resumed from a checkpoint
+taken halfway through, as --resume does. The check fails, with exit status 1, if ids
+collide, if the resume drops any row of the other run, or if it keeps a row of its own
+run written after the checkpoint.
+
+Usage:
+    python scripts/check_lineage.py
+"""
+import ast
+import os
+import sys
+import tempfile
+
+
+def load_lineage(project_root):
+    sys.path.insert(0, project_root)
+    from ast_liv import lineage
+    from ast_liv.evaluation import Verdict
+    return lineage, Verdict
+
+
+def add_generations(db, parent, first, count, verdict, function_node):
+    """Add count kept generations after parent, each with a failed sibling, and return the last id."""
+    for generation in range(first, first + count):
+        db.add(generation, parent, 1, function_node, verdict._replace(status='exception'))
+        parent = db.add(generation, parent, 0, function_node, verdict, kept=True)
+        db.end_generation()
+    db.flush()
+    return parent
+
+
+def rows_of(db, run):
+    return {row[0] for row in db.connection.execute('SELECT id FROM mutants WHERE run = ?', (run,))}
+
+
+def main():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    lineage, Verdict = load_lineage(project_root)
+    function_node = ast.parse('def evolved_function():\n    return 1 + 2').body[0]
+    verdict = Verdict('ok', None, '', 0.001)
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'lineage.db')
+        first = lineage.LineageDB(path, batch=4)
+        second = lineage.LineageDB(path, batch=4)
+        run = first.start_run()
+        other = second.start_run()
+        root = first.add(0, function_node=function_node, verdict=verdict, kept=True)
+        other_root = second.add(0, function_node=function_node, verdict=verdict, kept=True)
+        head = add_generations(first, root, 1, 5, verdict, function_node)
+        # the checkpoint of run: its newest row and its lineage
+        checkpoint = first.last_id
+        other_head = add_generations(second, other_root, 1, 5, verdict, function_node)
+        add_generations(first, head, 6, 5, verdict, function_node)
+        add_generations(second, other_head, 6, 5, verdict, function_node)
+        kept_before = rows_of(first, run)
+        other_rows = rows_of(first, other)
+        first.close()
+        if kept_before & other_rows:
+            failures.append(f'runs {run} and {other} share ids {sorted(kept_before & other_rows)}')
+
+        resumed = lineage.LineageDB(path, batch=4)
+        parent_ids = resumed.resume_run(run, checkpoint, list(range(6)))
+        if parent_ids[-1] != head:
+            failures.append(f'resume found generation 5 at id {parent_ids[-1]}, not {head}')
+        expected = {id for id in kept_before if id <= checkpoint}
+        if rows_of(resumed, run) != expected:
+            failures.append(f'resumed run {run} kept {sorted(rows_of(resumed, run) - expected)} '
+                            f'and lost {sorted(expected - rows_of(resumed, run))}')
+        if rows_of(resumed, other) != other_rows:
+            failures.append(f'resuming run {run} removed rows {sorted(other_rows - rows_of(resumed, other))} '
+                            f'of run {other}')
+        orphans = resumed.connection.execute(
+            'SELECT COUNT(*) FROM node_types WHERE mutant NOT IN (SELECT id FROM mutants)').fetchone()[0]
+        if orphans:
+            failures.append(f'{orphans} node_types rows of dropped mutants are left')
+        # both runs go on writing; neither may hand out an id the other holds
+        add_generations(resumed, parent_ids[-1], 6, 5, verdict, function_node)
+        add_generations(second, other_head, 11, 5, verdict, function_node)
+        resumed.close()
+        second.close()
+    for failure in failures:
+        print(f'Error: {failure}', file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print('Runs sharing a lineage database keep to their own rows.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Script to generate projects/astgen.py, the random AST generator of quine_ast_liv_0.py as a
+small library module for the in-browser code generator (js/code-generator.js).
+
+Importing the quine itself reads its own file, and the first random_name() then parses all
+of it to count identifiers, which is slow under Pyodide. The generated module holds the
+quine's generator definitions copied verbatim, together with the identifier counts of the
+quine worked out here once, so importing it does no file I/O and draws no name until asked.
+It only imports ast, keyword, random and string.
+
+Regenerate it whenever the generator in the quine changes, and check that it is current with:
+
+    python scripts/generate_astgen_module.py --check
+"""
+import argparse
+import ast
+import builtins
+import dis
+import importlib.util
+import os
+import random
+import sys
+import types
+
+# Top-level definitions and assignments of the quine that make up the generator, copied in
+# the order the quine has them.
+GENERATOR_NAMES = {
+    'count_identifiers_from_code', 'IdentifierPool', '_identifier_pool', 'weighted_names',
+    'NullProfiler', 'profiler', 'RandomDraws', 'draws', 'set_draws', 'seed_random', 'set_base_code',
+    'get_identifier_pool', 'random_name', 'Scope', 'EXPR_TYPES', 'EXPR_TYPES_IN_FUNCTION', 'STMT_TYPES',
+    'SIMPLE_STMT_TYPES', '_SCOPE_EXPR_TYPES', '_SCOPE_STMT_TYPES', 'BINARY_OPERATORS', 'BOOLEAN_OPERATORS',
+    'UNARY_OPERATORS', 'COMPARISON_OPERATORS', 'NAME_CHARACTERS', 'CONSTANT_KINDS',
+    '_FUNCTION_HAS_TYPE_PARAMS', '_FUNCTION_HAS_TYPE_COMMENT', '_CLASS_HAS_TYPE_PARAMS', '_WITH_HAS_TYPE_COMMENT',
+    'load_name', 'store_name', 'maybe_starred', 'random_expr', 'random_stmt', 'generate_random_ast', 'iter_nodes',
+}
+
+HEADER = '''"""
+The random AST generator of quine_ast_liv_0.py, without the quine.
+
+Generated by scripts/generate_astgen_module.py from quine_ast_liv_0.py; do not edit. Importing
+it reads no files: identifiers are drawn from IDENTIFIER_COUNTS, counted from the quine when
+this file was generated, exactly as the quine draws them from its own source.
+
+    import ast, astgen
+    print(ast.unparse(astgen.generate_random_ast(3)))
+"""
+import ast
+import keyword
+import random
+import string'''
+
+
+def load_quine(project_root):
+    sys.path.insert(0, project_root)
+    import quine_ast_liv_0
+    return quine_ast_liv_0
+
+
+def defined_names(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name}
+    if isinstance(node, ast.Assign):
+        return {target.id for target in node.targets if isinstance(target, ast.Name)}
+    return set()
+
+
+def extract_definitions(source):
+    """Return the source text of the generator's top-level nodes, each with the comment lines right above it."""
+    lines = source.splitlines()
+    segments = []
+    for node in ast.parse(source).body:
+        if not defined_names(node) & GENERATOR_NAMES:
+            continue
+        start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])]) - 1
+        while start > 0 and lines[start - 1].startswith('#'):
+            start -= 1
+        segments.append('\n'.join(lines[start:node.end_lineno]))
+    return segments
+
+
+def format_counts(counts, width=100):
+    """Format {name: count} as a dict literal wrapped at width, in the order counted."""
+    lines = ['IDENTIFIER_COUNTS = {']
+    line = '   '
+    for name, count in counts.items():
+        item = f' {name!r}: {count},'
+        if len(line) + len(item) > width:
+            lines.append(line)
+            line = '   '
+        line += item
+    lines.append(line)
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def unresolved_globals(source):
+    """Return global names the module's code loads but neither defines nor gets from builtins."""
+    module_code = compile(source, 'astgen.py', 'exec')
+    defined = set(dir(builtins))
+    for node in ast.parse(source).body:
+        defined |= defined_names(node)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            defined |= {alias.asname or alias.name for alias in node.names}
+    missing = set()
+    stack = [module_code]
+    while stack:
+        code = stack.pop()
+        stack.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        for instruction in dis.get_instructions(code):
+            if instruction.opname in ('LOAD_GLOBAL', 'LOAD_NAME') and instruction.argval not in defined:
+                missing.add(instruction.argval)
+    return missing
+
+
+def build(quine):
+    with open(quine.__file__) as f:
+        source = f.read()
+    parts = [HEADER] + extract_definitions(source)
+    parts.append(format_counts(quine.count_identifiers_from_code(source)))
+    parts.append('base_code = IDENTIFIER_COUNTS')
+    module_source = '\n\n\n'.join(parts) + '\n'
+    missing = unresolved_globals(module_source)
+    if missing:
+        raise SystemExit(f'Error: the generator uses names that are not copied: {", ".join(sorted(missing))}')
+    return module_source
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location('astgen', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def same_trees(quine, module, seeds=50, depth=3):
+    """Return the first (seed, grammar) for which the module generates a different tree than the quine, or None."""
+    for seed in range(seeds):
+        for grammar in (False, True):
+            trees = []
+            for generator in (quine, module):
+                generator.seed_random(seed)
+                trees.append(ast.dump(generator.generate_random_ast(depth, grammar=grammar)))
+            if trees[0] != trees[1]:
+                return seed, grammar
+    return None
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(script_dir)
+    out_path = os.path.join(project_root, 'projects', 'astgen.py')
+
+    parser = argparse.ArgumentParser(description='Generate projects/astgen.py from quine_ast_liv_0.py.')
+    parser.add_argument('--check', action='store_true',
+                        help='do not write; exit with status 1 if projects/astgen.py is out of date')
+    args = parser.parse_args()
+
+    quine = load_quine(project_root)
+    module_source = build(quine)
+    if args.check:
+        try:
+            with open(out_path) as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current != module_source:
+            print(f'{out_path} is out of date; run scripts/generate_astgen_module.py', file=sys.stderr)
+            sys.exit(1)
+    else:
+        with open(out_path, 'w') as f:
+            f.write(module_source)
+        print(f'Wrote {out_path} ({len(module_source)} bytes)')
+
+    state = random.getstate()
+    mismatch = same_trees(quine, load_module(out_path))
+    random.setstate(state)
+    if mismatch is not None:
+        print(f'Error: seed {mismatch[0]} (grammar={mismatch[1]}) generates a different tree than the quine',
+              file=sys.stderr)
+        sys.exit(1)
+    print('Generated trees match the quine.')
+
+
+if __name__ == '__main__':
+    main()